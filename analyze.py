@@ -1,8 +1,14 @@
 import os
 import sys
 import csv
+import numpy as np
 from collections import defaultdict
 
+PREDICT_ITEMS = ["best_atk_spd", "weak", "resist", "special_eff", "slow_eff", "occurrence", "avg"]
+GAME_ITEMS = ["score_pred", "score_game"]
+N_BOOT = 2000  # bootstrap重采样次数
+TOP_GAMES = 10  # 输出差异最大的局数
+
 def analyze_score_csv(record_dir):
     score_path = os.path.join(record_dir, 'score.csv')
     if not os.path.exists(score_path):
@@ -66,6 +72,82 @@ def compare_predict_scores_csv(csv1, csv2):
                 out.append(f"{'':>12}")
         print(' | '.join(out))
 
+def load_runs(dirs):
+    """
+    一次性读取多个目录的分数, 得到 (items, game_ids, values), values形状为(运行数, 局数, 项数)
+    目录都有predict_scores.csv时按预测分比较: 每局为3轮之和, 局为各目录出现过的局的并集, 缺轮的局记0分并计入平均, 保证各运行的局相同
+    否则按score.csv比较, 只保留所有目录都完成的局
+    """
+    if all(os.path.exists(os.path.join(d, "predict_scores.csv")) for d in dirs):
+        tables = []
+        for d in dirs:
+            arr = np.loadtxt(os.path.join(d, "predict_scores.csv"), delimiter=",", skiprows=1, ndmin=2)
+            tables.append(arr)
+        # 局的范围取所有目录中出现过的game_id的并集, 没有任何目录评测过的局不计入
+        game_ids = np.unique(np.concatenate([t[:, 0].astype(int) for t in tables]))
+        values = np.zeros((len(dirs), len(game_ids), 3, len(PREDICT_ITEMS)))
+        present = np.zeros((len(dirs), len(game_ids), 3), dtype=bool)
+        for r, t in enumerate(tables):
+            gid = np.searchsorted(game_ids, t[:, 0].astype(int))
+            rid = t[:, 1].astype(int) - 1
+            values[r, gid, rid] = t[:, 2:]
+            present[r, gid, rid] = True
+        values = np.where(present.all(axis=-1)[..., None], values.sum(axis=2), 0.0)
+        return PREDICT_ITEMS, game_ids, values
+    runs = []
+    for d in dirs:
+        path = os.path.join(d, "score.csv")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{d} 中没有predict_scores.csv或score.csv")
+        # score.csv中可能有空值(未完成的局)
+        arr = np.genfromtxt(path, delimiter=",", skip_header=1, ndmin=2)
+        arr = arr[~np.isnan(arr).any(axis=1)]
+        runs.append({int(row[0]): row[1:] for row in arr})
+    common = sorted(set.intersection(*(set(run) for run in runs)))
+    dropped = len(set.union(*(set(run) for run in runs))) - len(common)
+    if dropped:
+        print(f"注: {dropped} 局不是所有目录都完成, 已忽略")
+    values = np.array([[run[g] for g in common] for run in runs]).reshape(len(dirs), len(common), len(GAME_ITEMS))
+    return GAME_ITEMS, np.array(common, dtype=int), values
+
+def compare_runs(dirs, n_boot=N_BOOT, top_games=TOP_GAMES, seed=0):
+    # 多个运行目录的对比: 排行榜, 与第一名的配对bootstrap置信区间, 差异最大的局
+    items, game_ids, values = load_runs(dirs)
+    n_runs, n_games, _ = values.shape
+    key = len(items) - 1 if items is PREDICT_ITEMS else 1  # 排序依据: avg / score_game
+    means = values.mean(axis=1)
+    order = np.argsort(-means[:, key], kind="stable")
+    name_width = max(len(d) for d in dirs + ["run"]) + 2
+
+    print(f"排行榜 ({n_games} 局, 每局分数的平均值):")
+    print(f"{'rank':>4}  " + "run".ljust(name_width) + "".join(f"{item:>13}" for item in items))
+    for rank, r in enumerate(order, start=1):
+        print(f"{rank:>4}  " + dirs[r].ljust(name_width) + "".join(f"{v:>13.2f}" for v in means[r]))
+    print()
+
+    # 配对bootstrap: 所有运行使用同一组重采样的局, 一次算出全部运行的均值
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n_games, size=(n_boot, n_games))
+    scores = values[:, :, key]
+    boot = scores[:, idx].mean(axis=-1)  # (运行数, n_boot)
+    best = order[0]
+    print(f"与第一名 {dirs[best]} 的差值 ({items[key]}, 95% 配对bootstrap置信区间, {n_boot} 次):")
+    for r in order[1:]:
+        diff = boot[r] - boot[best]
+        lo, hi = np.percentile(diff, [2.5, 97.5])
+        mark = "*" if hi < 0 else " "
+        print(f"  {dirs[r].ljust(name_width)} {means[r, key] - means[best, key]:>9.2f}  [{lo:>8.2f}, {hi:>8.2f}] {mark}")
+    print("注: * 表示置信区间不包含0\n")
+
+    if n_runs > 1:
+        spread = scores.max(axis=0) - scores.min(axis=0)
+        top = np.argsort(-spread, kind="stable")[:top_games]
+        print(f"差异最大的 {len(top)} 局 ({items[key]}):")
+        print(f"{'game_id':>7} {'spread':>8}  " + "".join(f"{'#' + str(rank):>9}" for rank in range(1, n_runs + 1)))
+        for g in top:
+            print(f"{game_ids[g]:>7} {spread[g]:>8.2f}  " + "".join(f"{scores[r, g]:>9.2f}" for r in order))
+        print("注: 列按排行榜顺序排列")
+
 def analyze_predict_scores(score_csv_path):
     # 读取分数
     scores = defaultdict(lambda: {k: [0.0, 0.0, 0.0] for k in [
@@ -131,5 +213,7 @@ if __name__ == "__main__":
             compare_predict_scores_csv(csv1, csv2)
         else:
             print('predict_scores.csv not found in one of the directories.')
+    elif len(sys.argv) >= 3 and sys.argv[1] == "--matrix":
+        compare_runs(sys.argv[2:])
     else:
-        print("用法: python analyze.py <record_dir> 或 python analyze.py --cmp <dir_new> <dir_old>")
+        print("用法: python analyze.py <record_dir> 或 python analyze.py --cmp <dir_new> <dir_old> 或 python analyze.py --matrix <dir1> <dir2> ...")
@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import argparse
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+import geometry_cache
+from finetune import prompt
+from prediction_cache import PredictionCache, CachedPredictor
+from strategy import StrategyConfig
+from game_recorder import GameRecorder
+from game_session import GameSession
+from predictor import Predictor, DummyPredictor, LLMPredictor
+
+SERVER_URL = "http://117.186.102.78:32500/"
+DEBUG = False
+GAME_TIMEOUT = 600  # 单局超时(秒), 与client_r.py一致
+END_GRACE = 10  # game_over(或断开)之后等待end消息的时间(秒)
+
+class AsyncClient:
+    # 在一个进程内并发进行多局游戏
+    # 每局使用独立的socket.io连接和GameSession, predictor和几何缓存在所有对局间共享
+    def __init__(self, team_id, predictor: Predictor, record_dir, server_url=SERVER_URL, concurrency=4, debug=DEBUG, log_latency=False, strategy_config: StrategyConfig | None = None,
+                 timeout=GAME_TIMEOUT):
+        self.team_id = team_id
+        self.predictor = predictor
+        self.record_dir = record_dir
+        self.server_url = server_url
+        self.concurrency = concurrency
+        self.debug = debug
+        self.log_latency = log_latency
+        self.strategy_config = strategy_config
+        self.timeout = timeout
+        # 决策和推理都是同步代码, 放到线程池里执行, 避免阻塞其他对局的网络收发
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def play(self, game_id) -> dict | None:
+        # 进行一局游戏, 返回服务器end消息的内容; 出错时返回None
+        async with self.semaphore:
+            recorder = GameRecorder(game_id, self.record_dir)
+            try:
+                return await asyncio.wait_for(self._play(game_id, recorder), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"[game {game_id}] Timeout after {self.timeout}s")
+                recorder.write(f"[CLIENT] Timeout after {self.timeout}s", debug=self.debug)
+                return None
+            except Exception as e:
+                print(f"[game {game_id}] Exception occurred: {e}")
+                traceback.print_exc()
+                return None
+            finally:
+                recorder.close()
+
+    async def _play(self, game_id, recorder: GameRecorder):
+        loop = asyncio.get_running_loop()
+        session = GameSession(game_id, self.predictor, recorder, action_mode='auto', record_dir=self.record_dir, debug=self.debug, log_latency=self.log_latency, strategy_config=self.strategy_config)
+        queue: asyncio.Queue[tuple[str, dict, float]] = asyncio.Queue()
+        sio = socketio.AsyncClient(
+            reconnection=True,
+            reconnection_attempts=None,
+            reconnection_delay=1,
+            reconnection_delay_max=5
+        )
+
+        @sio.event
+        async def connect():
+            recorder.write("[CLIENT] Connected to server", debug=True)
+            await sio.emit("begin", {"team_id": self.team_id, "game_id": game_id})
+
+        @sio.event
+        async def disconnect(reason='server disconnected'):
+            session.on_disconnect(str(reason))
+
+        @sio.on("response")
+        async def on_response(data):
+            t_recv = time.perf_counter()
+            if "error" in data:
+                print(f"[game {game_id}] Error:", data["error"])
+                return
+            queue.put_nowait(("response", data, t_recv))
+
+        @sio.on("end")
+        async def on_end(data):
+            queue.put_nowait(("end", data, time.perf_counter()))
+
+        while True:
+            try:
+                await sio.connect(self.server_url)
+                break
+            except socketio.exceptions.ConnectionError:
+                recorder.write("Connection failed. Retrying...", debug=True)
+                await asyncio.sleep(3)
+
+        try:
+            # 按到达顺序处理每条消息; game_over之后END_GRACE秒内没有收到end则放弃这一局
+            idle = 0.0
+            while True:
+                try:
+                    kind, data, t_recv = await asyncio.wait_for(queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    idle = idle + 1.0 if session.game_over else 0.0
+                    if idle >= END_GRACE:
+                        print(f"[game {game_id}] No end message {END_GRACE}s after game over")
+                        return None
+                    continue
+                idle = 0.0
+                if kind == "end":
+                    session.on_end(data)
+                    return data
+                t_start = time.perf_counter()
+                action = await loop.run_in_executor(self.executor, session.on_response, data)
+                t_decided = time.perf_counter()
+                if action is not None:
+                    await sio.emit("action", action)
+                    session.after_emit()
+                session.record_latency(t_recv, t_start, t_decided, time.perf_counter(), action)
+        finally:
+            await sio.disconnect()
+
+    async def run(self, game_ids: list[int]) -> dict[int, dict | None]:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.play(gid) for gid in game_ids))
+        elapsed = time.perf_counter() - start
+        n_ok = sum(1 for r in results if r is not None)
+        print(f"Finished {n_ok}/{len(game_ids)} games in {elapsed:.1f}s")
+        return dict(zip(game_ids, results))
+
+def parse_game_ids(spec: str) -> list[int]:
+    # "10-99,150,160-169" -> [10, ..., 99, 150, 160, ..., 169]
+    game_ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            game_ids.extend(range(int(lo), int(hi) + 1))
+        else:
+            game_ids.append(int(part))
+    return game_ids
+
+def make_record_dir(record_dir=None):
+    # 和client_r.py相同: 创建record目录和带表头的score.csv
+    if record_dir is None:
+        record_dir = f"record_{datetime.now().strftime('%m%d_%H%M')}"
+    os.makedirs(record_dir, exist_ok=True)
+    score_csv_path = os.path.join(record_dir, 'score.csv')
+    if not os.path.exists(score_csv_path):
+        with open(score_csv_path, 'w', encoding='utf-8') as f:
+            f.write('game_id,score_pred,score_game\n')
+    return record_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--team_id", default=None, type=str)
+    parser.add_argument("--game_ids", default="10-199", type=str, help="例如 10-99,100-199")
+    parser.add_argument("--concurrency", default=4, type=int, help="同时进行的对局数")
+    parser.add_argument("--timeout", default=GAME_TIMEOUT, type=float, help="单局超时时间(秒)")
+    parser.add_argument("--server_url", default=SERVER_URL, type=str)
+    parser.add_argument("--record_dir", default=None, type=str, help="默认新建record_<日期>")
+    parser.add_argument("--label_dir", default=None, type=str, help="标准答案文件夹, 指定则用DummyPredictor")
+    parser.add_argument("--geometry_cache", default=geometry_cache.CACHE_DIR, type=str, help="地图几何缓存目录, 设为空字符串则只在内存中缓存")
+    parser.add_argument("--log_latency", action="store_true", help="在record中记录每条消息和各代码段的处理耗时, 用profiler.py summary汇总")
+    parser.add_argument("--num_candidates", default=1, type=int, help="LLMPredictor每轮并发采样的候选数")
+    parser.add_argument("--prediction_cache", default=None, type=str, help="预测结果缓存文件(sqlite), 不指定则不缓存")
+    parser.add_argument("--cache_model", default=None, type=str, help="缓存使用的模型名; 指定后缓存全部命中时不需要启动LLM服务")
+    parser.add_argument("--prompt_layout", default=prompt.PROMPT_LAYOUT, choices=prompt.PROMPT_LAYOUTS, help="prompt格式, 需与模型训练时一致")
+    parser.add_argument("--strategy_config", default=None, type=str, help="Strategy参数的json文件(如search.py输出的best_config.json), 不指定则用strategy.py中的默认值")
+    args = parser.parse_args()
+
+    team_id = args.team_id or open("team_id").readlines()[0].strip()
+    geometry_cache.CACHE_DIR = args.geometry_cache or None
+    prompt.PROMPT_LAYOUT = args.prompt_layout
+    if args.label_dir:
+        predictor = DummyPredictor(answer_dir=args.label_dir)
+        print("Using answer labels")
+    else:
+        def make_predictor():
+            return LLMPredictor(
+                extra_args={"enable_thinking": True},
+                num_candidates=args.num_candidates
+            )
+        if args.prediction_cache:
+            predictor = CachedPredictor(PredictionCache(args.prediction_cache), make_predictor,
+                                        model_name=args.cache_model, params={"enable_thinking": True, "num_candidates": args.num_candidates, "use_n": True})
+        else:
+            predictor = make_predictor()
+    record_dir = make_record_dir(args.record_dir)
+    client = AsyncClient(team_id, predictor, record_dir, server_url=args.server_url, concurrency=args.concurrency, log_latency=args.log_latency, timeout=args.timeout,
+                         strategy_config=StrategyConfig.load(args.strategy_config) if args.strategy_config else None)
+    asyncio.run(client.run(parse_game_ids(args.game_ids)))
+    if isinstance(predictor, CachedPredictor):
+        print(predictor.cache.stats())
+
+# e.g. python async_client.py --game_ids 10-199 --concurrency 8
@@ -0,0 +1,368 @@
+import sys
+import time
+import argparse
+import itertools
+from dataclasses import replace
+import numpy as np
+
+import simulator
+import geometry_cache
+from game_info import GameInfo, EnemyInfo, TowerInfo
+from strategy import Strategy, Geometry, ShopPlanner, StrategyConfig, TowerTable, SEG_DIST, CONTRIB_DECIMALS
+
+# 批量模拟商店回合, 用于评估StrategyConfig中的参数; 多组参数的搜索见search.py
+# 一个Scenario包含一批回合的全部随机输入(地图, 可选塔, 敌人, 金币, 每一步的商店), 所有参数共用同一个Scenario以减小比较的方差
+# 同一地图的回合按步同时推进: 棋盘状态为(回合数, 路径点数)的数组, 每一步对所有回合批量计算商店物品的伤害
+# 决策逻辑与Strategy.get_action一致, 低金币阶段的DP仍用ShopPlanner逐回合计算; 伤害与Strategy一样舍入到CONTRIB_DECIMALS位,
+# 购买记录与Strategy完全相同, 用--check检查
+# 评分: geometry 用Strategy的伤害模型(参考常量取StrategyConfig的默认值)计算最终棋盘的总伤害
+#       sim      用simulator.simulate_round的时间步模拟, 结果为造成伤害占敌人总血量的百分比
+
+TUNABLE = ["pre_refresh", "expect_threshold", "sp_eff_rate", "num_dense", "dp_start_coins", "dp_exact", "dp_sample_num"]
+# 随机搜索的取值范围, int的上界包含在内
+SEARCH_SPACE = {
+    "pre_refresh": (int, 0, 8),
+    "expect_threshold": (float, 0.0, 0.8),
+    "sp_eff_rate": (float, 1.0, 2.5),
+    "num_dense": (int, 2, 10),
+    "dp_start_coins": (int, 0, 120),
+}
+N_DAMAGES = simulator.DAMAGE_RANGE[1] - simulator.DAMAGE_RANGE[0] + 1
+
+def make_game_info(game_map, options):
+    game_info = GameInfo()
+    game_info.set_map(game_map)
+    game_info.set_placement_options(options)
+    return game_info
+
+class Scenario:
+    def __init__(self, n_rounds=1000, n_maps=20, seed=0, label_dir=None, map_dir=None):
+        rng = np.random.default_rng(seed)
+        if map_dir:
+            maps = simulator.load_maps(map_dir)[:n_maps]
+        else:
+            maps = [simulator.random_map(rng) for _ in range(n_maps)]
+        self.maps = maps
+        self.geometries = [Geometry(make_game_info(m, o)) for m, o in maps]
+        self.map_idx = rng.integers(len(maps), size=n_rounds)
+
+        # 每回合的可选塔为tower_stats.csv的下标: (回合数, TOWERS_PER_ROUND)
+        stats = simulator.load_tower_stats()
+        self.table = TowerTable.from_payloads(stats)
+        n_types = simulator.TOWERS_PER_ROUND
+        self.picks = np.array([rng.choice(len(stats), n_types, replace=False) for _ in range(n_rounds)])
+        self.towers = [[stats[i] for i in row] for row in self.picks]
+        self.tower_range = self.table.range[self.picks]
+
+        # 敌人从enemy_data.json中抽取, 策略直接使用真实标签
+        entries = simulator.load_enemy_data()
+        labels = simulator.load_labels(label_dir) if label_dir else None
+        self.enemies, self.labels = [], []
+        for _ in range(n_rounds):
+            gid, j = int(rng.integers(len(entries))), int(rng.integers(3))
+            enemy = entries[gid]["labels"][j]
+            idx = gid * 3 + j
+            self.enemies.append(enemy)
+            self.labels.append(labels[idx] if labels is not None and idx < len(labels) else simulator.derive_label(enemy))
+        keys = ("best_atk_spd", "weak", "resist", "special_eff", "slow_eff", "occurrence")
+        self.enemy_infos = [EnemyInfo("", **{k: label.get(k) for k in keys}) for label in self.labels]
+
+        # 每一步的商店, 步数不超过初始金币(每个动作至少花1个金币)
+        self.coins = rng.integers(*simulator.ROUND_COINS, endpoint=True, size=n_rounds)
+        self.n_steps = int(self.coins.max())
+        shape = (n_rounds, self.n_steps, simulator.SHOP_SIZE)
+        types, damages, costs = simulator.draw_items(rng, n_types, shape)
+        self.store_type = types.astype(np.int16)
+        self.store_damage = damages.astype(np.int16)
+        self.store_cost = costs.astype(np.int16)
+
+    def __len__(self):
+        return len(self.coins)
+
+    def tower_params(self, config: StrategyConfig, rounds):
+        # 每回合按各自的敌人查TowerTable: 返回每单位伤害的atk系数, 减速系数, 是否特效, 形状(回合数, 塔数)
+        shape = (len(rounds), self.picks.shape[1])
+        f, slow, special = np.zeros(shape), np.zeros(shape), np.zeros(shape, dtype=bool)
+        for k, g in enumerate(rounds):
+            p = self.table.for_enemy(self.enemy_infos[g], config.num_dense)
+            f[k], slow[k], special[k] = p.atk_factor[self.picks[g]], p.slow_rate[self.picks[g]], p.is_special_eff[self.picks[g]]
+        return f, slow, special
+
+def coverage_masks(geo: Geometry, ranges):
+    # masks[r] = (放置点数, 路径点数)的覆盖矩阵
+    return {int(r): geo.range_table.get_mask(int(r)).astype(np.float64) for r in np.unique(ranges)}
+
+def linear_gain(D, S, SP, slow, special, sp_rate):
+    # 在当前棋盘上放一座塔的每个路径点增量 = atk * a + b, 形状(回合数, 塔数, 路径点数)
+    smin = np.minimum(slow[:, :, None], S[:, None, :])
+    a = np.where(special[:, :, None] | SP[:, None, :], sp_rate, 1.0) / smin
+    old = D / S * np.where(SP, sp_rate, 1.0)
+    return a, D[:, None, :] * a - old[:, None, :]
+
+def dp_action(planner: ShopPlanner, coins, items, shop):
+    # 同Strategy.dp_expected_score_action, 返回要买的物品下标, 刷新时为-1
+    planner.set_items(items)
+    best_score, best_idx = -float("inf"), -1
+    for idx, (score, price) in enumerate(shop):
+        if price <= coins:
+            total = score + planner.value(coins - price)
+            if total > best_score:
+                best_score, best_idx = total, idx
+    if coins > 1 and planner.value(coins - 1) > best_score:
+        return -1
+    return best_idx
+
+def play_map(scn: Scenario, m, rounds, config: StrategyConfig):
+    # 同一地图上的回合按步同时推进, 返回每回合的购买记录(放置点, 塔下标, 伤害)
+    geo = scn.geometries[m]
+    masks = coverage_masks(geo, scn.tower_range[rounds])
+    stacked = {r: mask.astype(bool) for r, mask in masks.items()}
+    B, N, P = len(rounds), len(geo.points), len(geo.range_table.placement_options)
+    T = scn.tower_range.shape[1]
+    sp_rate = config.sp_eff_rate
+    f, slow, special = scn.tower_params(config, rounds)
+    tower_range = scn.tower_range[rounds]
+
+    D = np.zeros((B, N))
+    S = np.ones((B, N))
+    SP = np.zeros((B, N), dtype=bool)
+    coins = scn.coins[rounds].astype(np.int64)
+    refresh_times = np.zeros(B, dtype=np.int64)
+    chosen = np.zeros(B, dtype=np.int64)
+    occupied = np.zeros((B, P), dtype=bool)
+    history = np.full((B, scn.n_steps), -np.inf)  # 每步的max_edamage, 对应Strategy.edamages
+    # 出现过的商店物品(塔下标, 伤害, 价格), 按出现顺序排列, 对应Strategy.history_towers
+    n_seen = np.zeros(B, dtype=np.int64)
+    seen = np.zeros((3, B, scn.n_steps * scn.store_type.shape[2]), dtype=np.int64)
+    buys = [[] for _ in range(B)]
+    planner = ShopPlanner(config.dp_shop_size, None if config.dp_exact else config.dp_sample_num, config.dp_seed)
+    d_min = simulator.DAMAGE_RANGE[0]
+
+    for step in range(scn.n_steps):
+        idx = np.flatnonzero(coins > 0)
+        if len(idx) == 0:
+            break
+        b = len(idx)
+        # 每种塔在每个放置点的伤害 = atk * A + C
+        a, c = linear_gain(D[idx], S[idx], SP[idx], slow[idx], special[idx], sp_rate)
+        A = np.zeros((b, T, P))
+        C = np.zeros((b, T, P))
+        for r, mask in masks.items():
+            sel = tower_range[idx] == r
+            A[sel] = a[sel] @ mask.T
+            C[sel] = c[sel] @ mask.T
+        A *= SEG_DIST
+        C *= SEG_DIST
+
+        rows = rounds[idx]
+        types = scn.store_type[rows, step].astype(np.int64)
+        damages = scn.store_damage[rows, step].astype(np.int64)
+        costs = scn.store_cost[rows, step].astype(np.int64)
+        ar = np.arange(b)[:, None]
+        atk = damages * f[idx][ar, types]
+        vals = np.round(atk[:, :, None] * A[ar, types] + C[ar, types], CONTRIB_DECIMALS)
+        vals = np.where(occupied[idx][:, None, :], 0.0, vals)
+        best_p = vals.argmax(axis=2)
+        best_v = vals.max(axis=2, initial=0.0)
+        cols = n_seen[idx, None] + np.arange(types.shape[1])
+        seen[:, idx[:, None], cols] = types, damages, costs
+        n_seen[idx] += types.shape[1]
+
+        # 贪心部分, 同Strategy.get_action
+        cand = np.where((costs <= coins[idx, None]) & (best_v > 0), best_v, 0.0)
+        max_id = np.where(cand.max(axis=1) > 0, cand.argmax(axis=1), -1)
+        max_ed = cand.max(axis=1)
+        history[idx, step] = max_ed
+        early = (max_id == -1) | (refresh_times[idx] < config.pre_refresh)
+        use_dp = ~early & (coins[idx] < config.dp_start_coins)
+        greedy = ~early & ~use_dp
+        reject = greedy & (max_ed < history[idx].max(axis=1) * config.expect_threshold)
+        rej = idx[reject]
+        history[rej, history[rej].argmax(axis=1)] = -np.inf
+        buy = np.where(greedy & ~reject, max_id, -1)
+
+        for j in np.flatnonzero(use_dp):
+            g = idx[j]
+            # 历史物品在当前棋盘上的最优伤害, 按出现顺序稳定排序后去掉最高的chosen个(同Strategy.plan_dp_action)
+            hist_t, hist_d, prices = seen[:, g, :n_seen[g]]
+            kinds, inverse = np.unique(hist_t * N_DAMAGES + hist_d - d_min, return_inverse=True)
+            t_idx, d_idx = np.divmod(kinds, N_DAMAGES)
+            item_vals = np.round((d_idx + d_min)[:, None] * f[g, t_idx][:, None] * A[j, t_idx] + C[j, t_idx], CONTRIB_DECIMALS)
+            values = np.where(occupied[g], 0.0, item_vals).max(axis=1, initial=0.0)[inverse]
+            order = np.argsort(-values, kind="stable")[chosen[g]:]
+            if len(order) == 0 or coins[g] < prices[order].min():
+                continue
+            items = list(zip(values[order].tolist(), prices[order].tolist()))
+            buy[j] = dp_action(planner, int(coins[g]), items, list(zip(best_v[j].tolist(), costs[j].tolist())))
+
+        bought = buy >= 0
+        refreshing = idx[~bought]
+        coins[refreshing] -= 1
+        refresh_times[refreshing] += 1
+        for j in np.flatnonzero(bought):
+            g, i = idx[j], buy[j]
+            p, t = int(best_p[j, i]), int(types[j, i])
+            cov = stacked[int(tower_range[g, t])][p]
+            D[g, cov] += atk[j, i]
+            S[g, cov] = np.minimum(S[g, cov], slow[g, t])
+            if special[g, t]:
+                SP[g, cov] = True
+            occupied[g, p] = True
+            coins[g] -= costs[j, i]
+            chosen[g] += 1
+            buys[g].append((p, t, int(damages[j, i])))
+    return buys
+
+def geometry_score(scn: Scenario, m, rounds, buys) -> np.ndarray:
+    # 用参考常量重新计算最终棋盘的总伤害
+    ref = StrategyConfig()
+    geo = scn.geometries[m]
+    f, slow, special = scn.tower_params(ref, rounds)
+    masks = coverage_masks(geo, scn.tower_range[rounds])
+    scores = np.zeros(len(rounds))
+    for k, g in enumerate(rounds):
+        D = np.zeros(len(geo.points))
+        S = np.ones(len(geo.points))
+        SP = np.zeros(len(geo.points), dtype=bool)
+        for p, t, dmg in buys[k]:
+            cov = masks[int(scn.tower_range[g, t])][p] > 0
+            D[cov] += dmg * f[k, t]
+            S[cov] = np.minimum(S[cov], slow[k, t])
+            SP |= cov & special[k, t]
+        scores[k] = float((D / S * np.where(SP, ref.sp_eff_rate, 1.0)).sum()) * SEG_DIST
+    return scores
+
+def sim_score(scn: Scenario, m, rounds, buys) -> np.ndarray:
+    game_map, options = scn.maps[m]
+    scores = np.zeros(len(rounds))
+    for k, g in enumerate(rounds):
+        placed = [None] * len(options)
+        for p, t, dmg in buys[k]:
+            placed[p] = {**scn.towers[g][t], "damage": dmg}
+        outcome = simulator.simulate_round(game_map, options, placed, scn.enemies[g], scn.labels[g])
+        scores[k] = 100.0 * outcome["damage"] / outcome["total_hp"] if outcome["total_hp"] else 0.0
+    return scores
+
+def evaluate(scn: Scenario, config: StrategyConfig, score="geometry", n_rounds=None) -> np.ndarray:
+    # 返回每回合的得分, 顺序同Scenario中的回合; 指定n_rounds时只评估前n_rounds个回合
+    n_rounds = len(scn) if n_rounds is None else min(n_rounds, len(scn))
+    scores = np.zeros(n_rounds)
+    for m in range(len(scn.maps)):
+        rounds = np.flatnonzero(scn.map_idx[:n_rounds] == m)
+        if len(rounds) == 0:
+            continue
+        buys = play_map(scn, m, rounds, config)
+        scores[rounds] = (sim_score if score == "sim" else geometry_score)(scn, m, rounds, buys)
+    return scores
+
+def strategy_buys(scn: Scenario, g, config: StrategyConfig) -> list[tuple]:
+    # 用真实的Strategy.get_action逐步玩第g个回合, 返回与play_map相同格式的购买记录
+    game_info = make_game_info(*scn.maps[scn.map_idx[g]])
+    for tower in scn.towers[g]:
+        game_info.add_tower(TowerInfo.from_payload(tower))
+    game_info.set_coins(int(scn.coins[g]))
+    strategy = Strategy(game_info, config)
+    buys = []
+    for step in range(scn.n_steps):
+        if game_info.coins <= 0:
+            break
+        game_info.update_store([{"type": int(t), "damage": int(d), "cost": int(c)}
+                                  for t, d, c in zip(scn.store_type[g, step], scn.store_damage[g, step], scn.store_cost[g, step])])
+        action = strategy.get_action(scn.enemy_infos[g], game_info)
+        if action == "refresh":
+            game_info.coins -= 1
+            continue
+        _, i, p = action.split()
+        item, p = game_info.store[int(i)], int(p)
+        game_info.placed_towers[p] = game_info.towers[item["type"]].placed(item, p)
+        game_info.coins -= item["cost"]
+        buys.append((p, item["type"], item["damage"]))
+    return buys
+
+def check_strategy(scn: Scenario, config: StrategyConfig, n_rounds=None) -> int:
+    # 对比play_map与Strategy在前n_rounds个回合上的购买记录, 打印不一致的回合, 返回不一致的回合数
+    # dp_exact=False时DP随机采样, 两边的随机数序列不同, 只检查dp_exact=True的配置
+    if not config.dp_exact:
+        raise ValueError("check_strategy needs dp_exact=True")
+    n_rounds = len(scn) if n_rounds is None else min(n_rounds, len(scn))
+    mismatch = 0
+    for m in range(len(scn.maps)):
+        rounds = np.flatnonzero(scn.map_idx[:n_rounds] == m)
+        if len(rounds) == 0:
+            continue
+        for g, buys in zip(rounds, play_map(scn, m, rounds, config)):
+            ref = strategy_buys(scn, g, config)
+            if ref != buys:
+                mismatch += 1
+                k = next((k for k, (a, b) in enumerate(zip(ref, buys)) if a != b), min(len(ref), len(buys)))
+                print(f"round {g} differs at buy {k}: strategy {ref[k:k + 2]}, batch_sim {buys[k:k + 2]}")
+    print(f"checked {n_rounds} rounds against Strategy: {mismatch} mismatch")
+    return mismatch
+
+def parse_overrides(specs: list[str]) -> dict:
+    # ["pre_refresh=2", "expect_threshold=0.4"] -> {"pre_refresh": 2, "expect_threshold": 0.4}
+    return {name: values[0] for name, values in parse_axes(specs)}
+
+def parse_axes(specs: list[str]) -> list[tuple[str, list]]:
+    # ["pre_refresh=0,3,6"] -> [("pre_refresh", [0, 3, 6])], 类型与StrategyConfig的默认值一致
+    default = StrategyConfig()
+    axes = []
+    for spec in specs:
+        name, values = spec.split("=")
+        if name not in TUNABLE:
+            raise ValueError(f"unknown parameter {name}, choose from {TUNABLE}")
+        cast = type(getattr(default, name))
+        axes.append((name, [cast(v) if cast is not bool else v.lower() in ("1", "true") for v in values.split(",")]))
+    return axes
+
+def grid_params(specs: list[str]) -> list[dict]:
+    # 笛卡尔积
+    axes = parse_axes(specs)
+    return [dict(zip([name for name, _ in axes], combo)) for combo in itertools.product(*[values for _, values in axes])]
+
+def sample_params(rng: np.random.Generator, n) -> list[dict]:
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, (cast, low, high) in SEARCH_SPACE.items():
+            config[name] = int(rng.integers(low, high, endpoint=True)) if cast is int else round(float(rng.uniform(low, high)), 3)
+        configs.append(config)
+    return configs
+
+def scenario_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--n_rounds", default=1000, type=int)
+    parser.add_argument("--n_maps", default=20, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--label_dir", default=None, type=str, help="标准答案文件夹, 提供enemy_data.json中没有的标签")
+    parser.add_argument("--map_dir", default=None, type=str, help="从record目录读取真实地图, 不指定则随机生成")
+    parser.add_argument("--score", default="geometry", choices=["geometry", "sim"])
+
+def scenario_kwargs(args) -> dict:
+    return {"n_rounds": args.n_rounds, "n_maps": args.n_maps, "seed": args.seed, "label_dir": args.label_dir, "map_dir": args.map_dir}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    scenario_arguments(parser)
+    parser.add_argument("--config", default=None, type=str, help="Strategy参数的json文件, 不指定则用默认值")
+    parser.add_argument("--set", nargs="*", default=[], help="覆盖单个参数, 例如 pre_refresh=2 expect_threshold=0.4")
+    parser.add_argument("--check", action="store_true", help="与Strategy.get_action逐回合对比购买记录, 有不一致时返回非0")
+    args = parser.parse_args()
+
+    geometry_cache.CACHE_DIR = None
+    t0 = time.perf_counter()
+    scn = Scenario(**scenario_kwargs(args))
+    print(f"scenario: {len(scn)} rounds on {len(scn.maps)} maps in {time.perf_counter() - t0:.1f}s")
+    config = replace(StrategyConfig.load(args.config) if args.config else StrategyConfig(), **parse_overrides(args.set))
+    if args.check:
+        sys.exit(1 if check_strategy(scn, config) else 0)
+    for name, cfg in [("default", StrategyConfig()), ("config", config)]:
+        if name == "config" and cfg == StrategyConfig():
+            break
+        t0 = time.perf_counter()
+        scores = evaluate(scn, cfg, args.score)
+        print(f"{name:>8}: mean {scores.mean():.2f} (stderr {scores.std(ddof=1) / np.sqrt(len(scores)):.2f}) in {time.perf_counter() - t0:.1f}s")
+
+# e.g. python batch_sim.py --n_rounds 2000 --set pre_refresh=0 expect_threshold=0.5
+#      python batch_sim.py --config best_config.json --score sim
+#      python batch_sim.py --n_rounds 200 --seed 5 --check   (与Strategy的一致性检查, 改动策略或本文件后运行)
+#      多组参数的搜索: python search.py
@@ -0,0 +1,398 @@
+import os
+import re
+import ast
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import numpy as np
+import tempfile
+
+import geometry_cache
+from game_info import GameInfo, TowerInfo
+from game_recorder import GameRecorder
+from game_session import GameSession
+from strategy import RangeCoverageTable, Geometry, ShopPlanner, SEG_DIST, SP_EFF_RATE, DP_SAMPLE_NUM, DP_SHOP_SIZE, read_tower_stats
+
+MAP_PATTERN = re.compile(r"^Map: (\[.*\])$")
+OPTIONS_PATTERN = re.compile(r"^Placement Options: (\[.*\])$")
+
+# --- 旧版实现, 仅作为基准对照 ---
+class Point:
+    def __init__(self, x: float, y: float):
+        self.x = x
+        self.y = y
+        self.slow_rate = 1.0
+        self.has_special_eff = False
+        self.total_damage = 0.0
+
+class LegacyRangeCoverageTable:
+    def __init__(self, placement_options, points: list[Point], max_radius=20):
+        self.placement_options = placement_options
+        self.max_radius = max_radius
+        self.contribs = [{} for _ in range(len(placement_options))]
+        for idx, pos in enumerate(placement_options):
+            px, py = pos
+            for r in range(0, max_radius + 1):
+                r2 = r * r
+                indices = [i for i, pt in enumerate(points) if (pt.x - px) ** 2 + (pt.y - py) ** 2 <= r2]
+                self.contribs[idx][r] = indices
+
+    def get_coverage(self, pos_idx, radius):
+        r = int(radius)
+        return self.contribs[pos_idx].get(r, [])
+
+class LegacyBoard:
+    # 每个路径点一个Point对象的棋盘状态
+    def __init__(self, xy: np.ndarray, range_table: LegacyRangeCoverageTable):
+        self.points = [Point(float(x), float(y)) for x, y in xy]
+        self.range_table = range_table
+
+    def sum_contribution_in_circle(self, pos_idx, radius, atk: float, slow_rate: float, is_special_eff: bool):
+        total_delta = 0.0
+        for i in self.range_table.get_coverage(pos_idx, radius):
+            pt = self.points[i]
+            old_dmg = pt.total_damage / pt.slow_rate * (SP_EFF_RATE if pt.has_special_eff else 1.0)
+            new_dmg = (pt.total_damage + atk) / min(slow_rate, pt.slow_rate)
+            new_dmg *= SP_EFF_RATE if (is_special_eff or pt.has_special_eff) else 1.0
+            total_delta += new_dmg - old_dmg
+        return total_delta * SEG_DIST
+
+    def update_board(self, pos_idx, atk, range, slow_rate, is_special_eff):
+        for i in self.range_table.get_coverage(pos_idx, range):
+            pt = self.points[i]
+            pt.total_damage += atk
+            pt.slow_rate = min(pt.slow_rate, slow_rate)
+            if is_special_eff:
+                pt.has_special_eff = True
+
+def legacy_dp_action(coins, items: list[tuple], shop, num_sample=DP_SAMPLE_NUM):
+    # 旧版Strategy.dp_expected_score_action: 每次调用重新采样, memo不保留
+    min_price = min([c for _, c in items], default=9999)
+    memo = {}
+    def dp(c):
+        if c < min_price:
+            return 0
+        if c in memo:
+            return memo[c]
+        sample_maxes = []
+        for _ in range(num_sample):
+            sampled_shop = random.sample(items, DP_SHOP_SIZE)
+            local_max = 0
+            for score, price in sampled_shop:
+                if price <= c:
+                    total = score + dp(c - price)
+                    if total > local_max:
+                        local_max = total
+            if c > 1:
+                total = dp(c - 1)
+                if total > local_max:
+                    local_max = total
+            sample_maxes.append(local_max)
+        avg_score = sum(sample_maxes) / num_sample if sample_maxes else 0
+        memo[c] = avg_score
+        return avg_score
+    best_score = -float('inf')
+    best_idx = -1
+    for idx, (score, price) in enumerate(shop):
+        if price <= coins:
+            total = score + dp(coins - price)
+            if total > best_score:
+                best_score = total
+                best_idx = idx
+    if coins > 1:
+        total = dp(coins - 1)
+        if total > best_score:
+            return 'refresh', -1, total
+    return ('buy ', best_idx, best_score) if best_idx != -1 else ('refresh', -1, best_score)
+
+class LegacyTowerInfo:
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+def legacy_buy(game_info: GameInfo, item_idx, bag_idx):
+    # 旧版GameSession的购买: 访问器deepcopy物品和塔, 再原地修改
+    item = copy.deepcopy(game_info.store[item_idx])
+    tower = copy.deepcopy(game_info.towers[item.get('type', 0)])
+    for k, v in item.items():
+        if k != 'type':
+            tower.attributes[k] = v
+    tower.attributes["position"] = bag_idx
+    game_info.set_placed_tower_item(bag_idx, tower)
+    return {"type": "buy", "item_idx": item_idx, "bag_idx": bag_idx}
+
+def legacy_after_emit(game_info: GameInfo, recorder: GameRecorder):
+    # 旧版每个动作后都把整个棋盘序列化两次(文本和事件)
+    recorder.write(json.dumps([None if tower is None else tower.attributes for tower in game_info.placed_towers]))
+    recorder.event("placed_towers", towers=[None if tower is None else tower.attributes for tower in game_info.placed_towers])
+
+def planner_dp_action(planner: ShopPlanner, coins, items: list[tuple], shop):
+    planner.set_items(items)
+    best_score = -float('inf')
+    best_idx = -1
+    for idx, (score, price) in enumerate(shop):
+        if price <= coins:
+            total = score + planner.value(coins - price)
+            if total > best_score:
+                best_score = total
+                best_idx = idx
+    if coins > 1 and planner.value(coins - 1) > best_score:
+        return 'refresh', -1, planner.value(coins - 1)
+    return ('buy ', best_idx, best_score) if best_idx != -1 else ('refresh', -1, best_score)
+
+def action_value(planner: ShopPlanner, coins, shop, action):
+    # 用精确的values评价某个决策的期望得分
+    if action[0] == 'refresh':
+        return planner.value(coins - 1) if coins > 1 else 0.0
+    score, price = shop[action[1]]
+    return score + planner.value(coins - price)
+
+def random_tower(rng: np.random.Generator):
+    # (atk, range, slow_rate, is_special_eff)
+    return (float(rng.uniform(5, 200)), int(rng.integers(1, 21)),
+            float(rng.choice([1.0, 0.9, 0.8, 0.75, 0.5])), bool(rng.random() < 0.2))
+
+def load_record_maps(record_dir, limit=None):
+    # 从record_*目录的.record文件中提取(map, placement_options)
+    maps = []
+    for fname in sorted(os.listdir(record_dir)):
+        if not fname.endswith(".record"):
+            continue
+        game_map = None
+        with open(os.path.join(record_dir, fname), encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                m = MAP_PATTERN.match(line)
+                if m:
+                    game_map = ast.literal_eval(m.group(1))
+                    continue
+                m = OPTIONS_PATTERN.match(line)
+                if m and game_map is not None:
+                    maps.append((game_map, ast.literal_eval(m.group(1))))
+                    game_map = None
+        if limit is not None and len(maps) >= limit:
+            return maps[:limit]
+    return maps
+
+def random_map(rng: np.random.Generator, n_turns=8, n_options=24, size=20):
+    # 没有record时使用的随机折线地图
+    game_map = [[0, int(rng.integers(0, size))]]
+    for k in range(1, n_turns + 1):
+        x = round(k * size / n_turns)
+        game_map.append([x, int(rng.integers(0, size))])
+    options = [[int(rng.integers(0, size)), int(rng.integers(0, size))] for _ in range(n_options)]
+    return game_map, options
+
+def get_maps(args):
+    if args.record_dir:
+        maps = load_record_maps(args.record_dir, limit=args.n_maps)
+        if not maps:
+            print(f"No map found in {args.record_dir}")
+            sys.exit(1)
+        return maps
+    rng = np.random.default_rng(args.seed)
+    return [random_map(rng) for _ in range(args.n_maps)]
+
+def make_game_info(game_map, options):
+    game_info = GameInfo()
+    game_info.set_map(game_map)
+    game_info.set_placement_options(options)
+    return game_info
+
+def bench_coverage(args):
+    maps = get_maps(args)
+    t_old = t_new = 0.0
+    mismatch = 0
+    for game_map, options in maps:
+        points = Geometry(make_game_info(game_map, options)).points
+        legacy_points = [Point(float(x), float(y)) for x, y in points]
+        t0 = time.perf_counter()
+        old = LegacyRangeCoverageTable(options, legacy_points)
+        t1 = time.perf_counter()
+        new = RangeCoverageTable(options, points)
+        t2 = time.perf_counter()
+        t_old += t1 - t0
+        t_new += t2 - t1
+        for idx in range(len(options)):
+            for r in range(old.max_radius + 1):
+                if sorted(old.get_coverage(idx, r)) != sorted(new.get_coverage(idx, r).tolist()):
+                    mismatch += 1
+    n = len(maps)
+    print(f"maps: {n}, mismatched (pos, radius) pairs: {mismatch}")
+    print(f"legacy: {t_old / n * 1000:.2f} ms/map")
+    print(f"numpy : {t_new / n * 1000:.2f} ms/map")
+    print(f"speedup: {t_old / max(t_new, 1e-12):.1f}x")
+
+def bench_board(args):
+    # 模拟一轮: 每次对所有空位评估n_items个塔, 再买下最优的一个
+    maps = get_maps(args)
+    rng = np.random.default_rng(args.seed)
+    t_old = t_new = t_batch = 0.0
+    max_err = 0.0
+    for game_map, options in maps:
+        new = Geometry(make_game_info(game_map, options))
+        old = LegacyBoard(new.points, LegacyRangeCoverageTable(options, [Point(float(x), float(y)) for x, y in new.points]))
+        for _ in range(min(args.n_buys, len(options))):
+            towers = [random_tower(rng) for _ in range(args.n_items)]
+            for board in (old, new):
+                t0 = time.perf_counter()
+                res = [[board.sum_contribution_in_circle(idx, rg, atk, slow, sp) for idx in range(len(options))]
+                       for atk, rg, slow, sp in towers]
+                if board is old:
+                    t_old += time.perf_counter() - t0
+                    res_old = res
+                else:
+                    t_new += time.perf_counter() - t0
+                    res_new = res
+            t0 = time.perf_counter()
+            res_batch = new.batch_contribution(*zip(*towers))
+            t_batch += time.perf_counter() - t0
+            res_old, res_new = np.array(res_old), np.array(res_new)
+            for res in (res_new, res_batch):
+                max_err = max(max_err, float(np.max(np.abs(res_old - res) / np.maximum(np.abs(res_old), 1.0))))
+            item, pos_idx = np.unravel_index(np.argmax(res_new), res_new.shape)
+            atk, rg, slow, sp = towers[item]
+            old.update_board(pos_idx, atk, rg, slow, sp)
+            new.update_board(pos_idx, atk, rg, slow, sp)
+    print(f"maps: {len(maps)}, max relative error: {max_err:.2e}")
+    print(f"legacy: {t_old * 1000:.1f} ms")
+    print(f"numpy : {t_new * 1000:.1f} ms")
+    print(f"batch : {t_batch * 1000:.1f} ms")
+    print(f"speedup: {t_old / max(t_new, 1e-12):.1f}x (numpy), {t_old / max(t_batch, 1e-12):.1f}x (batch)")
+
+def bench_dp(args):
+    # 随机生成历史物品和当前商店, 比较旧采样DP与精确DP的耗时和regret
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    t_old = t_exact = t_sample = 0.0
+    regret_old = regret_sample = 0.0
+    n_diff = 0
+    for _ in range(args.n_cases):
+        n_items = int(rng.integers(DP_SHOP_SIZE * 4, DP_SHOP_SIZE * 15))
+        items = [(float(rng.exponential(100)), int(rng.integers(2, 21))) for _ in range(n_items)]
+        shop = [items[i] for i in rng.choice(n_items, DP_SHOP_SIZE, replace=False)]
+        coins = int(rng.integers(10, 60))
+        exact = ShopPlanner()
+        sampler = ShopPlanner(num_sample=DP_SAMPLE_NUM, seed=args.seed)
+        t0 = time.perf_counter()
+        act_old = legacy_dp_action(coins, items, shop)
+        t1 = time.perf_counter()
+        act_exact = planner_dp_action(exact, coins, items, shop)
+        t2 = time.perf_counter()
+        act_sample = planner_dp_action(sampler, coins, items, shop)
+        t3 = time.perf_counter()
+        t_old += t1 - t0
+        t_exact += t2 - t1
+        t_sample += t3 - t2
+        best = action_value(exact, coins, shop, act_exact)
+        regret_old += best - action_value(exact, coins, shop, act_old)
+        regret_sample += best - action_value(exact, coins, shop, act_sample)
+        n_diff += act_old[:2] != act_exact[:2]
+    n = args.n_cases
+    print(f"cases: {n}, legacy decision differs from exact: {n_diff}")
+    print(f"legacy : {t_old / n * 1000:.1f} ms/decision, mean regret {regret_old / n:.3f}")
+    print(f"sampler: {t_sample / n * 1000:.1f} ms/decision, mean regret {regret_sample / n:.3f}")
+    print(f"exact  : {t_exact / n * 1000:.2f} ms/decision")
+
+def bench_geometry(args):
+    # 比较Geometry冷启动 / 读取.npz / 命中内存缓存三种情况的耗时
+    maps = get_maps(args)
+    t_cold = t_disk = t_memory = 0.0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        geometry_cache.CACHE_DIR = cache_dir
+        for game_map, options in maps:
+            geometry_cache.clear_memory()
+            for path in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, path))
+            t0 = time.perf_counter()
+            Geometry(make_game_info(game_map, options))
+            t1 = time.perf_counter()
+            geometry_cache.clear_memory()
+            Geometry(make_game_info(game_map, options))
+            t2 = time.perf_counter()
+            Geometry(make_game_info(game_map, options))
+            t3 = time.perf_counter()
+            t_cold += t1 - t0
+            t_disk += t2 - t1
+            t_memory += t3 - t2
+    n = len(maps)
+    print(f"maps: {n}")
+    print(f"cold  : {t_cold / n * 1000:.2f} ms/map")
+    print(f"disk  : {t_disk / n * 1000:.2f} ms/map")
+    print(f"memory: {t_memory / n * 1000:.3f} ms/map")
+
+def bench_session(args):
+    # 每个地图一回合: 在随机空位上买n_buys次, 每次购买前刷新一次; 比较每个动作从解析命令到写完记录的耗时
+    maps = get_maps(args)
+    rng = np.random.default_rng(args.seed)
+    stats = read_tower_stats()
+    t_old = {"buy": 0.0, "refresh": 0.0}
+    t_new = {"buy": 0.0, "refresh": 0.0}
+    n_buys = mismatch = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = GameRecorder("legacy", tmp)
+        session = GameSession(0, None, GameRecorder("current", tmp))
+        for game_map, options in maps:
+            towers = [dict(stats[i]) for i in rng.choice(len(stats), 12, replace=False)]
+            old_info = make_game_info(game_map, options)
+            new_info = session.game_info = make_game_info(game_map, options)
+            old_info.towers = [LegacyTowerInfo(dict(t)) for t in towers]
+            new_info.towers = [TowerInfo.from_payload(t) for t in towers]
+            for pos in rng.permutation(len(options))[:args.n_buys]:
+                store = [{"type": int(rng.integers(12)), "damage": int(rng.integers(1, 31)), "cost": int(rng.integers(2, 21))}
+                         for _ in range(args.n_items)]
+                old_info.update_store(store)
+                new_info.update_store(store)
+                item_idx, pos = int(rng.integers(args.n_items)), int(pos)
+
+                t0 = time.perf_counter()
+                legacy_after_emit(old_info, recorder)
+                t1 = time.perf_counter()
+                session.parse_command("refresh", {})
+                session.after_emit()
+                t2 = time.perf_counter()
+                legacy_buy(old_info, item_idx, pos)
+                legacy_after_emit(old_info, recorder)
+                t3 = time.perf_counter()
+                session.parse_command(f"buy {item_idx} {pos}", {})
+                session.after_emit()
+                t4 = time.perf_counter()
+                t_old["refresh"] += t1 - t0
+                t_new["refresh"] += t2 - t1
+                t_old["buy"] += t3 - t2
+                t_new["buy"] += t4 - t3
+                n_buys += 1
+                mismatch += old_info.placed_towers[pos].attributes != new_info.placed_towers[pos].to_payload()
+        recorder.close()
+        session.recorder.close()
+    print(f"maps: {len(maps)}, buys: {n_buys}, mismatched placements: {mismatch}")
+    for kind in ("refresh", "buy"):
+        print(f"{kind:<7} legacy: {t_old[kind] / n_buys * 1e6:7.1f} us/action, current: {t_new[kind] / n_buys * 1e6:6.1f} us/action, "
+              f"speedup: {t_old[kind] / max(t_new[kind], 1e-12):.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", choices=["coverage", "board", "dp", "geometry", "session"], help="要测试的模块")
+    parser.add_argument("--record_dir", type=str, default=None, help="从record_*目录读取真实地图, 不指定则随机生成")
+    parser.add_argument("--n_maps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n_items", type=int, default=20, help="每次购买前评估的商店大小")
+    parser.add_argument("--n_buys", type=int, default=10)
+    parser.add_argument("--n_cases", type=int, default=20, help="dp测试的随机局面数")
+    args = parser.parse_args()
+    geometry_cache.CACHE_DIR = None
+    if args.target == "coverage":
+        bench_coverage(args)
+    elif args.target == "board":
+        bench_board(args)
+    elif args.target == "dp":
+        bench_dp(args)
+    elif args.target == "geometry":
+        bench_geometry(args)
+    elif args.target == "session":
+        bench_session(args)
+
+# e.g. python benchmark.py coverage --record_dir record_1128_1723
+#      python benchmark.py session --n_buys 20
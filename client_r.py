@@ -1,34 +1,114 @@
 import os
-from datetime import datetime
-now = datetime.now()
-date_str = now.strftime("%m%d_%H%M")
-
-# 创建记录目录和score.csv文件，并写入标题
-record_dir = f'record_{date_str}'
-os.makedirs(record_dir, exist_ok=True)
-score_csv_path = os.path.join(record_dir, 'score.csv')
-with open(score_csv_path, 'w', encoding='utf-8') as f:
-    f.write('game_id,score_pred,score_game\n')
-
-# for gid in range(0, 10):
-#     print(f'Running game_id: {gid}')
-#     os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir}')
-    # os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir} --label_dir ./data/game/lora-4B')
-
+import sys
+import time
+import argparse
 import threading
-def func1():
-    for gid in range(10, 100):
-        print(f'Running game_id: {gid}')
-        os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir}')
-        # os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir} --label_dir ./data/game/lora-4B')
-def func2():
-    for gid in range(100, 200):
-        print(f'Running game_id: {gid}')
-        os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir}')
-        # os.system(f'python client.py  --action auto --game_id {gid} --record_dir {record_dir} --label_dir ./data/game/lora-4B')
-t1 = threading.Thread(target=func1)
-t2 = threading.Thread(target=func2)
-t1.start()
-t2.start()
-t1.join()
-t2.join()
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from async_client import parse_game_ids, make_record_dir
+
+# 批量运行client.py: 每局一个子进程, --workers个子进程同时运行
+# 中断后用 --record_dir 指向原目录即可续跑, score.csv里已有的game_id会被跳过
+# 本脚本不认识的参数原样传给每个client.py(如--strategy_config, --prompt_layout, --log_latency)
+
+def read_completed(record_dir) -> set[int]:
+    completed = set()
+    score_csv_path = os.path.join(record_dir, 'score.csv')
+    if not os.path.exists(score_csv_path):
+        return completed
+    with open(score_csv_path, encoding='utf-8') as f:
+        for line in f:
+            gid = line.split(',')[0].strip()
+            if gid.isdigit():
+                completed.add(int(gid))
+    return completed
+
+class BatchRunner:
+    def __init__(self, record_dir, workers=2, timeout=600, retries=2, extra_args=None):
+        self.record_dir = record_dir
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.extra_args = extra_args or []
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.failed: list[int] = []
+        self.start = 0.0
+        self.total = 0
+
+    def run_game(self, gid) -> bool:
+        # 运行一局, 失败或超时则重试; 以score.csv中出现该game_id作为成功标志
+        cmd = [sys.executable, 'client.py', '--action', 'auto', '--game_id', str(gid), '--record_dir', self.record_dir] + self.extra_args
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            try:
+                subprocess.run(cmd, timeout=self.timeout, stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+            except subprocess.TimeoutExpired:
+                print(f'[game {gid}] Timeout after {self.timeout}s ({attempt + 1}/{self.retries + 1})')
+                continue
+            if gid in read_completed(self.record_dir):
+                self.report(gid, time.perf_counter() - t0)
+                return True
+            print(f'[game {gid}] Not finished ({attempt + 1}/{self.retries + 1})')
+        with self.lock:
+            self.failed.append(gid)
+        return False
+
+    def report(self, gid, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            done = len(self.latencies)
+            elapsed = time.perf_counter() - self.start
+            p50, p95 = np.percentile(self.latencies, [50, 95])
+            print(f'[{done}/{self.total}] game {gid} {latency:.1f}s | '
+                  f'{done / elapsed * 60:.2f} games/min | p50 {p50:.1f}s p95 {p95:.1f}s max {max(self.latencies):.1f}s')
+
+    def run(self, game_ids: list[int]):
+        completed = read_completed(self.record_dir)
+        todo = [gid for gid in game_ids if gid not in completed]
+        print(f'{len(game_ids) - len(todo)} games already in {self.record_dir}/score.csv, {len(todo)} to run')
+        self.total = len(todo)
+        self.start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.run_game, gid) for gid in todo]
+            for _ in as_completed(futures):
+                pass
+        elapsed = time.perf_counter() - self.start
+        print(f'Finished {len(self.latencies)}/{self.total} games in {elapsed / 60:.1f} min')
+        if self.failed:
+            print(f'Failed game_ids: {sorted(self.failed)}')
+
+if __name__ == '__main__':
+    # 不允许缩写, 否则client.py的参数(如--game_id)会被当成本脚本参数的缩写
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument('--game_ids', default='10-199', type=str, help='例如 10-99,100-199')
+    parser.add_argument('--workers', default=2, type=int, help='同时运行的client.py进程数')
+    parser.add_argument('--timeout', default=600, type=float, help='单局超时时间(秒)')
+    parser.add_argument('--retries', default=2, type=int, help='单局失败后的重试次数')
+    parser.add_argument('--record_dir', default=None, type=str, help='已有目录则续跑, 默认新建record_<日期>')
+    parser.add_argument('--label_dir', default=None, type=str, help='标准答案文件夹, 传给client.py')
+    parser.add_argument('--server_url', default=None, type=str, help='传给client.py')
+    parser.add_argument('--prediction_cache', default=None, type=str, help='预测结果缓存文件, 传给client.py')
+    parser.add_argument('--cache_model', default=None, type=str, help='传给client.py')
+    args, client_args = parser.parse_known_args()
+    if any(a.split('=')[0] in ('--game_id', '--action', '--action_mode') for a in client_args):
+        parser.error('--game_id/--action_mode are set by client_r.py')
+
+    record_dir = make_record_dir(args.record_dir)
+    extra_args = ['--label_dir', args.label_dir] if args.label_dir else []
+    if args.server_url:
+        extra_args += ['--server_url', args.server_url]
+    if args.prediction_cache:
+        extra_args += ['--prediction_cache', args.prediction_cache]
+    if args.cache_model:
+        extra_args += ['--cache_model', args.cache_model]
+    extra_args += client_args
+    # extra_args = ['--label_dir', './data/game/lora-4B']
+    runner = BatchRunner(record_dir, workers=args.workers, timeout=args.timeout, retries=args.retries, extra_args=extra_args)
+    runner.run(parse_game_ids(args.game_ids))
+
+# e.g. python client_r.py --workers 4
+#      python client_r.py --workers 4 --record_dir record_1128_1723  (续跑)
+#      python client_r.py --workers 4 --strategy_config best_config.json --prompt_layout stories_first --log_latency
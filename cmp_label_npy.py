@@ -1,13 +1,13 @@
-import numpy as np
 import argparse
+from finetune.dataset import GameDataset
 
 parser = argparse.ArgumentParser()
-parser.add_argument('--file1', type=str, required=True, help='第一个labels.npy')
-parser.add_argument('--file2', type=str, required=True, help='第二个labels.npy')
+parser.add_argument('--dir1', type=str, required=True, help='第一个数据集目录(labels.u32.npy)')
+parser.add_argument('--dir2', type=str, required=True, help='第二个数据集目录(labels.u32.npy)')
 args = parser.parse_args()
 
-labels1 = np.load(args.file1, allow_pickle=True)
-labels2 = np.load(args.file2, allow_pickle=True)
+labels1 = GameDataset(args.dir1).labels
+labels2 = GameDataset(args.dir2).labels
 
 assert len(labels1) == len(labels2), f"两个npy长度不一致: {len(labels1)} vs {len(labels2)}"
 
@@ -26,4 +26,4 @@ for i, (a, b) in enumerate(zip(labels1, labels2)):
         diff_count += 1
 print(f"总共有 {diff_count} 处不同")
 
-# python ./cmp_label_npy.py --file1 ./record_1127_1352/labels.npy --file2 ./record_1127_1414/labels.npy
\ No newline at end of file
+# python ./cmp_label_npy.py --dir1 ./record_1127_1352 --dir2 ./record_1127_1414
\ No newline at end of file
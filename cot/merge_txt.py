@@ -1,4 +1,7 @@
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from finetune.dataset import write_text_column
 
 # 合并顺序
 file_list = [
@@ -11,8 +14,6 @@ file_list = [
     "cot/output1000-1200.txt"
 ]
 
-import numpy as np
-
 lines = []
 total = 0
 for fname in file_list:
@@ -21,6 +22,5 @@ for fname in file_list:
             lines.append(line.rstrip('\n'))
             total += 1
 
-out_path = "cot/cot.npy"
-np.save(out_path, np.array(lines, dtype=object))
-print(f"合并完成，共 {total} 行，输出到 {out_path}")
\ No newline at end of file
+write_text_column("cot", "cot", lines)
+print(f"合并完成，共 {total} 行，输出到 cot/cot.blob")
\ No newline at end of file
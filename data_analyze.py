@@ -1,122 +1,106 @@
 import numpy as np
-import os
-from collections import Counter, defaultdict
+from finetune.dataset import GameDataset
+from label_metrics import (OPTIONS, SINGLE_KEYS, MULTI_KEYS, unpack, default_class, class_index, confusion_matrix,
+                           confusion_counts, binary_counts, prf, jaccard_scores)
 
-def analyze_single_class(label_dir, pred_dir, key, valid_classes=None):
+def load_codes(data_dir) -> np.ndarray:
+    return np.asarray(GameDataset(data_dir).labels.codes)
+
+def analyze_single_class(labels: dict, preds: dict, key):
     """
     通用单标签分类混淆矩阵分析。
+    labels, preds: label_metrics.unpack的结果
     key: 属性名
-    valid_classes: 类别列表
     """
-    label_path = os.path.join(label_dir, "labels.npy")
-    pred_path = os.path.join(pred_dir, "labels.npy")
-    labels = np.load(label_path, allow_pickle=True)
-    preds = np.load(pred_path, allow_pickle=True)
-    assert len(labels) == len(preds), "标签和预测数量不一致"
-    if valid_classes is None:
-        # 自动收集所有出现过的类别
-        valid_classes = set()
-        for label, pred in zip(labels, preds):
-            valid_classes.add(label.get(key, ["Normal"])[0])
-            valid_classes.add(pred.get(key, ["Normal"])[0])
-        valid_classes = sorted(list(valid_classes))
-    conf_matrix = defaultdict(lambda: defaultdict(int))
-    correct = 0
-    total = 0
-    for label, pred in zip(labels, preds):
-        label_val = label.get(key, ["Normal"])
-        pred_val = pred.get(key, ["Normal"])
-        label_cls = label_val[0] if label_val else "Normal"
-        pred_cls = pred_val[0] if pred_val else "Normal"
-        # if key == 'best_atk_spd' and label_cls == 'Fast' and pred_cls == 'Normal':
-        #     print(f"Discrepancy found: id = {total}")
-        if key == 'slow_eff' and label_cls == 'Resist' and pred_cls == 'Normal':
-            print(f"Discrepancy found: id = {total}")
-        if label_cls not in valid_classes:
-            label_cls = valid_classes[0]
-        if pred_cls not in valid_classes:
-            pred_cls = valid_classes[0]
-        conf_matrix[label_cls][pred_cls] += 1
-        if label_cls == pred_cls:
-            correct += 1
-        total += 1
+    valid_classes = OPTIONS[key]
+    default = default_class(key)
+    assert labels[key].shape == preds[key].shape, "标签和预测数量不一致"
+    if key == 'slow_eff':
+        label_idx = class_index(labels[key], default)
+        pred_idx = class_index(preds[key], default)
+        for i in np.nonzero((label_idx == valid_classes.index('Resist')) & (pred_idx == valid_classes.index('Normal')))[0]:
+            print(f"Discrepancy found: id = {i}")
+    conf = confusion_matrix(labels[key], preds[key], default)
+    correct = int(np.trace(conf))
+    total = int(conf.sum())
     print(f"Confusion Matrix for {key}:")
     col_width = max(len(x) for x in (["label/pred"] + valid_classes)) + 2
     header = "label/pred".ljust(col_width) + "".join(pred_cls.ljust(col_width) for pred_cls in valid_classes)
     print(header)
-    for label_cls in valid_classes:
+    for i, label_cls in enumerate(valid_classes):
         row = label_cls.ljust(col_width)
-        row += "".join(str(conf_matrix[label_cls][pred_cls]).ljust(col_width) for pred_cls in valid_classes)
+        row += "".join(str(conf[i, j]).ljust(col_width) for j in range(len(valid_classes)))
         print(row)
     acc = correct / total if total > 0 else 0
     print(f"Accuracy: {acc:.4f} ({correct}/{total})\n")
 
     # 统计每个label的TP, FP, FN, TN, 正确率
     print(f"Per-class stats for {key}:")
-    for cls in valid_classes:
-        TP = conf_matrix[cls][cls]
-        FP = sum(conf_matrix[other][cls] for other in valid_classes if other != cls)
-        FN = sum(conf_matrix[cls][other] for other in valid_classes if other != cls)
-        TN = sum(conf_matrix[other1][other2] for other1 in valid_classes for other2 in valid_classes if other1 != cls and other2 != cls)
-        total_cls = TP + FP + FN + TN
-        acc_cls = (TP + TN) / total_cls if total_cls > 0 else 0
-        precision = TP / (TP + FP) if (TP + FP) > 0 else 0
-        recall = TP / (TP + FN) if (TP + FN) > 0 else 0
-        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-        print(f"{cls}: TP={TP}, FP={FP}, FN={FN}, TN={TN}, Acc={acc_cls:.4f}, Precision={precision:.4f}, Recall={recall:.4f}, F1={f1:.4f}")
+    tp, fp, fn, tn = confusion_counts(conf)
+    acc_cls, precision, recall, f1 = prf(tp, fp, fn, tn)
+    for i, cls in enumerate(valid_classes):
+        print(f"{cls}: TP={tp[i]}, FP={fp[i]}, FN={fn[i]}, TN={tn[i]}, Acc={acc_cls[i]:.4f}, Precision={precision[i]:.4f}, Recall={recall[i]:.4f}, F1={f1[i]:.4f}")
     print()
 
-def analyze_multilabel(label_dir, pred_dir, key, valid_elements):
+def analyze_multilabel(labels: dict, preds: dict, key):
     """
     多标签属性分析，统计每个元素的TP/FP/FN/TN。
+    labels, preds: label_metrics.unpack的结果
     key: 属性名
-    valid_elements: 所有可能的元素
     """
-    label_path = os.path.join(label_dir, "labels.npy")
-    pred_path = os.path.join(pred_dir, "labels.npy")
-    labels = np.load(label_path, allow_pickle=True)
-    preds = np.load(pred_path, allow_pickle=True)
-    assert len(labels) == len(preds), "标签和预测数量不一致"
+    assert labels[key].shape == preds[key].shape, "标签和预测数量不一致"
     print(f"Element-wise confusion for {key}:")
-    for elem in valid_elements:
-        TP = FP = FN = TN = 0
-        for label, pred in zip(labels, preds):
-            label_set = set(label.get(key, []))
-            pred_set = set(pred.get(key, []))
-            if elem in label_set and elem in pred_set:
-                TP += 1
-            elif elem not in label_set and elem in pred_set:
-                FP += 1
-            elif elem in label_set and elem not in pred_set:
-                FN += 1
-            else:
-                TN += 1
-        total_elem = TP + FP + FN + TN
-        acc_elem = (TP + TN) / total_elem if total_elem > 0 else 0
-        precision = TP / (TP + FP) if (TP + FP) > 0 else 0
-        recall = TP / (TP + FN) if (TP + FN) > 0 else 0
-        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-        print(f"{elem}: TP={TP}, FP={FP}, FN={FN}, TN={TN}, Acc={acc_elem:.4f}, Precision={precision:.4f}, Recall={recall:.4f}, F1={f1:.4f}")
+    tp, fp, fn, tn = binary_counts(labels[key], preds[key])
+    acc_elem, precision, recall, f1 = prf(tp, fp, fn, tn)
+    for i, elem in enumerate(OPTIONS[key]):
+        print(f"{elem}: TP={tp[i]}, FP={fp[i]}, FN={fn[i]}, TN={tn[i]}, Acc={acc_elem[i]:.4f}, Precision={precision[i]:.4f}, Recall={recall[i]:.4f}, F1={f1[i]:.4f}")
     print()
 
+def compare_pred_dirs(label_codes: np.ndarray, pred_codes: np.ndarray, pred_dirs):
+    """
+    多个预测目录的汇总对比, 一次计算所有目录。
+    pred_codes: (D, N)
+    单选属性为准确率, 多选属性为各元素F1的平均, score为官方评分(每轮平均, 满分100)
+    """
+    labels = unpack(label_codes)
+    preds = unpack(pred_codes)
+    columns = {}
+    for key in SINGLE_KEYS:
+        conf = confusion_matrix(labels[key][None], preds[key], default_class(key))
+        columns[key] = np.trace(conf, axis1=-2, axis2=-1) / conf.sum(axis=(-2, -1))
+    for key in MULTI_KEYS:
+        columns[key] = prf(*binary_counts(labels[key][None], preds[key]))[3].mean(axis=-1)
+    columns['score'] = jaccard_scores(label_codes[None], pred_codes).mean(axis=(-2, -1))
+    name_width = max(len(d) for d in pred_dirs + ["pred_dir"]) + 2
+    print("pred_dir".ljust(name_width) + "".join(f"{key:>14}" for key in columns))
+    for d in np.argsort(-columns['score'], kind="stable"):
+        print(pred_dirs[d].ljust(name_width) + "".join(f"{columns[key][d]:>14.4f}" for key in columns))
+    print()
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--label_dir", type=str, required=True, help="标准答案labels.npy所在文件夹")
-    parser.add_argument("--pred_dir", type=str, required=True, help="模型预测labels.npy所在文件夹")
+    parser.add_argument("--label_dir", type=str, required=True, help="标准答案数据集文件夹(labels.u32.npy)")
+    parser.add_argument("--pred_dir", type=str, required=True, nargs="+", help="模型预测数据集文件夹(labels.u32.npy), 可指定多个")
     args = parser.parse_args()
 
-    # 单标签属性
-    analyze_single_class(args.label_dir, args.pred_dir, "best_atk_spd", ["Fast", "Normal", "Slow"])
-    analyze_single_class(args.label_dir, args.pred_dir, "slow_eff", ["Resist", "Normal", "Weak"])
-    analyze_single_class(args.label_dir, args.pred_dir, "occurrence", ["Single", "Double", "Triple", "Sparse", "Dense"])
+    label_codes = load_codes(args.label_dir)
+    pred_codes = np.stack([load_codes(d) for d in args.pred_dir])
+    assert pred_codes.shape[1] == len(label_codes), "标签和预测数量不一致"
+    if len(args.pred_dir) == 1:
+        labels = unpack(label_codes)
+        preds = unpack(pred_codes[0])
+        # 单标签属性
+        analyze_single_class(labels, preds, "best_atk_spd")
+        analyze_single_class(labels, preds, "slow_eff")
+        analyze_single_class(labels, preds, "occurrence")
 
-    # 多标签属性
-    elements = ["Fire", "Ice", "Poison", "Blunt", "Lightning"]
-    analyze_multilabel(args.label_dir, args.pred_dir, "weak", elements)
-    analyze_multilabel(args.label_dir, args.pred_dir, "resist", elements)
-    analyze_multilabel(args.label_dir, args.pred_dir, "special_eff", elements)
+        # 多标签属性
+        analyze_multilabel(labels, preds, "weak")
+        analyze_multilabel(labels, preds, "resist")
+        analyze_multilabel(labels, preds, "special_eff")
+    compare_pred_dirs(label_codes, pred_codes, args.pred_dir)
 
 # e.g python data_analyze.py --label_dir data/game/val --pred_dir data/game/lora-4B
 # python data_analyze.py --label_dir predict_1128_0008 --pred_dir predict_1128_0019
+# python data_analyze.py --label_dir data/game/val --pred_dir predict_1128_0008 predict_1128_0019 predict_1129_*
@@ -1,21 +1,18 @@
 
 import argparse
 import os
-import numpy as np
 import json
-from prompt import SYSTEM_PROMPT, concat_input
+from dataset import GameDataset
+from prompt import SYSTEM_PROMPT, PROMPT_LAYOUT, PROMPT_LAYOUTS, concat_input
 
-def convert_to_llamafactory_jsonl(input_dir, output_dir, output_name="llamafactory.jsonl", cot=False):
-    data_path = os.path.join(input_dir, "data.npy")
-    names_path = os.path.join(input_dir, "names.npy")
-    labels_path = os.path.join(input_dir, "labels.npy")
+def convert_to_llamafactory_jsonl(input_dir, output_dir, output_name="llamafactory.jsonl", cot=False, layout=None):
     output_path = os.path.join(output_dir, output_name)
-    data = np.load(data_path, allow_pickle=True)
-    names = np.load(names_path, allow_pickle=True)
-    labels = np.load(labels_path, allow_pickle=True)
+    dataset = GameDataset(input_dir)
+    data = dataset.data
+    names = dataset.names
+    labels = dataset.labels
     if cot:
-        cot_path = os.path.join(input_dir, "cot.npy")
-        cot_lines = np.load(cot_path, allow_pickle=True)
+        cot_lines = dataset.cot
         assert len(cot_lines) == len(labels), f"cot长度{len(cot_lines)}与labels不符{len(labels)}"
     
     assert len(data) == len(names) == len(labels)
@@ -31,19 +28,20 @@ def convert_to_llamafactory_jsonl(input_dir, output_dir, output_name="llamafacto
                     output_str = f"[REASONING]\n{cot_lines[idx]}\n[ANSWER]\n{str(labels[idx])}"
                 item = {
                     "instruction": SYSTEM_PROMPT.strip(),
-                    "input": concat_input(names[idx], ninp),
+                    "input": concat_input(names[idx], ninp, layout=layout),
                     "output": output_str
                 }
                 fout.write(json.dumps(item, ensure_ascii=False) + '\n')
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input_dir', type=str, required=True, help='Directory containing data.npy, names.npy, labels.npy')
+    parser.add_argument('--input_dir', type=str, required=True, help='Dataset directory with data, names and labels columns')
     parser.add_argument('--output_dir', type=str, required=True, help='Directory to save output jsonl file')
     parser.add_argument('--output_name', type=str, default='llamafactory.jsonl', help='Output jsonl filename')
     parser.add_argument('--cot', action='store_true', help='If set, add COT reasoning to output')
+    parser.add_argument('--layout', type=str, default=PROMPT_LAYOUT, choices=PROMPT_LAYOUTS, help='Prompt input layout, must match the one used for inference')
     args = parser.parse_args()
-    convert_to_llamafactory_jsonl(args.input_dir, args.output_dir, args.output_name, cot=args.cot)
+    convert_to_llamafactory_jsonl(args.input_dir, args.output_dir, args.output_name, cot=args.cot, layout=args.layout)
 
 if __name__ == '__main__':
     main()
@@ -56,4 +54,7 @@ if __name__ == '__main__':
 
     # with cot
     # python finetune/data_preprocess.py --input_dir /home/ws/cot --output_dir /home/ws/cot --output_name kun_cot.json --cot
-    # python finetune/data_preprocess.py --input_dir /home/ws/cot --output_dir /home/LLaMA-Factory/data --output_name kun_cot.json --cot
\ No newline at end of file
+    # python finetune/data_preprocess.py --input_dir /home/ws/cot --output_dir /home/LLaMA-Factory/data --output_name kun_cot.json --cot
+
+    # stories_first layout (prefix cache friendly)
+    # python finetune/data_preprocess.py --input_dir /home/ws/data/game/train --output_dir /home/LLaMA-Factory/data --output_name kun_sf.json --layout stories_first
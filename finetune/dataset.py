@@ -0,0 +1,213 @@
+import os
+import argparse
+import numpy as np
+
+# 数据集的列式存储格式, 替代需要allow_pickle的object类型npy
+# 一个目录下每列独立存放, 均按需打开(memmap), 读取任意一行为O(1):
+#   labels.u32.npy              每行一个uint32, 六个属性按位打包
+#   <col>.blob + <col>.offsets.npy   文本列(data/names/cot): UTF-8拼接的字节 + 长度为N+1的int64偏移
+# 旧的npy文件用 python finetune/dataset.py convert <dir> 转换
+
+ATK_SPD = ["Fast", "Normal", "Slow"]
+ELEMENTS = ["Fire", "Ice", "Poison", "Blunt", "Lightning"]
+SLOW_EFF = ["Resist", "Normal", "Weak"]
+OCCURRENCE = ["Single", "Double", "Triple", "Sparse", "Dense"]
+
+# (属性名, 可选值, 是否多选), 顺序即标签dict的key顺序
+LABEL_FIELDS = [
+    ("best_atk_spd", ATK_SPD, False),
+    ("weak", ELEMENTS, True),
+    ("resist", ELEMENTS, True),
+    ("special_eff", ELEMENTS, True),
+    ("slow_eff", SLOW_EFF, False),
+    ("occurrence", OCCURRENCE, False),
+]
+TEXT_COLUMNS = ["data", "names", "cot"]
+
+def _field_layout():
+    # 单选: 0表示空, i+1表示第i个选项; 多选: 每个选项一位
+    layout = {}
+    shift = 0
+    for key, options, multi in LABEL_FIELDS:
+        width = len(options) if multi else int(len(options)).bit_length()
+        layout[key] = (shift, width)
+        shift += width
+    assert shift <= 32
+    return layout
+
+FIELD_LAYOUT = _field_layout()
+
+def encode_label(label: dict) -> int:
+    code = 0
+    for key, options, multi in LABEL_FIELDS:
+        shift, _ = FIELD_LAYOUT[key]
+        values = label.get(key, [])
+        if multi:
+            for v in values:
+                code |= 1 << (shift + options.index(v))
+        else:
+            if len(values) > 1:
+                raise ValueError(f"{key} 只能有一个值: {values}")
+            if values:
+                code |= (options.index(values[0]) + 1) << shift
+    return code
+
+def decode_label(code: int) -> dict:
+    code = int(code)
+    label = {}
+    for key, options, multi in LABEL_FIELDS:
+        shift, width = FIELD_LAYOUT[key]
+        bits = (code >> shift) & ((1 << width) - 1)
+        if multi:
+            label[key] = [opt for i, opt in enumerate(options) if bits >> i & 1]
+        else:
+            label[key] = [options[bits - 1]] if bits else []
+    return label
+
+def _open_array(path):
+    # 空文件无法memmap
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+class TextColumn:
+    def __init__(self, data_dir, name):
+        self.offsets = np.load(os.path.join(data_dir, f"{name}.offsets.npy"), mmap_mode="r")
+        self.blob = _open_array(os.path.join(data_dir, f"{name}.blob"))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"index {idx} out of range for {len(self)} rows")
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class LabelColumn:
+    def __init__(self, data_dir):
+        # codes: (N,) uint32, 可直接做向量化统计
+        self.codes = np.load(os.path.join(data_dir, "labels.u32.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [decode_label(c) for c in self.codes[idx]]
+        return decode_label(self.codes[idx])
+
+    def __iter__(self):
+        for c in self.codes:
+            yield decode_label(c)
+
+class GameDataset:
+    # 按列懒加载: ds.data[i] / ds.names[i] / ds.labels[i] / ds.cot[i]
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._columns = {}
+
+    def has(self, name) -> bool:
+        if name == "labels":
+            return os.path.exists(os.path.join(self.data_dir, "labels.u32.npy"))
+        return os.path.exists(os.path.join(self.data_dir, f"{name}.offsets.npy"))
+
+    def column(self, name):
+        if name not in self._columns:
+            if not self.has(name):
+                hint = ""
+                if os.path.exists(os.path.join(self.data_dir, f"{name}.npy")):
+                    hint = f", run: python finetune/dataset.py convert {self.data_dir}"
+                raise FileNotFoundError(f"column '{name}' not found in {self.data_dir}{hint}")
+            self._columns[name] = LabelColumn(self.data_dir) if name == "labels" else TextColumn(self.data_dir, name)
+        return self._columns[name]
+
+    @property
+    def data(self) -> TextColumn:
+        return self.column("data")
+
+    @property
+    def names(self) -> TextColumn:
+        return self.column("names")
+
+    @property
+    def labels(self) -> LabelColumn:
+        return self.column("labels")
+
+    @property
+    def cot(self) -> TextColumn:
+        return self.column("cot")
+
+    def __len__(self):
+        for name in ["labels"] + TEXT_COLUMNS:
+            if self.has(name):
+                return len(self.column(name))
+        return 0
+
+def write_text_column(data_dir, name, texts):
+    os.makedirs(data_dir, exist_ok=True)
+    encoded = [str(t).encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(data_dir, f"{name}.blob"), "wb") as f:
+        for b in encoded:
+            f.write(b)
+    np.save(os.path.join(data_dir, f"{name}.offsets.npy"), offsets)
+
+def write_labels(data_dir, labels):
+    os.makedirs(data_dir, exist_ok=True)
+    codes = np.array([encode_label(label) for label in labels], dtype=np.uint32)
+    np.save(os.path.join(data_dir, "labels.u32.npy"), codes)
+
+def convert_npy(data_dir):
+    # 转换目录下已有的data/names/labels/cot.npy, 转换后逐行校验, 与原文本不完全一致时报错
+    converted = []
+    for name in ["labels"] + TEXT_COLUMNS:
+        path = os.path.join(data_dir, f"{name}.npy")
+        if not os.path.exists(path):
+            continue
+        values = np.load(path, allow_pickle=True)
+        if name == "labels":
+            # 标签的文本形式会写进训练数据, 写入前先确认编码再解码后完全一致(key顺序, 选项顺序, 多余的key)
+            for i, v in enumerate(values):
+                decoded = decode_label(encode_label(v))
+                if str(decoded) != str(v):
+                    raise ValueError(f"{path} row {i} changes after conversion: {v} -> {decoded}")
+            write_labels(data_dir, values)
+        else:
+            write_text_column(data_dir, name, values)
+        column = GameDataset(data_dir).column(name)
+        for i, v in enumerate(values):
+            if str(column[i]) != str(v):
+                raise ValueError(f"{path} row {i} mismatch after conversion: {v} -> {column[i]}")
+        converted.append(f"{name}({len(values)})")
+    print(f"{data_dir}: converted {', '.join(converted) if converted else 'nothing'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p_convert = subparsers.add_parser("convert", help="把目录下的npy文件转换为列式格式")
+    p_convert.add_argument("dirs", nargs="+")
+    p_show = subparsers.add_parser("show", help="打印某一行")
+    p_show.add_argument("dir")
+    p_show.add_argument("idx", type=int)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for d in args.dirs:
+            convert_npy(d)
+    else:
+        ds = GameDataset(args.dir)
+        for name in ["names", "labels", "data", "cot"]:
+            if ds.has(name):
+                print(f"[{name}] {ds.column(name)[args.idx]}")
+
+# e.g. python finetune/dataset.py convert data/game/train data/game/val data/data
+#      python finetune/dataset.py show data/game/val 0
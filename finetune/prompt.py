@@ -213,7 +213,25 @@ Example Output:
 Now analyze the following input:
 """
 
-def concat_input(name: str, stories: list[str]) -> str:
+# 输入部分的排列方式:
+# name_first: Name -> Number of stories -> Story 1..k (原格式)
+# stories_first: Story 1..k -> Number of stories -> Name, 第k+1轮与第k轮的公共前缀是系统提示和Story 1..k, vLLM可以复用这部分的KV缓存
+#   结尾的Number of stories和Name在每轮都不同(只有几个token), 所以不是严格的扩展
+# 训练和推理必须使用同一种格式
+PROMPT_LAYOUTS = ("name_first", "stories_first")
+PROMPT_LAYOUT = "name_first"
+
+def concat_input(name: str, stories: list[str], *, layout: str | None = None) -> str:
+  layout = layout or PROMPT_LAYOUT
+  if layout not in PROMPT_LAYOUTS:
+    raise ValueError(f"Unknown prompt layout: {layout}")
+  if layout == "stories_first":
+    ret = ""
+    for i, story in enumerate(stories, start=1):
+      ret += f"Story {i}:\n{story}\n"
+    ret += f"\nNumber of stories: {len(stories)}\n"
+    ret += f"Name: {name}\n"
+    return ret
   ret: str = f"Name: {name}\n\n"
   ret += f"Number of stories: {len(stories)}\n"
   # ret += "Description:\n"
@@ -222,8 +240,8 @@ def concat_input(name: str, stories: list[str]) -> str:
     # ret += story + '\n\n'
   return ret
 
-def generate_system_prompt(name: str, stories: list[str]) -> str:
-    input_text = concat_input(name, stories)
+def generate_system_prompt(name: str, stories: list[str], layout: str | None = None) -> str:
+    input_text = concat_input(name, stories, layout=layout)
     return SYSTEM_PROMPT + "\n" + input_text
 
 def generate_reasoning_prompt(name: str, stories: list[str], ground_truth: dict) -> str:
@@ -1,5 +1,5 @@
 import argparse
-import numpy as np
+from dataset import GameDataset
 import torch
 from torch.utils.data import Dataset, DataLoader
 from transformers import AutoTokenizer, AutoModelForCausalLM, Trainer, TrainingArguments
@@ -10,10 +10,11 @@ You are a strategic game analyst for a tower defense game that unfolds over mult
 Given the target monster name and one or more narrative passages, carefully infer the following six attributes based only on explicit or strongly implied clues about that monster in any of the stories. Output your answer strictly in valid JSON format, with no additional text, explanation, or markdown.
 """
 class NpyDataset(Dataset):
-    def __init__(self, data_path, names_path, labels_path, tokenizer):
-        self.data = np.load(data_path, allow_pickle=True)  # List[str]
-        self.names = np.load(names_path, allow_pickle=True)  # List[str]
-        self.labels = np.load(labels_path, allow_pickle=True)  # List[str]
+    def __init__(self, data_dir, tokenizer):
+        dataset = GameDataset(data_dir)
+        self.data = dataset.data  # List[str]
+        self.names = dataset.names  # List[str]
+        self.labels = dataset.labels  # List[dict]
         assert len(self.data) == len(self.labels) == len(self.names)
         self.tokenizer = tokenizer
         self.prompt = SYSTEM_PROMPT
@@ -75,7 +76,7 @@ def collate_fn(batch):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--data_dir', type=str, required=True, help='Parent directory containing data.npy, names.npy, labels.npy')
+    parser.add_argument('--data_dir', type=str, required=True, help='Dataset directory with data, names and labels columns')
     parser.add_argument('--val_dir', type=str, default=None, help='Validation set parent directory (optional)')
     parser.add_argument('--model_path', type=str, required=True, help='Pretrained model name or path')
     parser.add_argument('--output_dir', type=str, default='./output', help='Output directory')
@@ -84,21 +85,14 @@ def main():
     parser.add_argument('--lr', type=float, default=5e-5)
     args = parser.parse_args()
 
-    data_path = f"{args.data_dir}/data.npy"
-    names_path = f"{args.data_dir}/names.npy"
-    labels_path = f"{args.data_dir}/labels.npy"
-
     tokenizer = AutoTokenizer.from_pretrained(args.model_path, use_fast=False)
     model = AutoModelForCausalLM.from_pretrained(args.model_path)
 
-    train_dataset = NpyDataset(data_path, names_path, labels_path, tokenizer)
+    train_dataset = NpyDataset(args.data_dir, tokenizer)
 
     eval_dataset = None
     if args.val_dir:
-        val_data_path = f"{args.val_dir}/data.npy"
-        val_names_path = f"{args.val_dir}/names.npy"
-        val_labels_path = f"{args.val_dir}/labels.npy"
-        eval_dataset = NpyDataset(val_data_path, val_names_path, val_labels_path, tokenizer)
+        eval_dataset = NpyDataset(args.val_dir, tokenizer)
 
     training_args = TrainingArguments(
         output_dir=args.output_dir,
@@ -1,23 +1,99 @@
-import copy
+import sys
 import json
+from enum import Enum
+from dataclasses import dataclass, replace
 
 DEBUG = False
 
-class EnemyInfo:
-    def __init__(self, name, weak=None, resist=None, special_eff=None, slow_eff=None, occurrence=None, best_atk_spd=None):
-        self.name = name
-        self.best_atk_spd = best_atk_spd or []
-        self.weak = weak or []
-        self.resist = resist or []
-        self.special_eff = special_eff or []
-        self.slow_eff = slow_eff or []
-        self.occurrence = occurrence or []
+class Element(str, Enum):
+    FIRE = "Fire"
+    ICE = "Ice"
+    POISON = "Poison"
+    BLUNT = "Blunt"
+    LIGHTNING = "Lightning"
+
+    def __str__(self):
+        return self.value
+
+ELEMENT_INDEX = {e: i for i, e in enumerate(Element)}
 
+def parse_elements(values) -> tuple[Element, ...]:
+    # 预测结果中不认识的元素直接忽略
+    return tuple(Element(v) for v in values or () if v in Element._value2member_map_)
+
+# EnemyInfo/TowerInfo为只读记录, 访问时不再拷贝; 需要修改时生成新记录(update_enemy, TowerInfo.placed)
+@dataclass(frozen=True, slots=True)
+class EnemyInfo:
+    name: str
+    weak: tuple[Element, ...] = ()
+    resist: tuple[Element, ...] = ()
+    special_eff: tuple[Element, ...] = ()
+    slow_eff: tuple[str, ...] = ()
+    occurrence: tuple[str, ...] = ()
+    best_atk_spd: tuple[str, ...] = ()
+
+    def __post_init__(self):
+        # 接受标签中的列表或None
+        for name in ("weak", "resist", "special_eff"):
+            object.__setattr__(self, name, parse_elements(getattr(self, name)))
+        for name in ("slow_eff", "occurrence", "best_atk_spd"):
+            object.__setattr__(self, name, tuple(sys.intern(v) for v in getattr(self, name) or ()))
+
+@dataclass(frozen=True, slots=True)
 class TowerInfo:
-    def __init__(self, attributes):
-        self.attributes = attributes  # dict, e.g. {'type': 'Fire', 'range': 6, ...}
+    type: Element
+    range: int
+    interval: float
+    n_targets: int  # -1为不限目标数
+    speed_down: float = 1.0
+    bullet_range: float = 0.0
+    # 放置后才有的字段
+    damage: int | None = None
+    cost: int | None = None
+    position: int | None = None
+    extra: tuple = ()  # 其它字段的(key, value), 写回payload时原样保留
+
+    @classmethod
+    def from_payload(cls, data: dict) -> "TowerInfo":
+        # 服务器towers_list / tower_stats.csv / 记录中的塔, 统一从这里转换
+        return cls(
+            type=Element(data["type"]),
+            range=data["range"],
+            interval=float(data["interval"]),
+            n_targets=int(data["n_targets"]),
+            speed_down=1.0 if data.get("speedDown") is None else float(data["speedDown"]),
+            bullet_range=float(data.get("bullet_range") or 0.0),
+            damage=data.get("damage"),
+            cost=data.get("cost"),
+            position=data.get("position"),
+            extra=tuple((k, v) for k, v in data.items() if k not in TOWER_PAYLOAD_KEYS),
+        )
+
+    def to_payload(self) -> dict:
+        # 与服务器字段名一致, 用于记录和发给模拟器
+        # speedDown/bullet_range只在原payload中出现过(保存在extra中)或不是默认值时写出
+        data = {"range": self.range, "interval": self.interval, "type": self.type.value, "n_targets": self.n_targets, **dict(self.extra)}
+        if "speedDown" not in data and self.speed_down != 1.0:
+            data["speedDown"] = self.speed_down
+        if "bullet_range" not in data and self.bullet_range != 0.0:
+            data["bullet_range"] = self.bullet_range
+        for key in ("damage", "cost", "position"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+    def placed(self, item: dict, position) -> "TowerInfo":
+        # 商店物品{type, damage, cost, ...}放在position上得到的塔
+        extra = tuple((k, v) for k, v in item.items() if k not in ("type", "damage", "cost"))
+        return replace(self, damage=item.get("damage"), cost=item.get("cost"), position=position, extra=self.extra + extra)
+
+# 不在其中的字段(包括可选的speedDown, bullet_range)按原值保存在TowerInfo.extra中
+TOWER_PAYLOAD_KEYS = {"type", "range", "interval", "n_targets", "damage", "cost", "position"}
 
 class GameInfo:
+    __slots__ = ("enemies", "map", "placement_options", "towers", "placed_towers", "coins", "store", "round", "stories")
+
     def __init__(self):
         self.enemies: dict[str, EnemyInfo] = {}  # Dict[name, EnemyInfo]
         self.map: list[tuple[int,int]] = []  # List of map points, e.g. [[x, y], ...]
@@ -30,11 +106,11 @@ class GameInfo:
         self.stories: list[str] = []
 
     def get_placed_towers(self):
-        return json.dumps([None if tower is None else tower.attributes for tower in self.placed_towers])
+        return json.dumps([None if tower is None else tower.to_payload() for tower in self.placed_towers])
     
     def print_placed_towers(self):
         # 打印能让模拟器看懂的格式
-        print(json.dumps([None if tower is None else tower.attributes for tower in self.placed_towers]))
+        print(json.dumps([None if tower is None else tower.to_payload() for tower in self.placed_towers]))
 
     def debug_print(self):
         if DEBUG:
@@ -56,13 +132,13 @@ class GameInfo:
                 print(f"      Occurrence: {e.occurrence}")
             print(f"Towers(len = {len(self.towers)}):")
             for i, t in enumerate(self.towers):
-                print(f"  [{i}] Attributes: {t.attributes}")
+                print(f"  [{i}] Attributes: {t.to_payload()}")
             print(f"Placed Towers(len = {len(self.placed_towers)}):")
             for i, t in enumerate(self.placed_towers):
                 if t is None:
                     print(f"  [{i}] null")
                 else:
-                    print(f"  [{i}] Attributes: {t.attributes}")
+                    print(f"  [{i}] Attributes: {t.to_payload()}")
             print("========== Game Info ends ==========\n\n\n")
 
     def add_enemy(self, enemy: EnemyInfo):
@@ -70,19 +146,9 @@ class GameInfo:
 
     def update_enemy(self, name, best_atk_spd=None, weak=None, resist=None, special_eff=None, slow_eff=None, occurrence=None):
         assert name in self.enemies, f"Enemy {name} not found"
-        enemy = self.enemies[name]
-        if best_atk_spd is not None:
-            enemy.best_atk_spd = best_atk_spd
-        if weak is not None:
-            enemy.weak = weak
-        if resist is not None:
-            enemy.resist = resist
-        if special_eff is not None:
-            enemy.special_eff = special_eff
-        if slow_eff is not None:
-            enemy.slow_eff = slow_eff
-        if occurrence is not None:
-            enemy.occurrence = occurrence
+        changes = {"best_atk_spd": best_atk_spd, "weak": weak, "resist": resist, "special_eff": special_eff,
+                   "slow_eff": slow_eff, "occurrence": occurrence}
+        self.enemies[name] = replace(self.enemies[name], **{k: v for k, v in changes.items() if v is not None})
 
     def add_tower(self, tower: TowerInfo):
         self.towers.append(tower)
@@ -108,23 +174,24 @@ class GameInfo:
             return self.placement_options[idx]
         return None
 
+    # 以下访问器返回共享的记录, 调用方不要原地修改
     def get_tower_item(self, idx) -> TowerInfo|None:
         if 0 <= idx < len(self.towers):
-            return copy.deepcopy(self.towers[idx])
+            return self.towers[idx]
         return None
 
-    def get_placed_tower_item(self, idx):
+    def get_placed_tower_item(self, idx) -> TowerInfo|None:
         if 0 <= idx < len(self.placed_towers):
-            return copy.deepcopy(self.placed_towers[idx])
+            return self.placed_towers[idx]
         return None
 
     def set_placed_tower_item(self, idx, tower):
         if 0 <= idx < len(self.placed_towers):
             self.placed_towers[idx] = tower
     
-    def get_store_item(self, idx):
+    def get_store_item(self, idx) -> dict|None:
         if 0 <= idx < len(self.store):
-            return copy.deepcopy(self.store[idx])
+            return self.store[idx]
         return None
     
     def clear_placed_towers(self):
@@ -1,3 +1,18 @@
+import os
+import re
+import ast
+import json
+import struct
+
+# 每局除了可读的.record文本外, 还写一份结构化的.events文件:
+# 一串帧, 每帧为 4字节小端长度 + UTF-8 JSON, JSON为 {"type": 事件类型, ...}
+# 事件类型: map, round_start, store, action, place, round_over, end
+# place为增量: {"position": 放置点下标, "tower": 塔属性}, 每回合开始时棋盘清空
+# 旧记录中每个动作后是完整棋盘(placed_towers), 用placed_boards可以统一得到每次放置后的棋盘
+# 两个文件都带缓冲, 在回合边界(flush)和close时写盘
+EVENTS_SUFFIX = ".events"
+_FRAME_HEADER = struct.Struct("<I")
+
 class GameRecorder:
     def __init__(self, game_id, record_dir="records"):
         from datetime import datetime
@@ -5,10 +20,11 @@ class GameRecorder:
         date_str = now.strftime("%m%d_%H%M")
         self.filename = f"{record_dir}/{date_str}_game_{game_id}.record"
         self.file = open(self.filename, "w", encoding="utf-8")
+        self.events_filename = f"{record_dir}/{date_str}_game_{game_id}{EVENTS_SUFFIX}"
+        self.events_file = open(self.events_filename, "wb")
 
     def write(self, content, debug=False):
         if isinstance(content, dict):
-            import json
             self.file.write(json.dumps(content, ensure_ascii=False) + "\n")
             if debug:
                 print(json.dumps(content, ensure_ascii=False) + "\n")
@@ -16,7 +32,155 @@ class GameRecorder:
             self.file.write(str(content) + "\n")
             if debug:
                 print(str(content) + "\n")
+
+    def event(self, type, **data):
+        self.events_file.write(encode_frame({"type": type, **data}))
+
+    def flush(self):
         self.file.flush()
+        self.events_file.flush()
 
     def close(self):
         self.file.close()
+        self.events_file.close()
+
+def encode_frame(event: dict) -> bytes:
+    payload = json.dumps(event, ensure_ascii=False).encode("utf-8")
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+def iter_events(path):
+    # 逐帧读取, 末尾不完整的帧(对局中断)直接忽略
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                return
+            (size,) = _FRAME_HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            yield json.loads(payload)
+
+def record_files(folder, suffix=EVENTS_SUFFIX) -> list[tuple[int, str]]:
+    # 返回按game_id排序的(game_id, 路径), 文件名形如 MMDD_HHMM_game_<id><suffix>
+    files = []
+    for fname in os.listdir(folder):
+        if not fname.endswith(suffix):
+            continue
+        parts = fname[:-len(suffix)].split('_')
+        game_id = -1
+        for i, p in enumerate(parts):
+            if p == 'game' and i + 1 < len(parts) and parts[i + 1].isdigit():
+                game_id = int(parts[i + 1])
+                break
+        files.append((game_id, os.path.join(folder, fname)))
+    files.sort(key=lambda x: x[0])
+    return files
+
+def iter_record_dir(folder):
+    # 依次产出(game_id, event)
+    for game_id, path in record_files(folder):
+        for event in iter_events(path):
+            yield game_id, event
+
+_ROUND_OVER = re.compile(r"Round over\. Used money: (\d+) / (\d+), Build (\d+) towers\.")
+
+def parse_legacy_record(path) -> list[dict]:
+    # 从旧的.record文本中恢复事件, 用于转换没有.events文件的历史记录
+    events = []
+    coins = None
+    description = None
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    towers = None
+    game_map = None
+    for line in lines:
+        if description is not None:
+            # 多行的Enemy Description, 到下一条Coins为止
+            if line.startswith("Coins: "):
+                events[-1]["enemy_description"] = "\n".join(description).rstrip("\n")
+                description = None
+            else:
+                description.append(line)
+                continue
+        if line.startswith("** New round "):
+            round_num = line.split()[3]
+            events.append({"type": "round_start", "round": int(round_num) if round_num.isdigit() else None,
+                           "enemy_name": None, "enemy_description": None, "coins": None})
+        elif line.startswith("Enemy Name: ") and events and events[-1]["type"] == "round_start":
+            events[-1]["enemy_name"] = line[len("Enemy Name: "):]
+        elif line.startswith("Enemy Description: ") and events and events[-1]["type"] == "round_start":
+            description = [line[len("Enemy Description: "):]]
+        elif line.startswith("Coins: "):
+            value = line[len("Coins: "):]
+            coins = int(value) if value.lstrip("-").isdigit() else None
+            if events and events[-1]["type"] == "round_start" and events[-1]["coins"] is None:
+                events[-1]["coins"] = coins
+        elif line.startswith("Towers: "):
+            towers = ast.literal_eval(line[len("Towers: "):])
+        elif line.startswith("Map: "):
+            game_map = ast.literal_eval(line[len("Map: "):])
+        elif line.startswith("Placement Options: "):
+            events.append({"type": "map", "towers": towers, "map": game_map,
+                           "placement_options": ast.literal_eval(line[len("Placement Options: "):])})
+        elif line.startswith("Store: "):
+            events.append({"type": "store", "coins": coins, "store": ast.literal_eval(line[len("Store: "):])})
+        elif line.startswith("[User Action] "):
+            events.append({"type": "action", "action": ast.literal_eval(line[len("[User Action] "):])})
+        elif line.startswith(("[{", "[null", "[]")) and events and events[-1]["type"] == "action":
+            events.append({"type": "placed_towers", "towers": json.loads(line)})
+        elif line.startswith("[PLACE] "):
+            idx, tower = line[len("[PLACE] "):].split(" ", 1)
+            events.append({"type": "place", "position": int(idx), "tower": json.loads(tower)})
+        elif line.startswith("[GAME END] "):
+            data = ast.literal_eval(line[len("[GAME END] "):])
+            events.append({"type": "end", "score_pred": data.get("score_pred"), "score_game": data.get("score_game")})
+        else:
+            m = _ROUND_OVER.search(line)
+            if m:
+                used, total, built = map(int, m.groups())
+                # 文本中Round over写在新回合的标题之后, 事件中放在round_start之前
+                pos = len(events) - 1 if events and events[-1]["type"] == "round_start" else len(events)
+                events.insert(pos, {"type": "round_over", "used": used, "coins": total, "built": built})
+    return events
+
+def placed_boards(events):
+    # 依次产出(回合, 棋盘), 每个place/placed_towers事件之后产出一次
+    # 棋盘长度为map事件中placement_options的个数
+    n_options = 0
+    board = []
+    current = None
+    for e in events:
+        if e["type"] == "map":
+            n_options = len(e.get("placement_options") or [])
+            board = [None] * n_options
+        elif e["type"] == "round_start":
+            current = e.get("round")
+            board = [None] * n_options
+        elif e["type"] == "place":
+            board[e["position"]] = e["tower"]
+            yield current, list(board)
+        elif e["type"] == "placed_towers":
+            board = list(e["towers"])
+            yield current, list(board)
+
+def convert_legacy_dir(folder):
+    # 为目录下每个.record生成.events(已存在的跳过)
+    converted = 0
+    for _, path in record_files(folder, suffix=".record"):
+        events_path = path[:-len(".record")] + EVENTS_SUFFIX
+        if os.path.exists(events_path):
+            continue
+        with open(events_path, "wb") as f:
+            for event in parse_legacy_record(path):
+                f.write(encode_frame(event))
+        converted += 1
+    print(f"{folder}: converted {converted} records")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3 or sys.argv[1] != "convert":
+        print("用法: python game_recorder.py convert <record_dir> [<record_dir> ...]")
+        sys.exit(1)
+    for folder in sys.argv[2:]:
+        convert_legacy_dir(folder)
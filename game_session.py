@@ -0,0 +1,252 @@
+import json
+import traceback
+import numpy as np
+
+from game_info import GameInfo, EnemyInfo, TowerInfo
+from game_recorder import GameRecorder
+from strategy import Strategy, StrategyConfig
+from profiler import Timers, NULL_TIMERS, format_sections
+from predictor import Predictor
+from finetune.prompt import generate_system_prompt
+
+class GameSession:
+    # 一局游戏的全部状态: 处理服务器发来的消息, 返回要发送的动作
+    # 不负责网络通信, client.py(同步)和async_client.py(多局并发)共用
+    def __init__(self, game_id, predictor: Predictor, recorder: GameRecorder, action_mode='auto', record_dir="records", debug=False, log_latency=False, strategy_config: StrategyConfig | None = None):
+        self.game_id = game_id
+        self.predictor = predictor
+        self.recorder = recorder
+        self.action_mode = action_mode
+        self.record_dir = record_dir
+        self.debug = debug
+        self.game_info = GameInfo()
+        self.strategy: Strategy | None = None
+        self.strategy_config = strategy_config
+        self.label_pred: dict | None = None
+        self.round_coins = 0
+        self.first_less_than_50 = True
+        self.first_less_than_100 = True
+        self.game_over = False
+        self.game_end = False
+        # 消息耗时统计, 见record_latency; 开启时同时统计各代码段的耗时(profiler.Timers)
+        self.log_latency = log_latency
+        self.timers = Timers() if log_latency else NULL_TIMERS
+        self.round_latency: list[tuple[float, float, float, float]] = []
+        self.last_emit = None
+        # 本次动作新放置的塔的位置, 发出后由after_emit记录
+        self.last_placed: int | None = None
+
+    def round_over(self):
+        if self.strategy is None:
+            return
+        count = sum(1 for x in self.game_info.placed_towers if x is not None)
+        self.recorder.write(f"Round over. Used money: {self.strategy.tot_cost} / {self.round_coins}, Build {count} towers.", debug=self.debug)
+        self.recorder.event("round_over", used=self.strategy.tot_cost, coins=self.round_coins, built=count)
+        self.write_round_latency()
+        self.recorder.flush()
+
+    def record_latency(self, t_recv, t_start, t_decided, t_emitted, action: dict | None):
+        # 一条消息的时间线: 收到(t_recv) -> 开始处理(t_start) -> 决策完成(t_decided) -> 发送完成(t_emitted)
+        # server = 上一次发送完成到这条消息收到, 即等待服务器的时间
+        if not self.log_latency:
+            return
+        server = t_recv - self.last_emit if self.last_emit is not None else 0.0
+        wait, decide, emit = t_start - t_recv, t_decided - t_start, t_emitted - t_decided
+        self.round_latency.append((server, wait, decide, emit))
+        if action is not None:
+            self.last_emit = t_emitted
+        kind = action['type'] if action is not None else 'none'
+        self.recorder.write(f"[LATENCY] action={kind} server={server * 1000:.1f}ms wait={wait * 1000:.1f}ms "
+                            f"decide={decide * 1000:.1f}ms emit={emit * 1000:.1f}ms", debug=self.debug)
+
+    def write_round_latency(self):
+        # 文本中写汇总, timing事件中保存每条消息的耗时, 供profiler.py summary统计分位数
+        if not self.log_latency:
+            return
+        if self.round_latency:
+            lat = np.array(self.round_latency)
+            server, wait, decide, emit = lat.sum(axis=0)
+            own = wait + decide + emit
+            p50, p95 = np.percentile(lat[:, 2], [50, 95]) * 1000
+            self.recorder.write(f"Round latency: {len(lat)} messages, own {own:.2f}s (wait {wait:.2f}s, decide {decide:.2f}s, emit {emit:.2f}s), "
+                                f"server {server:.2f}s, decide p50 {p50:.1f}ms p95 {p95:.1f}ms", debug=self.debug)
+        if self.timers.sections:
+            self.recorder.write(f"Round timers: {format_sections(self.timers.sections)}", debug=self.debug)
+        columns = [[round(v, 6) for v in col] for col in zip(*self.round_latency)] or [[], [], [], []]
+        self.recorder.event("timing", round=self.game_info.round, sections=self.timers.sections,
+                            **dict(zip(("server", "wait", "decide", "emit"), columns)))
+        self.round_latency = []
+        self.timers.reset()
+
+    def on_end(self, data):
+        self.round_over()
+        self.recorder.write("[GAME END] " + str(data), debug=self.debug)
+        self.recorder.event("end", score_pred=data.get('score_pred'), score_game=data.get('score_game'))
+        self.recorder.flush()
+        if self.record_dir != "records": # batch mode
+            with open(f"{self.record_dir}/score.csv", "a", encoding="utf-8") as f:
+                f.write(f"{self.game_id},{data.get('score_pred','')},{data.get('score_game','')}\n")
+        self.game_end = True
+
+    def on_disconnect(self, reason='server disconnected'):
+        self.recorder.write("[CLIENT] Disconnected: " + reason, debug=True)
+        self.recorder.flush()
+        self.game_over = True
+
+    def on_response(self, resp: dict) -> dict | None:
+        # 处理一条response消息, 返回要发送的action; 不需要发送时返回None
+        self.last_placed = None
+        recorder = self.recorder
+        game_info = self.game_info
+        DEBUG = self.debug
+        # 更新游戏信息
+        if resp.get("start_round"):
+            recorder.write("\n\n\n\n==============================", debug=DEBUG)
+            round_num = resp.get("i_round", "?")
+            recorder.write(f"** New round {round_num} started **", debug=DEBUG)
+            if "enemy_name" in resp:
+                recorder.write(f"Enemy Name: {resp['enemy_name']}", debug=DEBUG)
+            if "enemy_description" in resp:
+                recorder.write(f"Enemy Description: {resp['enemy_description']}", debug=DEBUG)
+            recorder.write(f"Coins: {resp.get('n_coins', '?')}", debug=DEBUG)
+            self.round_coins = resp.get('n_coins', 0)
+            self.round_over()
+            recorder.event("round_start", round=resp.get("i_round"), enemy_name=resp.get("enemy_name"),
+                           enemy_description=resp.get("enemy_description"), coins=resp.get("n_coins"))
+            # 更新game_info
+            game_info.set_round(resp.get("i_round", 0))
+            if "enemy_name" in resp or "enemy_description" in resp:
+                enemy = EnemyInfo(
+                    name=resp.get("enemy_name", ""),
+                    best_atk_spd=resp.get("best_atk_spd", []),
+                    weak=resp.get("weak", []),
+                    resist=resp.get("resist", []),
+                    special_eff=resp.get("special_eff", []),
+                    slow_eff=resp.get("slow_eff", []),
+                    occurrence=resp.get("occurrence", [])
+                )
+                game_info.add_enemy(enemy)
+            game_info.set_coins(resp.get("n_coins", 0))
+            self.first_less_than_50 = True
+            self.first_less_than_100 = True
+            game_info.clear_placed_towers()
+            if 'store' in resp:
+                game_info.update_store(resp['store'])
+        else:
+            if 'towers_list' in resp:
+                recorder.write(f"Towers: {resp['towers_list']}", debug=DEBUG)
+                if 'map' in resp:
+                    recorder.write(f"Map: {resp['map']['map']}", debug=DEBUG)
+                    recorder.write(f"Placement Options: {resp['map']['extra']}", debug=DEBUG)
+                    recorder.write("==============================", debug=DEBUG)
+                    recorder.event("map", towers=resp['towers_list'], map=resp['map'].get('map', []), placement_options=resp['map'].get('extra', []))
+                    game_info.set_map(resp['map'].get('map', []))
+                    game_info.set_placement_options(resp['map'].get('extra', []))
+                # 填充已放置塔信息
+                game_info.towers = []
+                for tower in resp['towers_list']:
+                    game_info.add_tower(TowerInfo.from_payload(tower))
+                with self.timers.section("strategy_init"):
+                    self.strategy = Strategy(game_info, self.strategy_config, timers=self.timers)
+            recorder.write(f"Coins: {resp['n_coins']}", debug=DEBUG)
+            if resp['n_coins'] <= 50 and self.first_less_than_50:
+                self.first_less_than_50 = False
+                ls, total_dmg = self.strategy.get_history_dmgs(EnemyInfo(name='', **self.label_pred), game_info)
+                self.strategy.get_tower_gains(EnemyInfo(name='', **self.label_pred), game_info)
+                recorder.write(f"History tower damages(coin <= 50): {ls}; Total damage: {total_dmg}", debug=DEBUG)
+            if resp['n_coins'] <= 100 and self.first_less_than_100:
+                self.first_less_than_100 = False
+                ls, total_dmg = self.strategy.get_history_dmgs(EnemyInfo(name='', **self.label_pred), game_info)
+                self.strategy.get_tower_gains(EnemyInfo(name='', **self.label_pred), game_info)
+                recorder.write(f"History tower damages(coin <= 100): {ls}; Total damage: {total_dmg}", debug=DEBUG)
+            game_info.set_coins(resp.get('n_coins', 0))
+            if 'store' in resp:
+                recorder.write("Store: " + str(resp["store"]), debug=DEBUG)
+                recorder.write("shop size = " + str(len(resp["store"])), debug=DEBUG)
+                recorder.event("store", coins=resp['n_coins'], store=resp['store'])
+                game_info.update_store(resp['store'])
+
+        if resp.get("game_over"):
+            game_info.debug_print()
+            self.game_over = True
+            recorder.write("** Game Over **", debug=DEBUG)
+
+        cmd = None
+        if 'enemy_description' in resp:
+            game_info.stories.append(resp['enemy_description'])
+            cmd = 'predict'
+            with self.timers.section("predict"):
+                label_pred_str = self.predictor.infer(
+                    prompt=generate_system_prompt(resp.get("enemy_name", ""), game_info.stories),
+                    game_id=self.game_id,
+                    round_id=game_info.round
+                )
+            self.label_pred = json.loads(label_pred_str)
+        else:
+            if self.action_mode == 'input':
+                if not self.game_over:
+                    cmd = input("\nEnter action ('refresh' or 'buy item_idx bag_idx' or 'end'): ").strip()
+            else:
+                # ====== TODO_strategy: 下面可以改成自己的代码，用于处理决策
+                game_info.update_store(resp['store'])
+                game_info.coins = resp['n_coins']
+                with self.timers.section("get_action"):
+                    cmd = self.strategy.get_action(EnemyInfo(name='', **self.label_pred), game_info)
+                # ====== 上面可以改成自己的代码，用于处理决策
+        if cmd is None:
+            return None
+
+        action = self.parse_command(cmd, resp)
+        if action is None or self.game_over:
+            return None
+        recorder.write("[User Action] " + str(action), debug=DEBUG)
+        recorder.event("action", action=action)
+        if action["type"] == "buy":
+            # 只有确定发出的购买才由after_emit记录
+            self.last_placed = action["bag_idx"]
+        return action
+
+    def parse_command(self, cmd: str, resp: dict) -> dict | None:
+        # 把命令转成action并同步更新game_info, 命令非法时返回None
+        game_info = self.game_info
+        if cmd.lower() == "refresh":
+            action = {"type": "refresh"}
+        elif cmd.lower() == "end":
+            action = {"type": "end"}
+        elif cmd.lower() == "predict":
+            label_pred = self.label_pred
+            action = {"type": "predict", "label_pred": label_pred}
+            game_info.update_enemy(
+                name=resp.get("enemy_name", ""),
+                best_atk_spd=label_pred.get('best_atk_spd', None),
+                weak=label_pred.get('weak', None),
+                resist=label_pred.get('resist', None),
+                special_eff=label_pred.get('special_eff', None),
+                slow_eff=label_pred.get('slow_eff', None),
+                occurrence=label_pred.get('occurrence', None)
+            )
+        elif cmd.lower().startswith("buy"):
+            try:
+                _, item_idx, bag_idx = cmd.split()
+                action = {"type": "buy", "item_idx": int(item_idx), "bag_idx": int(bag_idx)}
+                item = game_info.get_store_item(int(item_idx))
+                tower_idx = item.get('type', 0)
+                tower = game_info.get_tower_item(tower_idx)
+                game_info.set_placed_tower_item(int(bag_idx), tower.placed(item, int(bag_idx)))
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Invalid buy command {cmd}. Example: buy 0 1")
+                return None
+        else:
+            print("Unknown command")
+            return None
+        return action
+
+    def after_emit(self):
+        # 动作发出后只记录新放置的塔(增量), 完整棋盘由回合内的place事件累积得到
+        if self.last_placed is None:
+            return
+        idx, self.last_placed = self.last_placed, None
+        attrs = self.game_info.placed_towers[idx].to_payload()
+        self.recorder.write(f"[PLACE] {idx} {json.dumps(attrs, ensure_ascii=False)}", debug=self.debug)
+        self.recorder.event("place", position=idx, tower=attrs)
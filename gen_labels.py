@@ -1,36 +1,8 @@
 import re
 import sys
 import os
-import numpy as np
-
-def get_record_files(folder):
-    files = []
-    for fname in os.listdir(folder):
-        if fname.endswith('.record'):
-            # 解析game_id
-            parts = fname.split('_')
-            try:
-                for i, p in enumerate(parts):
-                    if p == 'game' and i+1 < len(parts):
-                        game_id = int(parts[i+1].split('.')[0])
-                        break
-                else:
-                    game_id = -1
-            except Exception:
-                game_id = -1
-            fpath = os.path.join(folder, fname)
-            files.append((game_id, fpath))
-    files.sort(key=lambda x: x[0])  # 按game_id排序
-    return [f[1] for f in files]
-
-def extract_attrs_from_file(fpath, pattern):
-    results = []
-    with open(fpath, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = pattern.search(line)
-            if match:
-                results.append(match.group(1))
-    return results
+from finetune.dataset import write_labels
+from record_index import RecordIndex
 
 if len(sys.argv) != 2:
     print(f"用法: python extract_monster_attrs.py <record_folder>")
@@ -39,23 +11,23 @@ if len(sys.argv) != 2:
 folder = sys.argv[1]
 if folder.startswith("record_"):
     # 生成test_label（即未公开数据的label）
-    pattern = re.compile(r"\[User Action\] \{'type': 'predict', 'label_pred': (\{.*?\})\}")
-    record_files = get_record_files(folder)
-    assert len(record_files) == 200, f"必须完成每局游戏，实际只有 {len(record_files)} 个记录文件"
-
-    all_attrs = []
-    for fpath in record_files:
-        attrs = extract_attrs_from_file(fpath, pattern)
-        assert len(attrs) == 3, f"文件 {fpath} 匹配到 {len(attrs)} 个pattern，需为3"
-        for a in attrs:
-            # 直接用eval转为dict（假定输入可信）
-            all_attrs.append(eval(a))
+    # 通过记录索引查询, 旧的.record文本和重试产生的重复记录由索引处理
+    index = RecordIndex()
+    index.ingest_dir(folder)
+    run = index.run_key(folder)
+    n_games = index.query("SELECT COUNT(*) FROM games WHERE run_dir = ?", (run,))[0][0]
+    assert n_games == 200, f"必须完成每局游戏，实际只有 {n_games} 局记录"
+    for game_id, n in index.query("SELECT g.game_id, COUNT(p.round) FROM games g LEFT JOIN predictions p "
+                                  "ON p.run_dir = g.run_dir AND p.game_id = g.game_id WHERE g.run_dir = ? GROUP BY g.game_id",
+                                  (run,)):
+        assert n == 3, f"第 {game_id} 局中有 {n} 次预测，需为3"
+    all_attrs = [label for _, _, label in index.predictions(folder)]
+    index.close()
 
     assert len(all_attrs) == 600, f"总共应有600个匹配，实际{len(all_attrs)}"
-    # 保存为npy
-    out_path = os.path.join(folder, "labels.npy")
-    np.save(out_path, np.array(all_attrs, dtype=object))
-    print(f"已保存 {len(all_attrs)} 条属性到 {out_path}")
+    # 保存为数据集格式
+    write_labels(folder, all_attrs)
+    print(f"已保存 {len(all_attrs)} 条属性到 {folder}/labels.u32.npy")
 elif folder.startswith("predict_"):
     # 生成val_label（val文件夹的预测label）
     # 补全缺失
@@ -96,10 +68,9 @@ elif folder.startswith("predict_"):
             all_attrs[i] = empty_label.copy()
             fill_count += 1
     print(f"填充了 {fill_count} 个缺失的标签")
-    # 保存为npy
-    out_path = os.path.join(folder, "labels.npy")
-    np.save(out_path, np.array(all_attrs, dtype=object))
-    print(f"已保存 {len(all_attrs)} 条属性到 {out_path}")
+    # 保存为数据集格式
+    write_labels(folder, all_attrs)
+    print(f"已保存 {len(all_attrs)} 条属性到 {folder}/labels.u32.npy")
 else:
     print(f"目录名应以 record_ 或 predict_ 开头")
     sys.exit(1)
\ No newline at end of file
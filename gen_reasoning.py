@@ -1,14 +1,15 @@
 import os
 import json
 from openai import OpenAI
-import numpy as np
+from finetune.dataset import GameDataset
 from finetune.prompt import generate_reasoning_prompt
 from predictor import LLMReasoning
 predictor = LLMReasoning()
 
-names = np.load("data/game/merge/names.npy", allow_pickle=True)
-labels = np.load("data/game/merge/labels.npy", allow_pickle=True)
-data = np.load("data/game/merge/data.npy", allow_pickle=True)
+dataset = GameDataset("data/game/merge")
+names = dataset.names
+labels = dataset.labels
+data = dataset.data
 
 L, R = (950, 1000)
 results_list = []
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+# 地图几何预处理结果(路径采样点 + 覆盖表)的缓存
+# 同一进程内的后续回合直接复用内存中的数组, 不同client.py进程之间通过CACHE_DIR下的.npz文件共享
+# CACHE_DIR设为None时只使用内存缓存
+# AsyncClient在多个线程中建立Strategy, _memory的读写都要持有_lock
+CACHE_DIR = "geometry_cache"
+MEMORY_LIMIT = 64
+_memory: dict[str, dict[str, np.ndarray]] = {}
+_lock = threading.Lock()
+
+def geometry_key(map_points, placement_options, seg_dist, max_radius) -> str:
+    content = json.dumps({
+        "map": map_points,
+        "placement_options": placement_options,
+        "seg_dist": seg_dist,
+        "max_radius": max_radius,
+    }, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def _remember(key, arrays):
+    for v in arrays.values():
+        v.flags.writeable = False  # 多个Geometry共享, 禁止原地修改
+    with _lock:
+        if key not in _memory and len(_memory) >= MEMORY_LIMIT:
+            _memory.pop(next(iter(_memory)))
+        _memory[key] = arrays
+
+def load(key, cache_dir=None) -> dict[str, np.ndarray] | None:
+    with _lock:
+        arrays = _memory.get(key)
+    if arrays is not None:
+        return arrays
+    cache_dir = cache_dir or CACHE_DIR
+    if not cache_dir:
+        return None
+    path = os.path.join(cache_dir, f"{key}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as f:
+            arrays = {k: f[k] for k in f.files}
+    except Exception as e:
+        print(f"[geometry_cache] Failed to load {path}: {e}")
+        return None
+    _remember(key, arrays)
+    return arrays
+
+def save(key, arrays: dict[str, np.ndarray], cache_dir=None):
+    _remember(key, arrays)
+    cache_dir = cache_dir or CACHE_DIR
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.npz")
+    # 先写临时文件再改名, 避免并行的client进程读到写了一半的文件
+    # 临时文件名由mkstemp生成, 同一进程的多个线程同时保存同一个key也不会冲突
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
@@ -1,7 +1,7 @@
 import os
 import json
 from openai import OpenAI
-import numpy as np
+from finetune.dataset import GameDataset
 from finetune.prompt import generate_reasoning_prompt
 CONTENT = '''
 You are a strategic game analyst for a tower defense game that unfolds over multiple rounds. Information about future enemies may appear early, woven into the lore across 1 to 3 interconnected stories. Your job is to extract precise attributes for a specific monster-which will be named by the user-by analyzing all provided story passages as a single, unified context.
@@ -211,9 +211,10 @@ def infer_max(content: str):
 #         "chunk_usage": token_usage
 #     }
 
-names = np.load("data/game/train/names.npy", allow_pickle=True)
-labels = np.load("data/game/train/labels.npy", allow_pickle=True)
-data = np.load("data/game/train/data.npy", allow_pickle=True)
+dataset = GameDataset("data/game/train")
+names = dataset.names
+labels = dataset.labels
+data = dataset.data
 
 L, R = (0, 1)
 results_list = []
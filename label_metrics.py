@@ -0,0 +1,83 @@
+import numpy as np
+
+from finetune.dataset import LABEL_FIELDS, FIELD_LAYOUT, encode_label
+
+# 标签统计的向量化实现, 输入为finetune.dataset中按位打包的uint32标签
+# 所有函数都支持前置的批维度: 例如preds为(D, N)时一次比较D个预测目录
+# 单选属性展开为one-hot, 多选属性展开为multi-hot, 形状(..., N, K)
+
+LABEL_KEYS = [key for key, _, _ in LABEL_FIELDS]
+OPTIONS = {key: options for key, options, _ in LABEL_FIELDS}
+SINGLE_KEYS = [key for key, _, multi in LABEL_FIELDS if not multi]
+MULTI_KEYS = [key for key, _, multi in LABEL_FIELDS if multi]
+
+def encode_dicts(labels) -> np.ndarray:
+    return np.array([encode_label(label) for label in labels], dtype=np.uint32)
+
+def unpack(codes) -> dict[str, np.ndarray]:
+    codes = np.asarray(codes, dtype=np.uint32)
+    mats = {}
+    for key, options, multi in LABEL_FIELDS:
+        shift, width = FIELD_LAYOUT[key]
+        bits = (codes >> np.uint32(shift)) & np.uint32((1 << width) - 1)
+        if multi:
+            mats[key] = (bits[..., None] >> np.arange(len(options), dtype=np.uint32)) & 1 == 1
+        else:
+            mats[key] = bits[..., None] == np.arange(1, len(options) + 1, dtype=np.uint32)
+    return mats
+
+def default_class(key) -> int:
+    # 单选属性为空时按"Normal"处理, 没有Normal的属性取第一个选项
+    options = OPTIONS[key]
+    return options.index("Normal") if "Normal" in options else 0
+
+def class_index(onehot: np.ndarray, default=0) -> np.ndarray:
+    return np.where(onehot.any(axis=-1), onehot.argmax(axis=-1), default)
+
+def confusion_matrix(label_onehot: np.ndarray, pred_onehot: np.ndarray, default=0) -> np.ndarray:
+    # (..., K, K), 行为标签, 列为预测
+    k = label_onehot.shape[-1]
+    eye = np.eye(k, dtype=np.int64)
+    lab = eye[class_index(label_onehot, default)]
+    pred = eye[class_index(pred_onehot, default)]
+    return np.einsum("...nk,...nj->...kj", lab, pred)
+
+def confusion_counts(conf: np.ndarray):
+    # 由混淆矩阵得到每个类别的TP, FP, FN, TN, 形状(..., K)
+    tp = np.diagonal(conf, axis1=-2, axis2=-1)
+    fp = conf.sum(axis=-2) - tp
+    fn = conf.sum(axis=-1) - tp
+    tn = conf.sum(axis=(-2, -1))[..., None] - tp - fp - fn
+    return tp, fp, fn, tn
+
+def binary_counts(label_mh: np.ndarray, pred_mh: np.ndarray):
+    # 多选属性每个选项的TP, FP, FN, TN, 形状(..., K)
+    tp = (label_mh & pred_mh).sum(axis=-2)
+    fp = (~label_mh & pred_mh).sum(axis=-2)
+    fn = (label_mh & ~pred_mh).sum(axis=-2)
+    tn = (~label_mh & ~pred_mh).sum(axis=-2)
+    return tp, fp, fn, tn
+
+def _ratio(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=b > 0)
+
+def prf(tp, fp, fn, tn):
+    # 返回acc, precision, recall, f1, 分母为0时记0
+    acc = _ratio(tp + tn, tp + fp + fn + tn)
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1 = _ratio(2 * precision * recall, precision + recall)
+    return acc, precision, recall, f1
+
+def jaccard_scores(label_codes, pred_codes) -> np.ndarray:
+    # 官方评分: 每个属性的交集/并集 * 100, 并集为空记100; 返回(..., N, 6), 顺序同LABEL_KEYS
+    labels = unpack(label_codes)
+    preds = unpack(pred_codes)
+    scores = []
+    for key in LABEL_KEYS:
+        inter = (labels[key] & preds[key]).sum(axis=-1)
+        union = (labels[key] | preds[key]).sum(axis=-1)
+        scores.append(np.where(union > 0, _ratio(inter, union), 1.0) * 100)
+    return np.stack(scores, axis=-1)
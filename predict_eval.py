@@ -1,6 +1,13 @@
 import json
 import os
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from predictor import LLMPredictor, DummyPredictor
+from prediction_cache import PredictionCache, CachedPredictor
+from finetune.dataset import encode_label
+from label_metrics import LABEL_KEYS, encode_dicts, jaccard_scores
 from datetime import datetime
 now = datetime.now()
 date_str = now.strftime("%m%d_%H%M")
@@ -8,76 +15,97 @@ predict_dir = f'predict_{date_str}'
 ERR_CNT = 0
 
 def score_prediction(pred: dict, label: dict) -> dict:
-    keys = ["best_atk_spd", "weak", "resist", "special_eff", "slow_eff", "occurrence"]
-    scores = {}
-    for key in keys:
-        pred_set = set(pred.get(key, []))
-        label_set = set(label.get(key, []))
-        intersection = len(pred_set & label_set)
-        union = len(pred_set | label_set)
-        score = (intersection / union if union > 0 else 1.0) * 100
-        scores[key] = score
-    scores['avg'] = sum(scores.values()) / len(keys)
+    scores = dict(zip(LABEL_KEYS, jaccard_scores(encode_label(label), encode_label(pred)).tolist()))
+    scores['avg'] = sum(scores.values()) / len(LABEL_KEYS)
     return scores
 
 def score_game(pred_list, label_list):
     # pred_list, label_list: List[dict]，每局三轮
     assert len(pred_list) == len(label_list)
-    total = 0
-    for pred, label in zip(pred_list, label_list):
-        total += score_prediction(pred, label)['avg']
-    return total  # 范围[0, 300]
+    return float(jaccard_scores(encode_dicts(label_list), encode_dicts(pred_list)).mean(axis=-1).sum())  # 范围[0, 300]
 
 def compare_predictors(vllm: LLMPredictor, dummy: DummyPredictor, prompt, game_id, round_id):
     vllm_result_str = vllm.infer(prompt, game_id=game_id, round_id=round_id)
     if vllm_result_str is None:
-        return None, None, None
+        return None, None
     vllm_result_str = vllm_result_str.replace("'", '"')
     dummy_result_str = dummy.infer(prompt, game_id=game_id, round_id=round_id)
     vllm_result = json.loads(vllm_result_str)
     dummy_result = json.loads(dummy_result_str)
-    scores = score_prediction(vllm_result, dummy_result)
     # print(f"LLMPredictor预测: {vllm_result}")
     # print(f"DummyPredictor标答: {dummy_result}")
-    print(f"各项得分: {scores}")
-    return vllm_result, dummy_result, scores
+    return vllm_result, dummy_result
 
 # 批量评测与结果保存
 
-def batch_eval(vllm: LLMPredictor, dummy: DummyPredictor, prompts, game_ids, round_ids, out_dir):
+def batch_eval(vllm: LLMPredictor, dummy: DummyPredictor, prompts, game_ids, round_ids, out_dir, concurrency=1):
+    # concurrency > 1 时同时发出多个请求, 利用vLLM的continuous batching; 结果仍按(game_id, round_id)顺序写出
     global ERR_CNT
     os.makedirs(out_dir, exist_ok=True)
     model_name = vllm.get_model_name()
     with open(os.path.join(out_dir, "model_name.txt"), "w", encoding="utf-8") as f_model_name:
         f_model_name.write(model_name if model_name else "Unknown Model")
+
+    def evaluate(prompt, gid, rid):
+        print(f"Evaluating Game {gid}, Round {rid}...")
+        t0 = time.perf_counter()
+        # 单条请求或解析失败只记为无效, 不影响其他prompt的结果
+        try:
+            result = compare_predictors(vllm, dummy, prompt, gid, rid)
+        except Exception as e:
+            print(f"Game {gid}, Round {rid} failed: {e!r}")
+            result = None, None
+        return result, time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(evaluate, prompts, game_ids, round_ids))
+    elapsed = time.perf_counter() - start
+
+    # 所有结果一起打分; 无法编码(含非法取值)的预测记为无效
+    rows = []
+    for gid, rid, ((vllm_pred, dummy_label), _) in sorted(zip(game_ids, round_ids, results), key=lambda x: (x[0], x[1])):
+        try:
+            rows.append((gid, rid, vllm_pred, dummy_label, encode_label(vllm_pred), encode_label(dummy_label)))
+        except (ValueError, AttributeError):
+            print(f"Skipping Game {gid}, Round {rid} due to invalid prediction.")
+            ERR_CNT += 1
+    scores = jaccard_scores(np.array([r[5] for r in rows], dtype=np.uint32), np.array([r[4] for r in rows], dtype=np.uint32)).reshape(len(rows), len(LABEL_KEYS))
+
     result_path = os.path.join(out_dir, "predict_results.csv")
     score_path = os.path.join(out_dir, "predict_scores.csv")
     with open(result_path, "w", encoding="utf-8") as f_res, open(score_path, "w", encoding="utf-8") as f_score:
         # 写表头
         f_res.write("game_id,round_id,vllm_pred,dummy_label\n")
         f_score.write("game_id,round_id,best_atk_spd,weak,resist,special_eff,slow_eff,occurrence,avg\n")
-        for prompt, gid, rid in zip(prompts, game_ids, round_ids):
-            print(f"Evaluating Game {gid}, Round {rid}...")
-            vllm_pred, dummy_label, scores = compare_predictors(vllm, dummy, prompt, gid, rid)
-            if scores is None: 
-                print(f"Skipping Game {gid}, Round {rid} due to invalid prediction.")
-                ERR_CNT += 1
-                continue
+        for (gid, rid, vllm_pred, dummy_label, _, _), row in zip(rows, scores):
             f_res.write(f"{gid},{rid},{json.dumps(vllm_pred, ensure_ascii=False)},{json.dumps(dummy_label, ensure_ascii=False)}\n")
-            f_score.write(f"{gid},{rid},{scores['best_atk_spd']:.2f},{scores['weak']:.2f},{scores['resist']:.2f},{scores['special_eff']:.2f},{scores['slow_eff']:.2f},{scores['occurrence']:.2f},{scores['avg']:.2f}\n")
+            f_score.write(f"{gid},{rid}," + ",".join(f"{v:.2f}" for v in row) + f",{row.mean():.2f}\n")
+
+    if len(rows):
+        print("各项平均得分: " + ", ".join(f"{key} {v:.2f}" for key, v in zip(LABEL_KEYS, scores.mean(axis=0))) + f", avg {scores.mean():.2f}")
+    latencies = [t for _, t in results]
+    if latencies:
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"Evaluated {len(results)} prompts in {elapsed:.1f}s ({len(results) / elapsed:.2f} prompts/s, concurrency {concurrency}), "
+              f"latency p50 {p50:.2f}s p95 {p95:.2f}s")
 
 # 用法示例
 if __name__ == "__main__":
-    import numpy as np
-    from finetune.prompt import generate_system_prompt
+    from finetune.prompt import generate_system_prompt, PROMPT_LAYOUT, PROMPT_LAYOUTS
+    from finetune.dataset import GameDataset
 
-    # names = np.load("data/game/val/names.npy", allow_pickle=True)
-    # labels = np.load("data/game/val/labels.npy", allow_pickle=True)
-    # data = np.load("data/game/val/data.npy", allow_pickle=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default=16, type=int, help="同时发出的请求数, 1为逐条评测")
+    parser.add_argument("--prediction_cache", default=None, type=str, help="预测结果缓存文件(sqlite), 不指定则不缓存")
+    parser.add_argument("--cache_model", default=None, type=str, help="缓存使用的模型名; 指定后缓存全部命中时不需要启动LLM服务")
+    parser.add_argument("--layout", default=PROMPT_LAYOUT, choices=PROMPT_LAYOUTS, help="prompt格式, 需与模型训练时一致")
+    args = parser.parse_args()
 
-    names = np.load("data/data/names.npy", allow_pickle=True)
-    labels = np.load("data/data/labels.npy", allow_pickle=True)
-    data = np.load("data/data/data.npy", allow_pickle=True)
+    # dataset = GameDataset("data/game/val")
+    dataset = GameDataset("data/data")
+    names = dataset.names
+    data = dataset.data
 
     prompts = []
     game_ids = []
@@ -88,12 +116,18 @@ if __name__ == "__main__":
         for j in range(3):
             name = names[i + j]
             stories.append(data[i + j])
-            prompts.append(generate_system_prompt(name, stories))
+            prompts.append(generate_system_prompt(name, stories, layout=args.layout))
             game_ids.append(i // 3)
             round_ids.append(j + 1)
 
-    vllm = LLMPredictor()
+    if args.prediction_cache:
+        vllm = CachedPredictor(PredictionCache(args.prediction_cache), lambda: LLMPredictor(pool_size=max(16, args.concurrency)),
+                               model_name=args.cache_model, params={"enable_thinking": False, "num_candidates": 1, "use_n": True})
+    else:
+        vllm = LLMPredictor(pool_size=max(16, args.concurrency))
     # dummy = DummyPredictor(answer_dir="data/game/val")
     dummy = DummyPredictor(answer_dir="data/data")
-    batch_eval(vllm, dummy, prompts, game_ids, round_ids, predict_dir)
+    batch_eval(vllm, dummy, prompts, game_ids, round_ids, predict_dir, concurrency=args.concurrency)
     print(f"Total invalid predictions skipped: {ERR_CNT}")
+    if args.prediction_cache:
+        print(vllm.cache.stats())
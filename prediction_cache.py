@@ -0,0 +1,134 @@
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Callable
+
+from checker import MonsterAttributeChecker
+from predictor import Predictor, DEFAULT_SAMPLING
+
+# 预测结果的持久化缓存, 键为(模型名, prompt, 采样参数)的哈希
+# 同一模型下重复跑client_r.py / predict_eval.py时直接复用之前的答案, 命中时不需要LLM服务
+# 多个client.py进程可以共用同一个文件(sqlite自带文件锁)
+# 只缓存通过level 2检查的结果, fallback答案不写入, 下次仍然重新请求
+
+CACHE_PATH = "prediction_cache.sqlite"
+MAX_ENTRIES = 200000
+
+class PredictionCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, model TEXT, result TEXT, created REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON predictions(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt, params: dict) -> str:
+        text = json.dumps([model, prompt, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key) -> str | None:
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM predictions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, model, result):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)", (key, model, result, now, now))
+            self.conn.commit()
+            self.evict()
+
+    def evict(self):
+        # 超出上限时删除最久未使用的条目, 多删10%避免每次写入都触发
+        count = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        n_remove = count - int(self.max_entries * 0.9)
+        self.conn.execute(
+            "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY last_used LIMIT ?)", (n_remove,))
+        self.conn.commit()
+
+    def stats(self) -> str:
+        with self.lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return f"Prediction cache {self.path}: {count} entries, {self.hits} hits / {self.misses} misses ({hit_rate:.1f}% hit)"
+
+    def close(self):
+        self.conn.close()
+
+class CachedPredictor(Predictor):
+    # 在任意Predictor外包一层缓存
+    # model_name为None时立即创建predictor并用get_model_name()作为模型名;
+    # 指定model_name时predictor在第一次未命中时才创建, 全部命中则不需要LLM服务
+    # params: 影响结果的predictor参数(如enable_thinking, num_candidates, use_n), 与infer的采样参数一起参与键的计算
+    #   采样参数未指定时按DEFAULT_SAMPLING计算, 显式传入默认值和不传得到同一个键
+    def __init__(self, cache: PredictionCache, make_predictor: Callable[[], Predictor], model_name=None, params=None):
+        self.cache = cache
+        self.make_predictor = make_predictor
+        self.params = params or {}
+        self.predictor = None
+        self.lock = threading.Lock()
+        self.checker = MonsterAttributeChecker()
+        if model_name is None:
+            model_name = self.get_predictor().get_model_name()
+        self.model_name = model_name
+
+    def get_predictor(self) -> Predictor:
+        with self.lock:
+            if self.predictor is None:
+                self.predictor = self.make_predictor()
+            return self.predictor
+
+    def get_model_name(self):
+        return self.model_name
+
+    def infer(self, prompt, **kargs) -> str:
+        # game_id/round_id只用于记录, 不影响LLM的输出
+        params = {k: v for k, v in kargs.items() if k not in ("game_id", "round_id")}
+        key = PredictionCache.make_key(self.model_name, prompt, {**DEFAULT_SAMPLING, **self.params, **params})
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        result = self.get_predictor().infer(prompt, **kargs)
+        ok, _ = self.checker.check(result)
+        if ok:
+            self.cache.put(key, self.model_name, result)
+        return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["stats", "models", "clear"], help="stats: 条目数; models: 各模型的条目数; clear: 清空")
+    parser.add_argument("--path", default=CACHE_PATH, type=str)
+    args = parser.parse_args()
+
+    cache = PredictionCache(args.path)
+    if args.command == "stats":
+        print(cache.stats())
+    elif args.command == "models":
+        for model, count in cache.conn.execute("SELECT model, COUNT(*) FROM predictions GROUP BY model"):
+            print(f"{model}: {count}")
+    else:
+        cache.conn.execute("DELETE FROM predictions")
+        cache.conn.commit()
+        print(f"Cleared {args.path}")
+    cache.close()
@@ -1,27 +1,49 @@
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from checker import MonsterAttributeChecker
 import subprocess
 import requests
+import requests.adapters
 import time
 import numpy as np
+from finetune.dataset import GameDataset
+
+# LLMPredictor未指定时的采样参数, CachedPredictor计算键时也要用到
+DEFAULT_SAMPLING = {"max_tokens": 8192, "temperature": 0.7}
+# 请求失败后第i次重试前等待RETRY_DELAY * i秒
+RETRY_DELAY = 1.0
 
 class Predictor:
     def infer(self, prompt, **kargs) -> str:
         raise NotImplementedError
     
 class LLMPredictor(Predictor):
-    def __init__(self, port=8000, host="127.0.0.1", extra_args=None):
+    # num_candidates: 每轮采样k个候选, 取第一个通过checker的结果
+    # use_n=True(默认)时用一次请求的n=k参数采样; False时并发发送k个请求(先返回先检查),
+    # 但已经发出的落选请求无法中止, 会继续占用vLLM和连接直到完成或超时
+    # timeout: requests的(连接, 读取)超时, 单位秒; pool_size: 连接池大小, 默认按num_candidates估计
+    def __init__(self, port=8000, host="127.0.0.1", extra_args=None, num_candidates=1, use_n=True, max_attempts=5, timeout=(5, 300), pool_size=None):
         self.port = port
         self.host = host
         self.extra_args = extra_args or {}
         self.enable_thinking = self.extra_args.get("enable_thinking", False)
+        self.num_candidates = num_candidates
+        self.use_n = use_n
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        # 复用keep-alive连接, 避免每次请求重新建立连接
+        self.pool_size = pool_size = pool_size or max(16, num_candidates * 4)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
         self._wait_until_ready()
         self.checker = MonsterAttributeChecker()
         # 查询/v1/models获取model名称
         url = f"http://{self.host}:{self.port}/v1/models"
         try:
-            resp = requests.get(url, timeout=5)
+            resp = self.session.get(url, timeout=5)
             resp.raise_for_status()
             models = resp.json().get("data", [])
             if models and "id" in models[0]:
@@ -52,7 +74,7 @@ class LLMPredictor(Predictor):
         url = f"http://{self.host}:{self.port}/health"
         for _ in range(timeout):
             try:
-                resp = requests.get(url, timeout=2)
+                resp = self.session.get(url, timeout=2)
                 if resp.status_code == 200:
                     print("LLM server is ready.")
                     return
@@ -60,8 +82,7 @@ class LLMPredictor(Predictor):
                 time.sleep(1)
         raise RuntimeError("LLM server did not start in time.")
 
-    def infer(self, prompt, **kargs) -> str:
-        url = f"http://{self.host}:{self.port}/v1/chat/completions"
+    def _payload(self, prompt, kargs, n=1) -> dict:
         if not self.model_name:
             raise RuntimeError("Model name not set. Cannot call chat/completions.")
         payload = {
@@ -69,37 +90,93 @@ class LLMPredictor(Predictor):
             "messages": [
                 {"role": "user", "content": prompt}
             ],
-            "max_tokens": kargs.get("max_tokens", 8192),
-            "temperature": kargs.get("temperature", 0.7),
+            "max_tokens": kargs.get("max_tokens", DEFAULT_SAMPLING["max_tokens"]),
+            "temperature": kargs.get("temperature", DEFAULT_SAMPLING["temperature"]),
         }
-        
-        fallback_ans = None
-        for attempt in range(5):
-            resp = requests.post(url, json=payload)
-            resp.raise_for_status()
-            result = resp.json()["choices"][0]
-            # chat/completions接口返回的是message.content
-            result_text = result["message"]["content"] if "message" in result else result.get("text", "")
-            result_text = result_text.replace("'", '"')
-            if self.enable_thinking:
-                answer_idx = result_text.find('[ANSWER]')
-                if answer_idx != -1:
-                    answer = result_text[answer_idx + len('[ANSWER]'):].strip()
-                    result_text = answer
-
-            ok, msg = self.checker.check(result_text)
-            if ok:
+        if n > 1:
+            payload["n"] = n
+        return payload
+
+    def _parse_choice(self, result: dict) -> str:
+        # chat/completions接口返回的是message.content
+        result_text = result["message"]["content"] if "message" in result else result.get("text", "")
+        result_text = result_text.replace("'", '"')
+        if self.enable_thinking:
+            answer_idx = result_text.find('[ANSWER]')
+            if answer_idx != -1:
+                answer = result_text[answer_idx + len('[ANSWER]'):].strip()
+                result_text = answer
+        return result_text
+
+    def _post(self, payload) -> list[str]:
+        url = f"http://{self.host}:{self.port}/v1/chat/completions"
+        resp = self.session.post(url, json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return [self._parse_choice(c) for c in resp.json()["choices"]]
+
+    def _check(self, result_text, state: dict) -> bool:
+        # 通过level 2检查返回True; 只通过level 1的结果记为fallback
+        ok, msg = self.checker.check(result_text)
+        if ok:
+            return True
+        ok1, msg1 = self.checker.check(result_text, level=1)
+        if ok1:
+            state["fallback"] = result_text
+        state["msg"] = msg
+        return False
+
+    def _sample_round(self, prompt, kargs, state: dict) -> str | None:
+        # 请求失败与检查不通过一样算作本轮失败; state["replies"]累计收到的回复数
+        k = self.num_candidates
+        if k == 1 or self.use_n:
+            try:
+                texts = self._post(self._payload(prompt, kargs, n=k))
+            except requests.RequestException as e:
+                state["msg"] = repr(e)
+                return None
+            state["replies"] += 1
+            for result_text in texts:
+                if self._check(result_text, state):
+                    return result_text
+            return None
+        futures = [self.executor.submit(self._post, self._payload(prompt, kargs)) for _ in range(k)]
+        try:
+            for fut in as_completed(futures):
+                try:
+                    texts = fut.result()
+                except requests.RequestException as e:
+                    state["msg"] = repr(e)
+                    continue
+                state["replies"] += 1
+                if self._check(texts[0], state):
+                    return texts[0]
+        finally:
+            # 已经拿到结果时只能取消尚未开始的请求, 已经发出的请求会继续运行直到完成或超时
+            for fut in futures:
+                fut.cancel()
+        return None
+
+    def infer(self, prompt, **kargs) -> str:
+        state = {"fallback": None, "msg": "", "replies": 0}
+        for attempt in range(self.max_attempts):
+            replies = state["replies"]
+            result_text = self._sample_round(prompt, kargs, state)
+            if result_text is not None:
                 return result_text
-            else:
-                ok1, msg1 = self.checker.check(result_text, level=1)
-                if ok1:
-                    fallback_ans = result_text
-                print(f"[LLMPredictor] Checker failed: {msg}. Retrying ({attempt+1}/5)...")
-                time.sleep(1)
-        print(f"[LLMPredictor] Checker failed after 5 attempts: {msg}, fallback to {fallback_ans}")
+            print(f"[LLMPredictor] Checker failed: {state['msg']}. Retrying ({attempt+1}/{self.max_attempts})...")
+            if state["replies"] == replies and attempt + 1 < self.max_attempts:
+                # 本轮一个回复都没有收到, 等一会再重试
+                time.sleep(RETRY_DELAY * (attempt + 1))
+        return self._fallback(state)
+
+    def _fallback(self, state: dict) -> str:
+        # 所有请求都失败时直接抛出, 不用假答案掩盖LLM服务的问题
+        if state["replies"] == 0:
+            raise RuntimeError(f"[LLMPredictor] Request failed after {self.max_attempts} attempts: {state['msg']}")
+        fallback_ans = state["fallback"]
+        print(f"[LLMPredictor] Checker failed after {self.max_attempts} attempts: {state['msg']}, fallback to {fallback_ans}")
         if fallback_ans is None:
             print("Noooo, we have to use the dummy answer")
-            input()
             label_pred = {
                 'best_atk_spd': ['Normal'], 
                 'weak': ['Fire', 'Ice', 'Poison'], 
@@ -117,7 +194,7 @@ class LLMPredictor(Predictor):
 class DummyPredictor(Predictor):
     def __init__(self, answer_dir):
         self.answer_dir = answer_dir  # 标准答案存放目录
-        self.labels = np.load(f"{self.answer_dir}/labels.npy", allow_pickle=True)
+        self.labels = GameDataset(self.answer_dir).labels
 
     def infer(self, prompt, **kargs) -> str:
         game_id = kargs.get('game_id')
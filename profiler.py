@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import glob
+import argparse
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+from game_recorder import record_files, iter_events
+
+# 决策耗时的统计与分析
+# Timers: 按名称累计代码段的次数和耗时, GameSession在每回合结束时写入record(文本一行 + timing事件)后清零
+#   段名: strategy_init(建立Geometry等), get_action, plan_dp, predict
+#   timing事件: {"round", "sections": {段名: [次数, 秒]}, "server"/"wait"/"decide"/"emit": 每条消息的耗时(秒)}
+#   未开启时用NULL_TIMERS, section返回同一个nullcontext
+# GameProfiler: 整局的cProfile或采样分析, 只分析处理消息的主线程
+#   cprofile 输出<prefix>.prof, 用python -m pstats或snakeviz查看
+#   sample   每隔interval秒取一次调用栈, 输出折叠栈<prefix>.folded, flamegraph.pl或speedscope可以直接读
+# summary: 汇总record目录中timing事件的决策耗时p50/p95/p99和各段耗时
+
+SECTIONS = ["strategy_init", "get_action", "plan_dp", "predict"]
+PROFILE_MODES = ["cprofile", "sample"]
+SAMPLE_INTERVAL = 0.005
+
+class Timers:
+    def __init__(self):
+        self.sections: dict[str, list] = {}  # 段名 -> [次数, 秒]
+
+    @contextmanager
+    def section(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.sections.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - t0
+
+    def reset(self):
+        self.sections = {}
+
+class NullTimers:
+    sections: dict[str, list] = {}
+    _null = nullcontext()
+
+    def section(self, name):
+        return self._null
+
+    def reset(self):
+        pass
+
+NULL_TIMERS = NullTimers()
+
+def format_sections(sections: dict) -> str:
+    order = [name for name in SECTIONS if name in sections] + sorted(set(sections) - set(SECTIONS))
+    return ", ".join(f"{name} {sections[name][0]}x {sections[name][1]:.3f}s" for name in order)
+
+class GameProfiler:
+    def __init__(self, mode, prefix, interval=SAMPLE_INTERVAL):
+        assert mode in PROFILE_MODES, f"unknown profile mode {mode}"
+        self.mode = mode
+        self.prefix = prefix
+        self.interval = interval
+        self.profile = None
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            target = threading.get_ident()
+            self.thread = threading.Thread(target=self._sample, args=(target,), daemon=True)
+            self.thread.start()
+
+    def _sample(self, target):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        # 返回输出文件路径
+        if self.mode == "cprofile":
+            self.profile.disable()
+            path = self.prefix + ".prof"
+            self.profile.dump_stats(path)
+        else:
+            self.stopped.set()
+            self.thread.join()
+            path = self.prefix + ".folded"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        return path
+
+def load_timing(record_dir) -> dict:
+    # 目录中所有timing事件合并: 每条消息的耗时数组, 各段的[次数, 秒], 局数和回合数
+    merged = {"server": [], "wait": [], "decide": [], "emit": []}
+    sections = {}
+    games, rounds = set(), 0
+    for game_id, path in record_files(record_dir):
+        for e in iter_events(path):
+            if e["type"] != "timing":
+                continue
+            games.add(game_id)
+            rounds += 1
+            for key in merged:
+                merged[key].extend(e.get(key, []))
+            for name, (count, seconds) in e.get("sections", {}).items():
+                entry = sections.setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+    timing = {key: np.array(values) for key, values in merged.items()}
+    timing.update(sections=sections, n_games=len(games), n_rounds=rounds)
+    return timing
+
+def percentiles_ms(values: np.ndarray) -> str:
+    if len(values) == 0:
+        return f"{'-':>8} {'-':>8} {'-':>8} {'-':>8}"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return f"{p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {values.max() * 1000:>8.2f}"
+
+def summarize(dirs: list[str]):
+    print(f"{'run_dir':<24} {'games':>5} {'rounds':>6} {'msgs':>7} {'':<7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    timings = []
+    for run_dir in dirs:
+        t = load_timing(run_dir)
+        timings.append((run_dir, t))
+        if t["n_rounds"] == 0:
+            print(f"{run_dir:<24} no timing events (run the client with --log_latency)")
+            continue
+        for i, key in enumerate(["decide", "server", "wait", "emit"]):
+            head = f"{run_dir:<24} {t['n_games']:>5} {t['n_rounds']:>6} {len(t[key]):>7}" if i == 0 else " " * 46
+            print(f"{head} {key:<7} {percentiles_ms(t[key])}")
+    for run_dir, t in timings:
+        if not t["sections"]:
+            continue
+        print(f"\n{run_dir}: sections")
+        print(f"{'section':<16} {'count':>8} {'total s':>9} {'mean ms':>9} {'per round s':>12}")
+        order = [name for name in SECTIONS if name in t["sections"]] + sorted(set(t["sections"]) - set(SECTIONS))
+        for name in order:
+            count, seconds = t["sections"][name]
+            print(f"{name:<16} {count:>8} {seconds:>9.2f} {seconds / count * 1000:>9.2f} {seconds / t['n_rounds']:>12.3f}")
+        decide = t["decide"].sum()
+        server = t["server"].sum()
+        print(f"decide total {decide:.2f}s, server total {server:.2f}s (plan_dp is counted inside get_action)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p_summary = subparsers.add_parser("summary", help="汇总record目录的决策耗时")
+    p_summary.add_argument("dirs", nargs="*", default=None, help="record目录, 不指定则为当前目录下所有record_*")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        dirs = args.dirs or sorted(d for d in glob.glob("record_*") if os.path.isdir(d))
+        summarize(dirs)
+
+# e.g. python client.py --action_mode auto --log_latency --profile sample
+#      python profiler.py summary record_1128_1723 record_1129_0910
+#      python -m pstats records/1128_1723_game_0.prof
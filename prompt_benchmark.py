@@ -0,0 +1,61 @@
+import time
+import argparse
+import numpy as np
+
+from predictor import LLMPredictor
+from finetune.prompt import generate_system_prompt, PROMPT_LAYOUTS
+from finetune.dataset import GameDataset
+
+# 比较不同prompt格式下第3轮的首token延迟(TTFT)
+# 每局先按对局顺序发送第1, 2轮的prompt, 再计时第3轮; stories_first格式下第3轮可以复用系统提示和Story 1, 2的前缀缓存
+# vLLM需开启 --enable-prefix-caching
+# 用max_tokens=1的请求耗时近似TTFT(只包含prefill和一个token的生成)
+
+def first_token_latency(predictor: LLMPredictor, prompt) -> float:
+    url = f"http://{predictor.host}:{predictor.port}/v1/chat/completions"
+    payload = {
+        "model": predictor.get_model_name(),
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 1,
+        "temperature": 0,
+    }
+    t0 = time.perf_counter()
+    resp = predictor.session.post(url, json=payload, timeout=predictor.timeout)
+    resp.raise_for_status()
+    return time.perf_counter() - t0
+
+def bench_layout(predictor: LLMPredictor, names, data, layout, n_games) -> np.ndarray:
+    ttft = []
+    for g in range(n_games):
+        stories = []
+        for j in range(3):
+            stories.append(data[g * 3 + j])
+            prompt = generate_system_prompt(names[g * 3 + j], stories, layout=layout)
+            latency = first_token_latency(predictor, prompt)
+            if j == 2:
+                ttft.append(latency)
+    return np.array(ttft)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", default="data/game/val", type=str, help="数据集目录(需要names和data列)")
+    parser.add_argument("--n_games", default=None, type=int, help="默认使用全部对局")
+    parser.add_argument("--port", default=8000, type=int)
+    args = parser.parse_args()
+
+    dataset = GameDataset(args.data_dir)
+    names = dataset.names
+    data = dataset.data
+    n_games = min(args.n_games or len(data) // 3, len(data) // 3)
+
+    predictor = LLMPredictor(port=args.port)
+    # 预热: 让系统prompt进入缓存, 避免第一种格式吃亏
+    first_token_latency(predictor, generate_system_prompt(names[0], [data[0]]))
+    for layout in PROMPT_LAYOUTS:
+        ttft = bench_layout(predictor, names, data, layout, n_games)
+        p50, p95 = np.percentile(ttft, [50, 95]) * 1000
+        print(f"{layout:>14}: round 3 TTFT mean {ttft.mean() * 1000:.1f}ms p50 {p50:.1f}ms p95 {p95:.1f}ms ({n_games} games)")
+
+# e.g. python prompt_benchmark.py --data_dir data/game/val
@@ -0,0 +1,185 @@
+import os
+import glob
+import json
+import sqlite3
+import argparse
+
+from game_recorder import EVENTS_SUFFIX, record_files, iter_events, parse_legacy_record
+
+# 所有record_*目录的SQLite索引
+# ingest只处理新增或变化(mtime/size)的文件, 之后的统计都是SQL查询
+# 同一局有多个记录文件时(client_r.py重试), 保留有结束分数的那个, 都有则保留较新的
+
+INDEX_PATH = "records.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, run_dir TEXT, game_id INTEGER, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS games (
+    run_dir TEXT, game_id INTEGER, path TEXT, score_pred REAL, score_game REAL, n_rounds INTEGER,
+    PRIMARY KEY (run_dir, game_id));
+CREATE TABLE IF NOT EXISTS rounds (
+    run_dir TEXT, game_id INTEGER, round INTEGER, enemy_name TEXT, coins INTEGER, used INTEGER, built INTEGER,
+    n_refresh INTEGER, n_buy INTEGER,
+    PRIMARY KEY (run_dir, game_id, round));
+CREATE TABLE IF NOT EXISTS stores (
+    run_dir TEXT, game_id INTEGER, round INTEGER, seq INTEGER, coins INTEGER, shop_size INTEGER);
+CREATE INDEX IF NOT EXISTS idx_stores ON stores(run_dir, game_id);
+CREATE TABLE IF NOT EXISTS predictions (
+    run_dir TEXT, game_id INTEGER, round INTEGER, label TEXT,
+    PRIMARY KEY (run_dir, game_id, round));
+"""
+
+def summarize_events(events) -> dict:
+    # 把一局的事件整理成各表的行
+    rounds = {}
+    stores = []
+    predictions = {}
+    score = (None, None)
+    current = None
+    for e in events:
+        kind = e["type"]
+        if kind == "round_start":
+            current = e.get("round")
+            rounds[current] = {"enemy_name": e.get("enemy_name"), "coins": e.get("coins"), "used": None, "built": None,
+                               "n_refresh": 0, "n_buy": 0}
+        elif current is None:
+            continue
+        elif kind == "store":
+            stores.append((current, len(stores), e.get("coins"), len(e["store"])))
+        elif kind == "action":
+            action = e["action"]
+            if action["type"] == "predict":
+                predictions[current] = json.dumps(action["label_pred"], ensure_ascii=False)
+            elif action["type"] == "refresh":
+                rounds[current]["n_refresh"] += 1
+            elif action["type"] == "buy":
+                rounds[current]["n_buy"] += 1
+        elif kind == "round_over":
+            rounds[current].update(used=e["used"], coins=e["coins"], built=e["built"])
+        elif kind == "end":
+            score = (e.get("score_pred"), e.get("score_game"))
+    return {"rounds": rounds, "stores": stores, "predictions": predictions, "score": score}
+
+class RecordIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def run_key(run_dir) -> str:
+        return os.path.normpath(run_dir)
+
+    def game_files(self, run_dir) -> list[tuple[int, str]]:
+        # 每局优先使用.events, 没有则解析.record文本
+        files = {}
+        for suffix in (".record", EVENTS_SUFFIX):
+            for game_id, path in record_files(run_dir, suffix=suffix):
+                files[path[:-len(suffix)]] = (game_id, path)
+        return sorted(files.values())
+
+    def ingest_dir(self, run_dir) -> int:
+        run = self.run_key(run_dir)
+        known = {path: (mtime, size) for path, mtime, size in
+                 self.conn.execute("SELECT path, mtime, size FROM files WHERE run_dir = ?", (run,))}
+        n_new = 0
+        with self.conn:
+            for game_id, path in self.game_files(run_dir):
+                stat = os.stat(path)
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    continue
+                events = iter_events(path) if path.endswith(EVENTS_SUFFIX) else parse_legacy_record(path)
+                self.add_game(run, game_id, path, summarize_events(events))
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                  (path, run, game_id, stat.st_mtime, stat.st_size))
+                n_new += 1
+        return n_new
+
+    def add_game(self, run, game_id, path, summary: dict):
+        row = self.conn.execute("SELECT path, score_game FROM games WHERE run_dir = ? AND game_id = ?", (run, game_id)).fetchone()
+        finished = summary["score"][1] is not None
+        if row is not None and row[0] != path:
+            old_finished = row[1] is not None
+            if old_finished and not finished or old_finished == finished and os.path.basename(path) < os.path.basename(row[0]):
+                return
+        key = (run, game_id)
+        for table in ("rounds", "stores", "predictions"):
+            self.conn.execute(f"DELETE FROM {table} WHERE run_dir = ? AND game_id = ?", key)
+        self.conn.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?)",
+                          (*key, path, *summary["score"], len(summary["rounds"])))
+        self.conn.executemany("INSERT OR REPLACE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              [(*key, r, v["enemy_name"], v["coins"], v["used"], v["built"], v["n_refresh"], v["n_buy"])
+                               for r, v in summary["rounds"].items()])
+        self.conn.executemany("INSERT INTO stores VALUES (?, ?, ?, ?, ?, ?)", [(*key, *s) for s in summary["stores"]])
+        self.conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                              [(*key, r, label) for r, label in summary["predictions"].items()])
+
+    def ingest(self, root=".", pattern="record_*") -> int:
+        total = 0
+        for run_dir in sorted(glob.glob(os.path.join(root, pattern))):
+            if os.path.isdir(run_dir):
+                n = self.ingest_dir(run_dir)
+                if n:
+                    print(f"{run_dir}: ingested {n} files")
+                total += n
+        return total
+
+    def query(self, sql, params=()) -> list[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def _where_run(self, run_dir):
+        if run_dir is None:
+            return "", ()
+        return " WHERE run_dir = ?", (self.run_key(run_dir),)
+
+    def round_money_builds(self, run_dir=None) -> list[tuple]:
+        # (run_dir, game_id, round, used, coins, built), 对应test.py的散点图
+        where, params = self._where_run(run_dir)
+        return self.query("SELECT run_dir, game_id, round, used, coins, built FROM rounds" + where +
+                          (" AND" if where else " WHERE") + " built IS NOT NULL ORDER BY run_dir, game_id, round", params)
+
+    def shop_sizes(self, run_dir=None) -> list[int]:
+        where, params = self._where_run(run_dir)
+        return [s for (s,) in self.query("SELECT shop_size FROM stores" + where, params)]
+
+    def predictions(self, run_dir) -> list[tuple[int, int, dict]]:
+        # (game_id, round, label), 按game_id, round排序
+        rows = self.query("SELECT game_id, round, label FROM predictions WHERE run_dir = ? ORDER BY game_id, round",
+                          (self.run_key(run_dir),))
+        return [(g, r, json.loads(label)) for g, r, label in rows]
+
+    def run_summary(self) -> list[tuple]:
+        return self.query("SELECT run_dir, COUNT(*), COUNT(score_game), AVG(score_pred), AVG(score_game) "
+                          "FROM games GROUP BY run_dir ORDER BY run_dir")
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=INDEX_PATH, type=str, help="索引文件路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p_ingest = subparsers.add_parser("ingest", help="增量建立索引")
+    p_ingest.add_argument("roots", nargs="*", default=["."], help="包含record_*目录的根目录")
+    subparsers.add_parser("runs", help="各目录汇总")
+    p_sql = subparsers.add_parser("sql", help="执行查询")
+    p_sql.add_argument("sql")
+    args = parser.parse_args()
+
+    index = RecordIndex(args.index)
+    if args.command == "ingest":
+        n = sum(index.ingest(root) for root in args.roots)
+        print(f"Ingested {n} new or changed files into {args.index}")
+    elif args.command == "runs":
+        print(f"{'run_dir':<24} {'games':>6} {'ended':>6} {'score_pred':>11} {'score_game':>11}")
+        for run, n, ended, pred, game in index.run_summary():
+            print(f"{run:<24} {n:>6} {ended:>6} {pred or 0:>11.2f} {game or 0:>11.2f}")
+    else:
+        for row in index.query(args.sql):
+            print(row)
+    index.close()
+
+# e.g. python record_index.py ingest
+#      python record_index.py runs
+#      python record_index.py sql "SELECT built, COUNT(*) FROM rounds GROUP BY built"
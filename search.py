@@ -0,0 +1,166 @@
+import os
+import json
+import math
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+import geometry_cache
+from batch_sim import Scenario, evaluate, grid_params, sample_params, scenario_arguments, scenario_kwargs
+from strategy import StrategyConfig
+
+# Strategy参数搜索: 每组参数(相对StrategyConfig默认值的覆盖项)分发到ProcessPoolExecutor
+# 每个进程在initializer中生成自己的Scenario(地图几何, 可选塔, 每一步的商店), 之后只收发参数和得分
+# 搜索方式:
+#   grid    网格中的全部组合, 在全部回合上评估
+#   random  从batch_sim.SEARCH_SPACE随机采样, 在全部回合上评估
+#   halving 逐级减半: 第一级用少量回合评估全部候选, 每级保留前1/eta, 回合数乘eta, 最后一级用全部回合
+# 默认参数在每一级都会评估, 作为配对比较的基准(所有参数共用同一个Scenario, 差值的方差远小于得分本身)
+# 每个结果评估完立即追加到checkpoint(jsonl), 用相同参数重新运行时跳过已有结果继续
+# 结束后打印排名表, 最优参数写入json, 可用client.py / async_client.py / simulator.py的--strategy_config加载
+
+CHECKPOINT_PATH = "search.jsonl"
+BEST_CONFIG_PATH = "best_config.json"
+
+_scenario = None
+
+def _init_worker(scenario: dict):
+    global _scenario
+    geometry_cache.CACHE_DIR = None
+    _scenario = Scenario(**scenario)
+
+def _evaluate(overrides: dict, n_rounds, score) -> tuple[list[float], float]:
+    t0 = time.perf_counter()
+    scores = evaluate(_scenario, StrategyConfig.from_dict(overrides), score, n_rounds)
+    return scores.tolist(), time.perf_counter() - t0
+
+def config_key(overrides: dict) -> str:
+    return json.dumps(overrides, sort_keys=True)
+
+class Checkpoint:
+    # 第一行是搜索设置, 之后每行一个结果 {"config", "n_rounds", "scores", "time"}
+    def __init__(self, path, header: dict):
+        self.path = path
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+            if lines and lines[0] != header:
+                raise ValueError(f"{path} was written with different settings {lines[0]}, use another --checkpoint")
+            for r in lines[1:]:
+                self.results[(config_key(r["config"]), r["n_rounds"])] = r
+            print(f"resumed {len(self.results)} results from {path}")
+        elif path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+
+    def get(self, overrides: dict, n_rounds):
+        return self.results.get((config_key(overrides), n_rounds))
+
+    def add(self, record: dict):
+        self.results[(config_key(record["config"]), record["n_rounds"])] = record
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+class SearchRunner:
+    def __init__(self, scenario: dict, score, workers, checkpoint: Checkpoint):
+        self.score = score
+        self.checkpoint = checkpoint
+        self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(scenario,))
+
+    def run(self, configs: list[dict], n_rounds) -> list[dict]:
+        # 返回与configs同序的结果, 已在checkpoint中的不再评估
+        pending = {config_key(c): c for c in configs if self.checkpoint.get(c, n_rounds) is None}
+        futures = {self.executor.submit(_evaluate, c, n_rounds, self.score): c for c in pending.values()}
+        for i, future in enumerate(as_completed(futures)):
+            scores, elapsed = future.result()
+            record = {"config": futures[future], "n_rounds": n_rounds, "scores": scores, "time": round(elapsed, 2)}
+            self.checkpoint.add(record)
+            print(f"[{n_rounds} rounds {i + 1}/{len(futures)}] {np.mean(scores):.2f} {elapsed:.1f}s {record['config'] or 'default'}")
+        return [self.checkpoint.get(c, n_rounds) for c in configs]
+
+    def close(self):
+        self.executor.shutdown()
+
+def with_default(configs: list[dict]) -> list[dict]:
+    # 去重, 默认参数放在第一个
+    unique = {config_key(c): c for c in [{}] + configs}
+    return list(unique.values())
+
+def halving_rungs(n_configs, n_rounds, eta, min_rounds) -> list[int]:
+    # 每级的回合数, 最后一级为n_rounds; 级数使最后一级还剩至少1个候选, 且第一级不少于min_rounds回合
+    n = 1 + int(math.log(max(n_configs, 1), eta) + 1e-9)
+    while n > 1 and n_rounds // eta ** (n - 1) < min_rounds:
+        n -= 1
+    return [n_rounds // eta ** (n - 1 - i) for i in range(n)]
+
+def successive_halving(runner: SearchRunner, configs: list[dict], rungs: list[int], eta) -> list[dict]:
+    alive = with_default(configs)[1:]
+    results = []
+    for i, n_rounds in enumerate(rungs):
+        results = runner.run([{}] + alive, n_rounds)
+        ranked = sorted(results[1:], key=lambda r: -np.mean(r["scores"]))
+        print(f"rung {i}: {len(alive)} configs x {n_rounds} rounds, best {np.mean(ranked[0]['scores']):.2f}"
+              f" (default {np.mean(results[0]['scores']):.2f})" if ranked else "")
+        if i < len(rungs) - 1:
+            alive = [r["config"] for r in ranked[:max(1, len(alive) // eta)]]
+    return results
+
+def print_ranking(results: list[dict], score, top=None):
+    # 与默认参数的配对差值, results中必须有默认参数且回合数相同
+    base = np.array(next(r for r in results if not r["config"])["scores"])
+    rows = []
+    for r in results:
+        scores = np.array(r["scores"])
+        diff = scores - base
+        rows.append((scores.mean(), diff.mean(), diff.std(ddof=1) / np.sqrt(len(diff)) if len(diff) > 1 else 0.0, r))
+    rows.sort(key=lambda x: -x[0])
+    print(f"{len(rows)} configs x {len(base)} rounds ({score} score, diff vs default)")
+    print(f"{'rank':>4} {'mean':>10} {'diff':>9} {'stderr':>8} {'time':>6}  params")
+    for rank, (mean, diff, stderr, r) in enumerate(rows[:top], 1):
+        print(f"{rank:>4} {mean:>10.2f} {diff:>+9.2f} {stderr:>8.2f} {r['time']:>5.1f}s  {r['config'] or 'default'}")
+    return [r for *_, r in rows]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    scenario_arguments(parser)
+    parser.add_argument("--mode", default="halving", choices=["grid", "random", "halving"])
+    parser.add_argument("--grid", nargs="*", default=[], help="网格, 例如 pre_refresh=0,3,6 expect_threshold=0.2,0.5")
+    parser.add_argument("--random", default=0, type=int, help="随机采样的参数组数")
+    parser.add_argument("--sample_seed", default=0, type=int, help="随机采样参数用的种子")
+    parser.add_argument("--eta", default=3, type=int, help="halving: 每级保留1/eta, 回合数乘eta")
+    parser.add_argument("--min_rounds", default=50, type=int, help="halving: 第一级的最少回合数")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, type=str, help="结果文件, 为空字符串则不保存")
+    parser.add_argument("--output", default=BEST_CONFIG_PATH, type=str, help="最优参数的json文件")
+    parser.add_argument("--top", default=20, type=int)
+    args = parser.parse_args()
+
+    configs = grid_params(args.grid) if args.grid else []
+    configs += sample_params(np.random.default_rng(args.sample_seed), args.random)
+    if not configs:
+        parser.error("nothing to search, use --grid and/or --random")
+
+    scenario = scenario_kwargs(args)
+    checkpoint = Checkpoint(args.checkpoint, {"scenario": scenario, "score": args.score})
+    runner = SearchRunner(scenario, args.score, args.workers, checkpoint)
+    t0 = time.perf_counter()
+    if args.mode == "halving":
+        rungs = halving_rungs(len(configs), args.n_rounds, args.eta, args.min_rounds)
+        print(f"halving: {len(configs)} configs, rounds per rung {rungs}")
+        results = successive_halving(runner, configs, rungs, args.eta)
+    else:
+        results = runner.run(with_default(configs), args.n_rounds)
+    runner.close()
+    print(f"search done in {time.perf_counter() - t0:.1f}s")
+
+    ranked = print_ranking(results, args.score, args.top)
+    best = StrategyConfig.from_dict(ranked[0]["config"])
+    best.save(args.output)
+    print(f"best config saved to {args.output}: {ranked[0]['config'] or 'default'}")
+
+# e.g. python search.py --random 81 --n_rounds 2000 --workers 8
+#      python search.py --mode grid --grid pre_refresh=0,3,6 expect_threshold=0.2,0.5 --checkpoint grid.jsonl
+#      python client.py --strategy_config best_config.json
@@ -0,0 +1,485 @@
+import os
+import json
+import time
+import argparse
+from functools import lru_cache
+from multiprocessing import Pool
+import numpy as np
+
+import geometry_cache
+from finetune.dataset import GameDataset, encode_label
+from game_recorder import GameRecorder, iter_record_dir
+from game_session import GameSession
+from predictor import Predictor
+from strategy import StrategyConfig, read_tower_stats
+
+# 本地对局模拟器, 不连接比赛服务器即可评估Strategy
+# 协议与服务器一致: begin -> response(start_round) -> predict -> response(towers_list, map, n_coins, store)
+#                  -> buy/refresh/end -> response(n_coins, store) ... -> 下一回合的start_round ... -> end(score_pred, score_game)
+# 两种用法:
+#   python simulator.py serve --port 18765     启动socket.io服务, client.py / async_client.py 用 --server_url 连接
+#   python simulator.py run --n_games 1000     进程内直接驱动GameSession, 不经过网络
+# 敌人(名字, 故事, hp, speed, weak/resist, 出现时间)来自enemy_data.json, 每回合的可选塔从tower_stats.csv中抽取
+# enemy_data.json中没有best_atk_spd/slow_eff/special_eff: 指定--label_dir时使用数据集标签, 否则按Normal/无处理
+# 伤害按时间步模拟: 敌人沿路径移动, 塔按interval开火, 攻速/克制/抗性/特效/减速规则与TowerTable.for_enemy一致
+# score_game = 各回合造成的伤害占敌人总血量的百分比的平均; score_pred = 各回合预测的逐属性Jaccard得分的平均
+
+ENEMY_DATA = "enemy_data.json"
+TOWER_STATS = "tower_stats.csv"
+ROUND_COINS = (100, 200)  # 每回合初始金币的范围(含两端)
+REFRESH_COST = 1
+SHOP_SIZE = 20
+TOWERS_PER_ROUND = 12
+DAMAGE_RANGE = (1, 30)  # 商店物品单发伤害的范围(含两端)
+COST_RANGE = (2, 20)
+MAX_ACTIONS = 1000  # 每回合动作数上限, 超过则强制结束回合
+MAP_SIZE = 50
+N_WAYPOINTS = (6, 10)
+N_OPTIONS = (20, 30)
+OPTION_DIST = (1.5, 8.0)  # 放置点到路径的距离范围
+HP_SCALE = 400  # enemy_data中每波敌人的总hp为100, 放大后才需要多座塔, 使不同策略的分数拉开
+DT = 0.1
+SLOW_DURATION = 0.5
+SPECIAL_EFF_RATE = 1.5
+NUM_DENSE_GAP = 0.5  # 同一波内平均出现间隔不超过该值记为Dense
+WAVE_GAP = 10.0  # 出现时间间隔超过该值视为下一波
+
+@lru_cache(maxsize=None)
+def load_enemy_data(path=ENEMY_DATA) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [entry["value"] for entry in sorted(entries, key=lambda e: e["index"])]
+
+@lru_cache(maxsize=None)
+def load_tower_stats(path=TOWER_STATS) -> list[dict]:
+    return read_tower_stats(path)
+
+@lru_cache(maxsize=None)
+def load_labels(label_dir):
+    return GameDataset(label_dir).labels
+
+@lru_cache(maxsize=None)
+def load_maps(map_dir) -> list[tuple[list, list]]:
+    # 从记录目录的map事件中读取真实地图, 相同地图只保留一份
+    maps = {}
+    for _, event in iter_record_dir(map_dir):
+        if event["type"] == "map":
+            maps[json.dumps([event["map"], event["placement_options"]])] = (event["map"], event["placement_options"])
+    return list(maps.values())
+
+def split_waves(spawn_times) -> list[np.ndarray]:
+    times = np.sort(np.asarray(spawn_times, dtype=np.float64))
+    if len(times) == 0:
+        return []
+    return np.split(times, np.flatnonzero(np.diff(times) > WAVE_GAP) + 1)
+
+def occurrence(spawn_times) -> str:
+    waves = split_waves(spawn_times)
+    n = len(waves[0]) if waves else 1
+    if n <= 3:
+        return ["Single", "Double", "Triple"][n - 1]
+    return "Dense" if np.diff(waves[0]).mean() <= NUM_DENSE_GAP else "Sparse"
+
+def derive_label(enemy: dict) -> dict:
+    return {
+        "best_atk_spd": ["Normal"],
+        "weak": list(enemy["weak"]),
+        "resist": list(enemy["resist"]),
+        "special_eff": [],
+        "slow_eff": ["Normal"],
+        "occurrence": [occurrence(enemy["spawnTimes"])],
+    }
+
+def random_map(rng: np.random.Generator):
+    # 从左到右的横竖折线路径, 放置点取距离路径OPTION_DIST范围内的整点
+    xs = np.sort(rng.choice(np.arange(4, MAP_SIZE - 4), int(rng.integers(*N_WAYPOINTS, endpoint=True)), replace=False))
+    y = int(rng.integers(4, MAP_SIZE - 4))
+    game_map = [[0, y]]
+    for x in xs:
+        game_map.append([int(x), y])
+        y = int(rng.integers(4, MAP_SIZE - 4))
+        game_map.append([int(x), y])
+    game_map.append([MAP_SIZE, y])
+
+    path = np.asarray(game_map, dtype=np.float64)
+    cum = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(path, axis=0).T))))
+    s = np.arange(0.0, cum[-1], 0.5)
+    samples = np.stack((np.interp(s, cum, path[:, 0]), np.interp(s, cum, path[:, 1])), axis=1)
+    grid = np.stack(np.meshgrid(np.arange(MAP_SIZE + 1), np.arange(MAP_SIZE + 1), indexing="ij"), axis=-1).reshape(-1, 2)
+    dist = np.sqrt(((grid[:, None, :] - samples[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+    candidates = grid[(dist >= OPTION_DIST[0]) & (dist <= OPTION_DIST[1])]
+    n_options = min(int(rng.integers(*N_OPTIONS, endpoint=True)), len(candidates))
+    options = candidates[np.sort(rng.choice(len(candidates), n_options, replace=False))]
+    return game_map, options.tolist()
+
+def draw_items(rng: np.random.Generator, n_types, size):
+    # 商店物品的(type, damage, cost), cost大致随damage增长
+    types = rng.integers(0, n_types, size)
+    damages = rng.integers(*DAMAGE_RANGE, endpoint=True, size=size)
+    costs = np.clip(np.rint(2 + damages * 0.5 + rng.normal(0, 2, size)), *COST_RANGE).astype(int)
+    return types, damages, costs
+
+def tower_effect(tower: dict, label: dict) -> tuple[float, float]:
+    # 塔对该敌人的单发伤害和减速系数
+    dmg = float(tower["damage"])
+    atk_spd = (label.get("best_atk_spd") or ["Normal"])[0]
+    if atk_spd == "Fast":
+        if tower["interval"] >= 0.30:
+            dmg /= 2
+        elif tower["interval"] <= 0.06:
+            dmg *= 1.5
+    elif atk_spd == "Slow":
+        if tower["interval"] <= 0.06:
+            dmg /= 1.5
+        elif tower["interval"] >= 0.30:
+            dmg *= 2
+    if tower["type"] in label.get("weak", []):
+        dmg *= 1.25
+    elif tower["type"] in label.get("resist", []):
+        dmg *= 0.8
+    if tower["type"] in label.get("special_eff", []):
+        dmg *= SPECIAL_EFF_RATE
+    slow = tower.get("speedDown", 1.0)
+    slow_eff = (label.get("slow_eff") or ["Normal"])[0]
+    if slow_eff == "Resist":
+        slow = 1.0
+    elif slow_eff == "Weak":
+        slow = slow ** 3
+    return dmg, slow
+
+def simulate_round(game_map, placement_options, placed, enemy: dict, label: dict, dt=DT) -> dict:
+    # placed[i]为放置点i上的塔(towers_list中的属性加上damage)或None
+    path = np.asarray(game_map, dtype=np.float64).reshape(-1, 2)
+    cum = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(path, axis=0).T))))
+    length = cum[-1]
+    spawn = np.sort(np.asarray(enemy["spawnTimes"], dtype=np.float64))
+    n = len(spawn)
+    hp = np.full(n, float(enemy["hp"]) * HP_SCALE)
+    result = {"n_enemies": n, "total_hp": float(hp.sum()), "damage": 0.0, "killed": 0, "leaked": n}
+    slots = [i for i, t in enumerate(placed) if t is not None]
+    if n == 0 or not slots or length <= 0:
+        return result
+
+    towers = [placed[i] for i in slots]
+    pos = np.asarray([placement_options[i] for i in slots], dtype=np.float64)
+    radius2 = np.array([t["range"] for t in towers], dtype=np.float64) ** 2
+    interval = np.array([t["interval"] for t in towers], dtype=np.float64)
+    shot, slow = map(np.array, zip(*[tower_effect(t, label) for t in towers]))
+    n_targets = np.array([n if t["n_targets"] == -1 else t["n_targets"] for t in towers])
+    splash = np.array([t.get("bullet_range") or 0.0 for t in towers], dtype=np.float64)
+    speed = float(enemy["speed"])
+
+    # state: 0未出现, 1在路上, 2被击杀, 3走完路径
+    state = np.zeros(n, dtype=np.int8)
+    s = np.zeros(n)
+    slow_until = np.full(n, -np.inf)
+    slow_factor = np.ones(n)
+    ranks = np.broadcast_to(np.arange(n), (len(towers), n))
+    t = 0.0
+    while (state < 2).any():
+        if not (state == 1).any():
+            # 跳过两波之间没有敌人的时间
+            t = max(t, spawn[state == 0].min())
+        state[(state == 0) & (spawn <= t)] = 1
+        active = state == 1
+        xy = np.stack((np.interp(s, cum, path[:, 0]), np.interp(s, cum, path[:, 1])), axis=1)
+        d2 = ((pos[:, None, :] - xy[None, :, :]) ** 2).sum(axis=2)
+        in_range = (d2 <= radius2[:, None]) & active
+        # 每座塔攻击射程内走得最远的n_targets个敌人, 有bullet_range的塔对主目标周围造成溅射
+        order = np.argsort(np.where(in_range, -s, np.inf), axis=1, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, ranks, axis=1)
+        hit = in_range & (rank < n_targets[:, None])
+        for k in np.flatnonzero((splash > 0) & in_range.any(axis=1)):
+            primary = xy[order[k, 0]]
+            hit[k] |= active & (((xy - primary) ** 2).sum(axis=1) <= splash[k] ** 2)
+        shots = np.floor((t + dt) / interval) - np.floor(t / interval)
+        dealt = np.minimum((shot * shots) @ hit, hp)
+        result["damage"] += float(dealt.sum())
+        hp -= dealt
+
+        factor = np.where(hit, slow[:, None], 1.0).min(axis=0)
+        slow_factor = np.where(slow_until > t, np.minimum(slow_factor, factor), factor)
+        slow_until = np.where(factor < 1.0, t + SLOW_DURATION, slow_until)
+        state[active & (hp <= 1e-9)] = 2
+        moving = state == 1
+        s[moving] += speed * slow_factor[moving] * dt
+        state[moving & (s >= length)] = 3
+        t += dt
+    result["killed"] = int((state == 2).sum())
+    result["leaked"] = int((state == 3).sum())
+    return result
+
+def prediction_score(label: dict, pred) -> float:
+    # 官方评分: 每个属性的交集/并集, 并集为空记100; 无法解析的预测记0
+    try:
+        pred_code = encode_label(pred)
+    except (ValueError, TypeError, AttributeError):
+        return 0.0
+    truth_code = encode_label(label)
+    from label_metrics import jaccard_scores
+    return float(jaccard_scores(np.array([truth_code], dtype=np.uint32), np.array([pred_code], dtype=np.uint32)).mean())
+
+class GameSimulator:
+    # 一局游戏的服务器端状态: begin/action返回要发给客户端的消息列表[(event, data)]
+    def __init__(self, game_id, seed=0, label_dir=None, map_dir=None):
+        self.game_id = game_id
+        entries = load_enemy_data()
+        entry = entries[game_id % len(entries)]
+        self.stories = entry["data"]
+        self.enemies = entry["labels"]
+        self.labels = load_labels(label_dir) if label_dir else None
+        self.rng = np.random.default_rng([seed, game_id])
+        maps = load_maps(map_dir) if map_dir else None
+        if maps:
+            self.game_map, self.options = maps[game_id % len(maps)]
+        else:
+            self.game_map, self.options = random_map(self.rng)
+        self.round = 0
+        self.rounds: list[dict] = []
+        self.done = False
+
+    def truth_label(self, j) -> dict:
+        idx = self.game_id * 3 + j
+        if self.labels is not None and idx < len(self.labels):
+            return self.labels[idx]
+        return derive_label(self.enemies[j])
+
+    def begin(self):
+        self.round = 0
+        self.rounds = []
+        self.done = False
+        return self.start_round()
+
+    def start_round(self):
+        self.round += 1
+        j = self.round - 1
+        self.coins = int(self.rng.integers(*ROUND_COINS, endpoint=True))
+        stats = load_tower_stats()
+        self.towers = [stats[i] for i in self.rng.choice(len(stats), TOWERS_PER_ROUND, replace=False)]
+        self.placed = [None] * len(self.options)
+        self.store = []
+        self.predicted = False
+        self.n_actions = 0
+        self.rounds.append({"coins": self.coins, "score_pred": 0.0, "used": 0, "built": 0})
+        return [("response", {"start_round": True, "i_round": self.round, "enemy_name": self.enemies[j]["name"],
+                              "enemy_description": self.stories[j], "n_coins": self.coins})]
+
+    def draw_store(self) -> list[dict]:
+        types, damages, costs = draw_items(self.rng, len(self.towers), SHOP_SIZE)
+        return [{"type": int(t), "damage": int(d), "cost": int(c)} for t, d, c in zip(types, damages, costs)]
+
+    def state(self) -> dict:
+        return {"n_coins": self.coins, "store": self.store}
+
+    def reject(self, error):
+        # 先报错, 再重发当前状态, 让客户端可以继续决策
+        return [("response", {"error": error}), ("response", self.state())]
+
+    def action(self, action: dict):
+        if self.done:
+            return [("response", {"error": "game is over"})]
+        kind = action.get("type")
+        if not self.predicted:
+            if kind != "predict":
+                return [("response", {"error": "predict the enemy first"})]
+            self.rounds[-1]["score_pred"] = prediction_score(self.truth_label(self.round - 1), action.get("label_pred"))
+            self.predicted = True
+            self.store = self.draw_store()
+            return [("response", {"towers_list": self.towers, "map": {"map": self.game_map, "extra": self.options}, **self.state()})]
+
+        self.n_actions += 1
+        if kind == "refresh":
+            if self.coins < REFRESH_COST:
+                return self.reject("not enough coins to refresh")
+            self.coins -= REFRESH_COST
+        elif kind == "buy":
+            error = self.buy(action.get("item_idx"), action.get("bag_idx"))
+            if error:
+                return self.reject(error) if self.n_actions < MAX_ACTIONS else self.finish_round()
+        elif kind != "end":
+            return self.reject(f"unknown action type: {kind}")
+        if kind == "end" or self.coins <= 0 or self.n_actions >= MAX_ACTIONS:
+            return self.finish_round()
+        self.store = self.draw_store()
+        return [("response", self.state())]
+
+    def buy(self, item_idx, bag_idx) -> str | None:
+        if not isinstance(item_idx, int) or not 0 <= item_idx < len(self.store):
+            return f"invalid item_idx: {item_idx}"
+        if not isinstance(bag_idx, int) or not 0 <= bag_idx < len(self.placed):
+            return f"invalid bag_idx: {bag_idx}"
+        if self.placed[bag_idx] is not None:
+            return f"position {bag_idx} is occupied"
+        item = self.store[item_idx]
+        if item["cost"] > self.coins:
+            return "not enough coins"
+        self.placed[bag_idx] = {**self.towers[item["type"]], "damage": item["damage"]}
+        self.coins -= item["cost"]
+        self.rounds[-1]["used"] += item["cost"]
+        self.rounds[-1]["built"] += 1
+        return None
+
+    def finish_round(self):
+        j = self.round - 1
+        outcome = simulate_round(self.game_map, self.options, self.placed, self.enemies[j], self.truth_label(j))
+        outcome["score_game"] = 100.0 * outcome["damage"] / outcome["total_hp"] if outcome["total_hp"] else 0.0
+        self.rounds[-1].update(outcome)
+        if self.round < len(self.enemies):
+            return self.start_round()
+        self.done = True
+        return [("end", {"score_pred": round(float(np.mean([r["score_pred"] for r in self.rounds])), 2),
+                         "score_game": round(float(np.mean([r["score_game"] for r in self.rounds])), 2)})]
+
+    def summary(self) -> dict:
+        return {"game_id": self.game_id, "done": self.done, "rounds": self.rounds}
+
+# ---- 进程内运行 ----
+class SimulatorPredictor(Predictor):
+    # 直接返回模拟器使用的真实标签, 只评估Strategy
+    def __init__(self, sim: GameSimulator):
+        self.sim = sim
+
+    def infer(self, prompt, **kargs) -> str:
+        return json.dumps(self.sim.truth_label(kargs.get("round_id") - 1), ensure_ascii=False)
+
+class NullRecorder:
+    # 与GameRecorder接口相同, 不写文件
+    def write(self, content, debug=False):
+        pass
+
+    def event(self, type, **data):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def play_game(game_id, seed=0, label_dir=None, map_dir=None, record_dir=None, strategy_config: StrategyConfig | None = None,
+              predictor: Predictor | None = None) -> dict:
+    sim = GameSimulator(game_id, seed=seed, label_dir=label_dir, map_dir=map_dir)
+    recorder = GameRecorder(game_id, record_dir) if record_dir else NullRecorder()
+    session = GameSession(game_id, predictor or SimulatorPredictor(sim), recorder, record_dir=record_dir or "records",
+                          strategy_config=strategy_config)
+    messages = sim.begin()
+    while messages:
+        kind, data = messages.pop(0)
+        if kind == "end":
+            session.on_end(data)
+            break
+        if "error" in data:
+            continue
+        action = session.on_response(data)
+        if action is not None:
+            session.after_emit()
+            messages.extend(sim.action(action))
+    recorder.close()
+    return sim.summary()
+
+def _play(args):
+    return play_game(*args)
+
+def run_games(game_ids, seed=0, label_dir=None, map_dir=None, record_dir=None, strategy_config=None, workers=1) -> list[dict]:
+    tasks = [(gid, seed, label_dir, map_dir, record_dir, strategy_config) for gid in game_ids]
+    if workers <= 1:
+        return [play_game(*task) for task in tasks]
+    with Pool(workers) as pool:
+        return list(pool.imap(_play, tasks, chunksize=4))
+
+def print_summary(results: list[dict], elapsed: float):
+    done = [r for r in results if r["done"]]
+    rounds = [x for r in done for x in r["rounds"]]
+    print(f"games: {len(results)} ({len(results) - len(done)} unfinished), {len(results) / elapsed:.2f} games/s")
+    if not rounds:
+        return
+    score_game = np.mean([[x["score_game"] for x in r["rounds"]] for r in done], axis=1)
+    print(f"score_game: mean {score_game.mean():.2f}, p10 {np.percentile(score_game, 10):.2f}, p90 {np.percentile(score_game, 90):.2f}")
+    print(f"score_pred: mean {np.mean([x['score_pred'] for x in rounds]):.2f}")
+    print(f"per round: built {np.mean([x['built'] for x in rounds]):.1f} towers, used {np.mean([x['used'] for x in rounds]):.1f} / "
+          f"{np.mean([x['coins'] for x in rounds]):.1f} coins, killed {np.sum([x['killed'] for x in rounds])} / "
+          f"{np.sum([x['n_enemies'] for x in rounds])} enemies")
+
+def write_results(path, results: list[dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("game_id,round,score_pred,score_game,coins,used,built,killed,leaked,n_enemies\n")
+        for r in results:
+            for i, x in enumerate(r["rounds"]):
+                if "score_game" in x:
+                    f.write(f"{r['game_id']},{i + 1},{x['score_pred']:.2f},{x['score_game']:.2f},{x['coins']},{x['used']},"
+                            f"{x['built']},{x['killed']},{x['leaked']},{x['n_enemies']}\n")
+
+# ---- socket.io服务 ----
+def serve(port, seed=0, label_dir=None, map_dir=None):
+    import socketio
+    from aiohttp import web
+
+    sio = socketio.AsyncServer(async_mode="aiohttp")
+    app = web.Application()
+    sio.attach(app)
+    games: dict[str, GameSimulator] = {}
+
+    async def send(sid, messages):
+        for event, data in messages:
+            await sio.emit(event, data, to=sid)
+
+    @sio.on("begin")
+    async def begin(sid, data):
+        sim = GameSimulator(int(data.get("game_id", 0)), seed=seed, label_dir=label_dir, map_dir=map_dir)
+        games[sid] = sim
+        await send(sid, sim.begin())
+
+    @sio.on("action")
+    async def action(sid, data):
+        sim = games.get(sid)
+        if sim is None:
+            await sio.emit("response", {"error": "send begin first"}, to=sid)
+            return
+        await send(sid, sim.action(data))
+        if sim.done:
+            scores = [(round(x["score_pred"], 1), round(x["score_game"], 1)) for x in sim.rounds]
+            print(f"game {sim.game_id} finished, (score_pred, score_game) per round: {scores}")
+
+    @sio.event
+    async def disconnect(sid, *args):
+        games.pop(sid, None)
+
+    print(f"Simulator listening on http://127.0.0.1:{port}")
+    web.run_app(app, port=port, print=None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", default=0, type=int, help="同一seed和game_id的对局完全相同")
+    parser.add_argument("--label_dir", default=None, type=str, help="标准答案文件夹, 提供enemy_data.json中没有的标签")
+    parser.add_argument("--map_dir", default=None, type=str, help="从record目录读取真实地图, 不指定则随机生成")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p_serve = subparsers.add_parser("serve", help="启动socket.io服务")
+    p_serve.add_argument("--port", default=18765, type=int)
+    p_run = subparsers.add_parser("run", help="进程内批量运行")
+    p_run.add_argument("--n_games", default=200, type=int)
+    p_run.add_argument("--start", default=0, type=int, help="第一局的game_id")
+    p_run.add_argument("--workers", default=os.cpu_count(), type=int)
+    p_run.add_argument("--record_dir", default=None, type=str, help="写入对局记录和score.csv, 不指定则不记录")
+    p_run.add_argument("--output", default=None, type=str, help="每回合结果写入该csv")
+    p_run.add_argument("--geometry_cache", default="", type=str, help="地图几何缓存目录, 默认只在内存中缓存")
+    p_run.add_argument("--strategy_config", default=None, type=str, help="Strategy参数的json文件, 不指定则用strategy.py中的默认值")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, seed=args.seed, label_dir=args.label_dir, map_dir=args.map_dir)
+    else:
+        geometry_cache.CACHE_DIR = args.geometry_cache or None
+        if args.record_dir:
+            os.makedirs(args.record_dir, exist_ok=True)
+        t0 = time.perf_counter()
+        results = run_games(range(args.start, args.start + args.n_games), seed=args.seed, label_dir=args.label_dir,
+                            map_dir=args.map_dir, record_dir=args.record_dir, workers=args.workers,
+                            strategy_config=StrategyConfig.load(args.strategy_config) if args.strategy_config else None)
+        print_summary(results, time.perf_counter() - t0)
+        if args.output:
+            write_results(args.output, results)
+
+# e.g. python simulator.py run --n_games 1000 --workers 16
+#      python simulator.py --label_dir data/game/val serve --port 18765
+#      python client.py --server_url http://127.0.0.1:18765 --game_id 3 --label_dir data/game/val
@@ -1,61 +1,248 @@
-from game_info import EnemyInfo, TowerInfo, GameInfo
+import csv
+import json
+from dataclasses import dataclass, asdict, fields
+from typing import NamedTuple
+from game_info import EnemyInfo, TowerInfo, GameInfo, ELEMENT_INDEX
 from math import sqrt
 from visualize import visualize_map_and_points
 import numpy as np
-import random
+import geometry_cache
+from profiler import NULL_TIMERS
 PRE_REFRESH = 3
 EXPECT_THRESHOLD = 0.3
 SEG_DIST = 0.3
+# 伤害增量保留的小数位数: 不同形状的矩阵乘法结果可能只差最后几位, 舍入后数学上相等的候选严格相等,
+# 平局总是取第一个, 与batch_sim的结果也完全一致
+CONTRIB_DECIMALS = 6
+MAX_RADIUS = 20
 SP_EFF_RATE = 1.54
 NUM_DENSE = 6
 PERCENTILE_THRESHOLD = 0.75
 DP_SAMPLE_NUM = 500
 DP_START_COINS = 60
+DP_SHOP_SIZE = 20
+DP_EXACT = True  # False时退回蒙特卡洛采样(每个金币数采样DP_SAMPLE_NUM次)
+DP_SEED = None
 # DEBUG_FILE = open('debug.log', 'w')
 
-# --- Point class for discrete map points ---
-class Point:
-    def __init__(self, x: float, y: float):
-        self.x = x
-        self.y = y
-        self.slow_rate = 1.0
-        self.has_special_eff = False
-        self.total_damage = 0.0
+# --- StrategyConfig: Strategy的可调参数, 默认值为上面的模块常量 ---
+# SEG_DIST和MAX_RADIUS决定地图几何(以及geometry_cache的key), 不在其中
+@dataclass(frozen=True)
+class StrategyConfig:
+    pre_refresh: int = PRE_REFRESH
+    expect_threshold: float = EXPECT_THRESHOLD
+    sp_eff_rate: float = SP_EFF_RATE
+    num_dense: int = NUM_DENSE
+    dp_start_coins: int = DP_START_COINS
+    dp_shop_size: int = DP_SHOP_SIZE
+    dp_exact: bool = DP_EXACT
+    dp_sample_num: int = DP_SAMPLE_NUM
+    dp_seed: int | None = DP_SEED
 
-    def __repr__(self):
-        return f"Point({self.x}, {self.y})"
+    @classmethod
+    def from_dict(cls, data: dict):
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"unknown strategy parameters: {sorted(unknown)}")
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+
+# --- TowerTable: 本局可选塔属性的只读数组表 ---
+# 由towers_list或tower_stats.csv建立, 之后不再修改(不会改写TowerInfo中的n_targets)
+# for_enemy对一个敌人一次算出逐塔的系数, 之后每个物品按塔下标O(1)查找
+class EnemyTowerParams(NamedTuple):
+    atk_factor: np.ndarray  # 单位伤害的等效atk: 攻速修正 * 克制修正 * 目标数 / interval
+    slow_rate: np.ndarray
+    is_special_eff: np.ndarray
+
+def _readonly(values, dtype=None) -> np.ndarray:
+    arr = np.array(values, dtype=dtype)
+    arr.flags.writeable = False
+    return arr
+
+def read_tower_stats(path="tower_stats.csv") -> list[dict]:
+    # 与服务器towers_list中的字段一致, 空的speedDown/bullet_range按1.0/0.0处理
+    towers = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            towers.append({
+                "range": int(row["range"]),
+                "interval": float(row["interval"]),
+                "type": row["type"],
+                "n_targets": int(row["n_targets"]),
+                "speedDown": float(row["speedDown"] or 1.0),
+                "bullet_range": float(row["bullet_range"] or 0.0),
+            })
+    return towers
+
+def enemy_key(enemy: EnemyInfo) -> tuple:
+    return (tuple(enemy.best_atk_spd), tuple(enemy.weak), tuple(enemy.resist),
+            tuple(enemy.special_eff), tuple(enemy.slow_eff), tuple(enemy.occurrence))
+
+def element_mask(elements) -> np.ndarray:
+    mask = np.zeros(len(ELEMENT_INDEX), dtype=bool)
+    mask[[ELEMENT_INDEX[e] for e in elements]] = True
+    return mask
+
+class TowerTable:
+    def __init__(self, towers: list[TowerInfo]):
+        self.element = _readonly([ELEMENT_INDEX[t.type] for t in towers], dtype=np.int64)
+        self.range = _readonly([t.range for t in towers])
+        self.interval = _readonly([t.interval for t in towers], dtype=np.float64)
+        self.n_targets = _readonly([t.n_targets for t in towers], dtype=np.int64)
+        self.speed_down = _readonly([t.speed_down for t in towers], dtype=np.float64)
+        self.bullet_range = _readonly([t.bullet_range for t in towers], dtype=np.float64)
+
+    @classmethod
+    def from_payloads(cls, towers: list[dict]):
+        return cls([TowerInfo.from_payload(t) for t in towers])
+
+    @classmethod
+    def from_csv(cls, path="tower_stats.csv"):
+        return cls.from_payloads(read_tower_stats(path))
+
+    def __len__(self):
+        return len(self.interval)
+
+    def for_enemy(self, enemy: EnemyInfo, num_dense) -> EnemyTowerParams:
+        # 缺失的标签按Normal/Single处理
+        atk_spd = (enemy.best_atk_spd or ['Normal'])[0]
+        slow_eff = (enemy.slow_eff or ['Normal'])[0]
+        occurrence = (enemy.occurrence or ['Single'])[0]
+
+        # best_atk_spd
+        quick, slow = self.interval <= 0.06, self.interval >= 0.30
+        if atk_spd == 'Fast':
+            factor = np.where(slow, 0.5, np.where(quick, 1.5, 1.0))
+        elif atk_spd == 'Normal':
+            factor = np.ones(len(self))
+        else:
+            factor = np.where(quick, 1 / 1.5, np.where(slow, 2.0, 1.0))
+
+        # type advantage
+        weak, resist = element_mask(enemy.weak)[self.element], element_mask(enemy.resist)[self.element]
+        factor *= np.where(weak, 1.25, np.where(resist, 0.8, 1.0))
+
+        # slow_eff
+        if slow_eff == 'Resist':
+            slow_rate = np.ones(len(self))  # immune to slow
+        elif slow_eff == 'Weak':
+            slow_rate = self.speed_down ** 3
+        else:
+            slow_rate = self.speed_down
+
+        # n_targets, -1(不限)按num_dense计; Dense时有溅射的塔也按num_dense计
+        n_targets = np.where(self.n_targets == -1, num_dense, self.n_targets)
+        if occurrence == 'Double':
+            mul = np.minimum(n_targets, 2)
+        elif occurrence == 'Triple':
+            mul = np.minimum(n_targets, 3)
+        elif occurrence == 'Dense':
+            mul = np.minimum(np.where(self.bullet_range > 0, num_dense, n_targets), num_dense)
+        elif occurrence == 'Sparse':
+            mul = np.minimum(n_targets, num_dense)
+        else: # Single
+            mul = np.minimum(n_targets, 1)
+        factor = factor * mul / self.interval
+
+        # special_eff
+        is_special_eff = element_mask(enemy.special_eff)[self.element]
+        return EnemyTowerParams(_readonly(factor), _readonly(slow_rate), _readonly(is_special_eff))
 
 # --- RangeCoverageTable: 预处理每个放置点和射程的路径点覆盖 ---
 class RangeCoverageTable:
-    def __init__(self, placement_options, points: list[Point], max_radius=20):
-        # contribs[pos_idx][radius] = list of point indices
+    def __init__(self, placement_options, points: np.ndarray, max_radius=20):
+        # dist2[pos_idx, pt_idx] = 放置点到路径点的距离平方
+        # order[pos_idx] = 按距离从近到远排序的路径点下标
+        # cutoffs[pos_idx, radius] = 射程radius内的路径点个数, 即order[pos_idx]的截断位置
         self.placement_options = placement_options
         self.max_radius = max_radius
-        self.contribs = [{} for _ in range(len(placement_options))]
-        for idx, pos in enumerate(placement_options):
-            px, py = pos
-            for r in range(0, max_radius + 1):
-                r2 = r * r
-                indices = [i for i, pt in enumerate(points) if (pt.x - px) ** 2 + (pt.y - py) ** 2 <= r2]
-                self.contribs[idx][r] = indices
+        pos = np.asarray(placement_options, dtype=np.float64).reshape(-1, 2)
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.dist2 = (pts[None, :, 0] - pos[:, None, 0]) ** 2 + (pts[None, :, 1] - pos[:, None, 1]) ** 2
+        self.order = np.argsort(self.dist2, axis=1, kind='stable')
+        radii2 = np.arange(max_radius + 1, dtype=np.float64) ** 2
+        self.cutoffs = (self.dist2[:, :, None] <= radii2[None, None, :]).sum(axis=1)
+        self.masks = {}
+
+    @classmethod
+    def from_arrays(cls, placement_options, dist2, order, cutoffs, max_radius=20):
+        # 从geometry_cache中的数组直接恢复, 跳过距离计算和排序
+        table = cls.__new__(cls)
+        table.placement_options = placement_options
+        table.max_radius = max_radius
+        table.dist2 = dist2
+        table.order = order
+        table.cutoffs = cutoffs
+        table.masks = {}
+        return table
 
     def get_coverage(self, pos_idx, radius):
+        # 返回覆盖点下标数组(按距离排序), 射程超出[0, max_radius]时为空
         r = int(radius)
-        return self.contribs[pos_idx].get(r, [])
-    
+        if r < 0 or r > self.max_radius:
+            return self.order[pos_idx, :0]
+        return self.order[pos_idx, :self.cutoffs[pos_idx, r]]
+
+    def get_mask(self, radius):
+        # 所有放置点在射程radius下的覆盖掩码, shape = (放置点数, 路径点数)
+        r = int(radius)
+        if r < 0 or r > self.max_radius:
+            return np.zeros(self.dist2.shape, dtype=bool)
+        if r not in self.masks:
+            self.masks[r] = self.dist2 <= float(r * r)
+        return self.masks[r]
+
 # --- Geometry class for computational geometry operations ---
 class Geometry:
-    def __init__(self, game_info: GameInfo):
+    def __init__(self, game_info: GameInfo, sp_eff_rate=SP_EFF_RATE):
         self.game_info = game_info
+        self.sp_eff_rate = sp_eff_rate
         self.map = game_info.map
-        self.points: list[Point] = []  # List[Point]
-        step = SEG_DIST
+        # 同一地图的采样点和覆盖表只计算一次, 见geometry_cache
+        key = geometry_cache.geometry_key(self.map, game_info.placement_options, SEG_DIST, MAX_RADIUS)
+        arrays = geometry_cache.load(key)
+        if arrays is None:
+            points = self.sample_path(self.map, SEG_DIST)
+            # 预处理每个placement_option和0-20所有整数射程的点贡献
+            table = RangeCoverageTable(game_info.placement_options, points, max_radius=MAX_RADIUS)
+            arrays = {'points': points, 'dist2': table.dist2, 'order': table.order.astype(np.int32), 'cutoffs': table.cutoffs.astype(np.int32)}
+            try:
+                geometry_cache.save(key, arrays)
+            except OSError as e:
+                # 只影响磁盘缓存, 内存中已经保存
+                print(f"[geometry_cache] Failed to save {key}: {e}")
+        self.range_table = RangeCoverageTable.from_arrays(game_info.placement_options, arrays['dist2'], arrays['order'], arrays['cutoffs'], max_radius=MAX_RADIUS)
+        # 路径点状态按列存储: points[i] = (x, y), 其余数组与points一一对应
+        self.points = arrays['points']
+        self.total_damage = np.zeros(len(self.points), dtype=np.float64)
+        self.slow_rate = np.ones(len(self.points), dtype=np.float64)
+        self.has_special_eff = np.zeros(len(self.points), dtype=bool)
+        # 棋盘版本号, 每次update_board加一
+        # changes[v] = 版本v -> v+1 时, 每个放置点到被修改路径点的最小距离平方
+        self.version = 0
+        self.changes: list[np.ndarray] = []
+        # visualize_map_and_points(self.map, self.points, 'saved_map_points.png')
+
+    @staticmethod
+    def sample_path(map_points, step):
+        # 沿地图折线每隔step取一个点(从step/2开始), 返回shape = (N, 2)
+        points = []  # List[(x, y)]
         total_len = 0.0
         segs = []
         # 预先计算每段长度和累积长度
-        for i in range(len(self.map) - 1):
-            p1 = self.map[i]
-            p2 = self.map[i + 1]
+        for i in range(len(map_points) - 1):
+            p1 = map_points[i]
+            p2 = map_points[i + 1]
             dx, dy = p2[0] - p1[0], p2[1] - p1[1]
             seg_len = sqrt(dx ** 2 + dy ** 2)
             segs.append((p1, p2, seg_len))
@@ -75,185 +262,305 @@ class Geometry:
             t = (pos - curr_seg_start) / seg_len
             x = p1[0] + t * (p2[0] - p1[0])
             y = p1[1] + t * (p2[1] - p1[1])
-            self.points.append(Point(x, y))
+            points.append((x, y))
             pos += step
         # 最后一段结尾不足step直接忽略  
-        # visualize_map_and_points(self.map, self.points, 'saved_map_points.png')
-        # 预处理每个placement_option和0-20所有整数射程的点贡献
-        self.range_table = RangeCoverageTable(game_info.placement_options, self.points, max_radius=20)
+        return np.array(points, dtype=np.float64).reshape(-1, 2)
 
     def sum_contribution_in_circle(self, pos_idx, radius, atk: float, slow_rate: float, is_special_eff: bool):
         # 计算某个放置点在某个射程下，覆盖的路径点贡献delta总和
-        def get_old_damage(pt: Point):
-            dmg = pt.total_damage
-            dmg /= pt.slow_rate
-            dmg *= SP_EFF_RATE if pt.has_special_eff else 1.0
-            return dmg
-        
-        def get_new_damage(pt: Point, atk: float, slow_rate: float, is_special_eff: bool):
-            dmg = pt.total_damage + atk
-            dmg /= min(slow_rate, pt.slow_rate)
-            dmg *= SP_EFF_RATE if (is_special_eff or pt.has_special_eff) else 1.0
-            return dmg
-        
-        # 获取覆盖点下标list
         indices = self.range_table.get_coverage(pos_idx, radius)
-        total_delta = 0.0
-        for i in indices:
-            pt = self.points[i]
-            old_dmg = get_old_damage(pt)
-            new_dmg = get_new_damage(pt, atk, slow_rate, is_special_eff)
-            delta = new_dmg - old_dmg
-            total_delta += delta
-
+        dmg = self.total_damage[indices]
+        pt_slow = self.slow_rate[indices]
+        pt_sp = self.has_special_eff[indices]
+        old_dmg = dmg / pt_slow * np.where(pt_sp, self.sp_eff_rate, 1.0)
+        new_dmg = (dmg + atk) / np.minimum(slow_rate, pt_slow) * np.where(pt_sp | is_special_eff, self.sp_eff_rate, 1.0)
+        total_delta = float((new_dmg - old_dmg).sum())
         return total_delta * SEG_DIST  # 乘以路径点间距作为近似积分
 
+    def batch_contribution(self, atks, ranges, slow_rates, is_special_effs, pos_indices=None):
+        # sum_contribution_in_circle的批量版本: 一次计算所有塔 × 所有放置点的贡献delta
+        # 返回shape = (塔数, 放置点数); 指定pos_indices时只计算这些放置点
+        atks = np.asarray(atks, dtype=np.float64).reshape(-1, 1)
+        slow_rates = np.asarray(slow_rates, dtype=np.float64).reshape(-1, 1)
+        is_special_effs = np.asarray(is_special_effs, dtype=bool).reshape(-1, 1)
+        ranges = np.array([int(r) for r in ranges], dtype=np.int64)
+        old_dmg = self.total_damage / self.slow_rate * np.where(self.has_special_eff, self.sp_eff_rate, 1.0)
+        new_dmg = (self.total_damage + atks) / np.minimum(slow_rates, self.slow_rate)
+        new_dmg *= np.where(is_special_effs | self.has_special_eff, self.sp_eff_rate, 1.0)
+        delta = new_dmg - old_dmg  # (塔数, 路径点数)
+        if pos_indices is None:
+            pos_indices = slice(None)
+        res = np.zeros((len(ranges), len(self.game_info.placement_options)), dtype=np.float64)[:, pos_indices]
+        # 相同射程的塔共用一个覆盖掩码, 用矩阵乘法对覆盖点求和
+        for r in np.unique(ranges):
+            sel = ranges == r
+            res[sel] = delta[sel] @ self.range_table.get_mask(r)[pos_indices].T
+        return np.round(res * SEG_DIST, CONTRIB_DECIMALS)  # 乘以路径点间距作为近似积分
+
     def update_board(self, pos_idx, atk, range, slow_rate, is_special_eff):
         # 更新某个放置点在某个射程下，覆盖的路径点的总伤害和状态
         indices = self.range_table.get_coverage(pos_idx, range)
-        for i in indices:
-            pt = self.points[i]
-            pt.total_damage += atk
-            pt.slow_rate = min(pt.slow_rate, slow_rate)
-            if is_special_eff:
-                pt.has_special_eff = True
+        self.total_damage[indices] += atk
+        self.slow_rate[indices] = np.minimum(self.slow_rate[indices], slow_rate)
+        if is_special_eff:
+            self.has_special_eff[indices] = True
+        if len(indices):
+            self.changes.append(self.range_table.dist2[:, indices].min(axis=1))
+        else:
+            self.changes.append(np.full(len(self.game_info.placement_options), np.inf))
+        self.version += 1
+
+    def changed_dist2(self, since_version):
+        # 从since_version到当前版本, 每个放置点到所有被修改路径点的最小距离平方
+        # 射程r的塔在放置点q的伤害只有在changed_dist2[q] <= r^2时才可能变化
+        if since_version >= self.version:
+            return np.full(len(self.game_info.placement_options), np.inf)
+        return np.min(self.changes[since_version:], axis=0)
+
+# --- HistoryDamageCache: 历史商店物品在当前棋盘上的伤害缓存 ---
+class HistoryDamageCache:
+    def __init__(self, geometry: Geometry):
+        # 相同(type, damage, cost)的物品共用一行
+        # rows[k, pos_idx] = 第k种物品放在pos_idx的期望伤害, 在棋盘版本row_version[k]时算出
+        # 已占用的放置点不做屏蔽, 由调用方处理
+        self.geometry = geometry
+        self.enemy_key = None
+        self.reset()
+
+    def reset(self):
+        self.index: dict[tuple, int] = {}
+        self.params: list[tuple] = []  # (atk, slow_rate, is_special_eff)
+        self.ranges = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros((0, len(self.geometry.game_info.placement_options)), dtype=np.float64)
+        self.row_version = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def signature(item: dict):
+        return (item['type'], item['damage'], item['cost'])
+
+    def check_enemy(self, enemy: EnemyInfo):
+        # 伤害依赖敌人属性, 属性变化时清空缓存并返回True
+        key = enemy_key(enemy)
+        if key == self.enemy_key:
+            return False
+        self.enemy_key = key
+        self.reset()
+        return True
+
+    def add(self, sigs: list[tuple], params: list[tuple], ranges: list):
+        # 在当前棋盘上计算新物品并加入缓存
+        atks, slow_rates, is_special_effs = zip(*params)
+        rows = self.geometry.batch_contribution(atks, ranges, slow_rates, is_special_effs)
+        for sig in sigs:
+            self.index[sig] = len(self.index)
+        self.params.extend(params)
+        self.ranges = np.concatenate((self.ranges, [int(r) for r in ranges]))
+        self.rows = np.vstack((self.rows, rows))
+        self.row_version = np.concatenate((self.row_version, np.full(len(sigs), self.geometry.version)))
+
+    def sync(self):
+        # 把所有行更新到当前棋盘版本, 只重算覆盖范围与被修改路径点相交的放置点
+        geo = self.geometry
+        for v in np.unique(self.row_version[self.row_version < geo.version]):
+            d2 = geo.changed_dist2(int(v))
+            rows = np.flatnonzero(self.row_version == v)
+            for r in np.unique(self.ranges[rows]):
+                sel = rows[self.ranges[rows] == r]
+                cols = np.flatnonzero(d2 <= float(r * r))
+                if len(cols) == 0:
+                    continue
+                atks, slow_rates, is_special_effs = zip(*[self.params[k] for k in sel])
+                self.rows[np.ix_(sel, cols)] = geo.batch_contribution(atks, [r] * len(sel), slow_rates, is_special_effs, cols)
+            self.row_version[rows] = geo.version
     
+# --- ShopPlanner: 低金币阶段"买/刷新"的期望得分DP ---
+class ShopPlanner:
+    def __init__(self, shop_size=DP_SHOP_SIZE, num_sample=None, seed=None):
+        # values[c] = 剩余c个金币时, 后续最优策略的期望得分
+        # num_sample为None时用次序统计量精确计算期望, 否则用可复现的随机采样
+        self.shop_size = shop_size
+        self.num_sample = num_sample
+        self.rng = np.random.default_rng(seed)
+        self.scores = np.zeros(0, dtype=np.float64)
+        self.prices = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.min_price = 9999
+        self.values = [0.0]
+
+    def set_items(self, items: list[tuple]):
+        # items: 候选物品(score, price)列表; 物品不变时保留已算出的values
+        scores = np.array([s for s, _ in items], dtype=np.float64)
+        prices = np.array([p for _, p in items], dtype=np.int64)
+        if np.array_equal(scores, self.scores) and np.array_equal(prices, self.prices):
+            return
+        if len(scores) != len(self.scores):
+            self.weights = self.order_weights(len(scores), self.shop_size)
+        self.scores = scores
+        self.prices = prices
+        self.min_price = int(prices.min()) if len(prices) else 9999
+        self.values = [0.0]
+
+    @staticmethod
+    def order_weights(n, k):
+        # 从n个物品中随机抽k个, 价值第i大的物品恰好是抽中物品里最大值的概率
+        # w[i] = C(n-1-i, k-1) / C(n, k), i从0开始
+        k = min(k, n)
+        if n == 0:
+            return np.zeros(0, dtype=np.float64)
+        i = np.arange(1, n, dtype=np.float64)
+        factors = np.clip((n - i - k + 1) / (n - i), 0.0, None)
+        return k / n * np.concatenate(([1.0], np.cumprod(factors)))
+
+    def value(self, c):
+        # dp(c), 按需从小到大补全values
+        while len(self.values) <= c:
+            self.values.append(self._solve(len(self.values)))
+        return self.values[c]
+
+    def _solve(self, c):
+        if c < self.min_price:
+            return 0.0
+        # 刷新(或什么都不买)的保底得分
+        base = max(self.values[c - 1] if c > 1 else 0.0, 0.0)
+        totals = np.full(len(self.scores), base)
+        afford = self.prices <= c
+        values = np.asarray(self.values)
+        totals[afford] = np.maximum(self.scores[afford] + values[c - self.prices[afford]], base)
+        if self.num_sample is None:
+            totals[::-1].sort()
+            return float(np.dot(self.weights, totals))
+        # 每行一次不放回抽样: 随机数矩阵每行最小的k个位置
+        k = min(self.shop_size, len(totals))
+        keys = self.rng.random((self.num_sample, len(totals)))
+        sampled = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        return float(totals[sampled].max(axis=1).mean())
+
 class Strategy:
-    def __init__(self, game_info: GameInfo):
+    def __init__(self, game_info: GameInfo, config: StrategyConfig | None = None, timers=NULL_TIMERS):
+        self.config = config or StrategyConfig()
+        self.timers = timers
         self.refresh_times = 0
         self.edamages = []
-        self.geometry = Geometry(game_info)
+        self.geometry = Geometry(game_info, self.config.sp_eff_rate)
         self.tot_cost = 0
         self.history_towers = []
         self.total_dmg = 0.0
         self.num_chosen = 0
-        self.need_recalc = True
-        self.buffer_dmgs = []
-
-    def get_edamages(self, atk, range, game: GameInfo, slow_rate: float, is_special_eff: bool):
-        res = []
-        for idx, t in enumerate(game.placed_towers):
-            if t:
-                res.append(0.0)
-                continue
-            sumv = self.geometry.sum_contribution_in_circle(idx, range, atk, slow_rate, is_special_eff)
-            res.append(sumv)
-        return res
+        self.history_rows = []  # history_towers[i]对应的缓存行
+        self.history_cache = HistoryDamageCache(self.geometry)
+        cfg = self.config
+        self.planner = ShopPlanner(cfg.dp_shop_size, None if cfg.dp_exact else cfg.dp_sample_num, cfg.dp_seed)
+        self.tower_table = TowerTable(game_info.towers)
+        self.enemy_key = None
+        self.enemy_params: EnemyTowerParams | None = None
 
-    def get_damage_for_tower(self, atk, tower, enemy, game):
-        # best_atk_spd
-        if enemy.best_atk_spd[0] == 'Fast':
-            if tower.attributes['interval'] >= 0.30:
-                atk /= 2
-            elif tower.attributes['interval'] <= 0.06:
-                atk *= 1.5
-        elif enemy.best_atk_spd[0] == 'Normal':
-            pass
-        else:
-            if tower.attributes['interval'] <= 0.06:
-                atk /= 1.5
-            elif tower.attributes['interval'] >= 0.30:
-                atk *= 2
+    def get_enemy_params(self, enemy: EnemyInfo) -> EnemyTowerParams:
+        # 敌人属性不变时复用逐塔系数
+        key = enemy_key(enemy)
+        if key != self.enemy_key:
+            self.enemy_key = key
+            self.enemy_params = self.tower_table.for_enemy(enemy, self.config.num_dense)
+        return self.enemy_params
 
-        # type advantage
-        if tower.attributes['type'] in enemy.weak:
-            atk *= 1.25
-        elif tower.attributes['type'] in enemy.resist:
-            atk *= 0.8
+    def get_tower_params(self, atk, tower_idx, enemy):
+        # 根据敌人属性修正塔的攻击力, 返回(atk, slow_rate, is_special_eff)
+        p = self.get_enemy_params(enemy)
+        return atk * float(p.atk_factor[tower_idx]), float(p.slow_rate[tower_idx]), bool(p.is_special_eff[tower_idx])
 
-        # slow_eff
-        slow_rate = tower.attributes.get('speedDown', 1.0)
-        if enemy.slow_eff[0] == 'Resist':
-            slow_rate = 1.0 # immune to slow
-        elif enemy.slow_eff[0] == 'Weak':
-            slow_rate = tower.attributes.get('speedDown', 1.0) ** 3 
+    def get_tower_range(self, tower_idx):
+        return self.tower_table.range[tower_idx].item()
 
-        
-        # n_targets
-        if tower.attributes['n_targets'] == -1:
-            tower.attributes['n_targets'] = NUM_DENSE
-        mul = tower.attributes['n_targets']
-        if enemy.occurrence[0] == 'Double':
-            mul = min(mul, 2)
-        elif enemy.occurrence[0] == 'Triple':
-            mul = min(mul, 3)
-        elif enemy.occurrence[0] == 'Dense':
-            if tower.attributes.get('bullet_range', 0):
-                tower.attributes['n_targets'] = NUM_DENSE
-                mul = NUM_DENSE
-            mul = min(mul, NUM_DENSE)
-        elif enemy.occurrence[0] == 'Sparse':
-            mul = min(mul, NUM_DENSE)
-        else: # Single
-            mul = min(mul, 1)
-        atk *= mul
-        atk /= tower.attributes['interval']
-        # atk *= 1 - (atk - 12) * 0.03 # cost penalty
-        
-        # special_eff
-        is_special_eff = tower.attributes['type'] in enemy.special_eff
+    def get_item_rows(self, items: list[dict], enemy: EnemyInfo, game: GameInfo):
+        # 返回items在history_cache中的行号, 未见过的物品在当前棋盘上计算后加入缓存
+        if self.history_cache.check_enemy(enemy) and self.history_rows:
+            # 缓存已清空, 历史物品需要重新加入
+            self.history_rows = self.lookup_rows(self.history_towers, enemy, game)
+        return self.lookup_rows(items, enemy, game)
+
+    def lookup_rows(self, items: list[dict], enemy: EnemyInfo, game: GameInfo):
+        cache = self.history_cache
+        cache.sync()
+        new_sigs, new_params, new_ranges = [], [], []
+        seen = set()
+        for t in items:
+            sig = cache.signature(t)
+            if sig in cache.index or sig in seen:
+                continue
+            seen.add(sig)
+            new_sigs.append(sig)
+            new_params.append(self.get_tower_params(t['damage'], t['type'], enemy))
+            new_ranges.append(self.get_tower_range(t['type']))
+        if new_sigs:
+            cache.add(new_sigs, new_params, new_ranges)
+        return [cache.index[cache.signature(t)] for t in items]
 
-        r = self.get_edamages(atk, tower.attributes['range'], game, slow_rate, is_special_eff)
-        return r, atk, slow_rate, is_special_eff
+    def get_damage_matrix(self, items: list[dict], enemy: EnemyInfo, game: GameInfo):
+        # 批量评估商店物品: 返回 (物品数 × 放置点数) 的期望伤害矩阵, 已占用的放置点为0
+        # 以及每个物品的(atk, slow_rate, is_special_eff)
+        return self.rows_to_matrix(self.get_item_rows(items, enemy, game), game)
+
+    def rows_to_matrix(self, rows: list[int], game: GameInfo):
+        dmgs = self.history_cache.rows[rows]
+        occupied = np.array([t is not None for t in game.placed_towers], dtype=bool)
+        dmgs[:, occupied] = 0.0
+        return dmgs, [self.history_cache.params[k] for k in rows]
 
     def get_action(self, enemy: EnemyInfo, game: GameInfo):
-        stores: list[int] = []
         max_edamage = 0
         maxid = -1
         maxpl = -1
         max_attr = {}
         shop = []
 
+        rows = self.get_item_rows(game.store, enemy, game)
+        self.history_rows.extend(rows)
+        dmgs, params = self.rows_to_matrix(rows, game)
+        best_pls = dmgs.argmax(axis=1) if dmgs.shape[1] else np.zeros(len(game.store), dtype=np.int64)
+        best_dmgs = dmgs.max(axis=1, initial=0.0)
         for i in range(len(game.store)):
-            tower_type = game.store[i]['type']
-            tower = game.towers[tower_type]
-            stores.append(i)
             self.history_towers.append(game.store[i])
-            atk = game.store[i]['damage']
-
-            r, atk, slow_rate, is_special_eff = self.get_damage_for_tower(atk, tower, enemy, game)
-            shop.append( (max(r), game.store[i]['cost']) )
-            self.buffer_dmgs.append(max(r))
-            # print("add to shop:", i, max(r), game.store[i]['cost'])
+            atk, slow_rate, is_special_eff = params[i]
+            dmg = float(best_dmgs[i])
+            shop.append( (dmg, game.store[i]['cost']) )
+            # print("add to shop:", i, dmg, game.store[i]['cost'])
 
-            if game.store[i]['cost'] <= game.coins and max(r) > max_edamage:
-                max_edamage = max(r)
+            if game.store[i]['cost'] <= game.coins and dmg > max_edamage:
+                max_edamage = dmg
                 maxid = i
-                maxpl = r.index(max(r))
-                max_attr = { 'atk': atk, 'range': tower.attributes['range'], 'slow_rate': slow_rate, 'is_special_eff': is_special_eff, 'cost': game.store[i]['cost']}
+                maxpl = int(best_pls[i])
+                max_attr = { 'atk': atk, 'range': self.get_tower_range(game.store[i]['type']), 'slow_rate': slow_rate, 'is_special_eff': is_special_eff, 'cost': game.store[i]['cost']}
         # print(f"Decided action: maxedamage={max_edamage}, maxid={maxid}, maxpl={maxpl}")
 
-        assert len(self.history_towers) == len(self.buffer_dmgs), "History towers and buffer damages length mismatch"
+        assert len(self.history_towers) == len(self.history_rows), "History towers and cached rows length mismatch"
         # 计算当前max_edamage的gain在history_gain中的百分位
         self.edamages.append(max_edamage)
         self.edamages.sort()
-        if maxid == -1 or self.refresh_times < PRE_REFRESH:
+        if maxid == -1 or self.refresh_times < self.config.pre_refresh:
             self.refresh_times += 1
             return 'refresh'
         
-        if game.coins < DP_START_COINS:
-            action, maxid, exp_score = self.plan_dp_action(enemy, game, shop, num_sample=DP_SAMPLE_NUM, num_chosen=self.num_chosen)
+        if game.coins < self.config.dp_start_coins:
+            with self.timers.section("plan_dp"):
+                action, maxid, exp_score = self.plan_dp_action(enemy, game, shop, num_chosen=self.num_chosen)
             # print(f"coins = {game.coins}, dp action = {action}, exp_score = {exp_score}")
             if action == 'refresh':
                 self.refresh_times += 1
                 return 'refresh'
             else:
-                # buy
-                atk = game.store[maxid]['damage']
-                tower = game.towers[game.store[maxid]['type']]
-                r, atk, slow_rate, is_special_eff = self.get_damage_for_tower(atk, tower, enemy, game)  
-                maxpl = r.index(max(r))
+                # buy (棋盘在本次决策中未变化, 直接复用伤害矩阵)
+                atk, slow_rate, is_special_eff = params[maxid]
+                maxpl = int(best_pls[maxid])
 
                 # update
-                self.geometry.update_board(maxpl, atk, tower.attributes['range'], slow_rate, is_special_eff)
+                self.geometry.update_board(maxpl, atk, self.get_tower_range(game.store[maxid]['type']), slow_rate, is_special_eff)
                 self.tot_cost += game.store[maxid]['cost']
-                self.total_dmg += max(r)
-                self.need_recalc = True
+                self.total_dmg += float(best_dmgs[maxid])
                 self.num_chosen += 1
-                # print("+", max(r))
+                # print("+", best_dmgs[maxid])
                 return f"buy {maxid} {maxpl}"
         else:
-            if max_edamage < self.edamages[-1] * EXPECT_THRESHOLD:
+            if max_edamage < self.edamages[-1] * self.config.expect_threshold:
                 self.edamages.pop(-1)
                 self.refresh_times += 1
                 return 'refresh'
@@ -262,21 +569,16 @@ class Strategy:
             self.geometry.update_board(maxpl, max_attr['atk'], max_attr['range'], max_attr['slow_rate'], max_attr['is_special_eff'])
             self.tot_cost += max_attr['cost']
             self.total_dmg += max_edamage
-            self.need_recalc = True
             self.num_chosen += 1
             return f"buy {maxid} {maxpl}"
 
     def get_history_dmgs(self, enemy: EnemyInfo, game: GameInfo):
-        if not self.need_recalc:
-            return self.buffer_dmgs, self.total_dmg
-        
-        ret = []
-        for t in self.history_towers:
-            atk = t['damage']
-            r, _, _, _= self.get_damage_for_tower(atk, game.towers[t['type']], enemy, game)
-            ret.append(max(r))
-        self.buffer_dmgs = ret
-        self.need_recalc = False
+        # 相同物品只算一次, 购买后只重算受影响的放置点
+        self.get_item_rows([], enemy, game)
+        cache = self.history_cache
+        occupied = np.array([t is not None for t in game.placed_towers], dtype=bool)
+        best = np.where(occupied, 0.0, cache.rows).max(axis=1, initial=0.0)
+        ret = best[self.history_rows].tolist()
         return ret, self.total_dmg
     
     def cal_gain(sekf, base_sum, delta):
@@ -294,35 +596,9 @@ class Strategy:
             gains.append(self.cal_gain(base_sum, delta))
         return gains
 
-    def dp_expected_score_action(self, coins, items:list[tuple], shop, num_sample=DP_SAMPLE_NUM):
-        min_price = min([c for _, c in items], default=9999)
-        memo = {}
-        def dp(c):
-            if c < min_price:
-                return 0
-            if c in memo:
-                return memo[c]
-            sample_maxes = []
-            for _ in range(num_sample):
-                # curr_shop_size = random.randint(16, 30)
-                curr_shop_size = 20
-                sampled_shop = random.sample(items, curr_shop_size)
-                local_max = 0
-                # 买
-                for score, price in sampled_shop:
-                    if price <= c:
-                        total = score + dp(c - price)
-                        if total > local_max:
-                            local_max = total
-                # 刷新
-                if c > 1:
-                    total = dp(c - 1)
-                    if total > local_max:
-                        local_max = total
-                sample_maxes.append(local_max)
-            avg_score = sum(sample_maxes) / num_sample if sample_maxes else 0
-            memo[c] = avg_score
-            return avg_score
+    def dp_expected_score_action(self, coins, items:list[tuple], shop):
+        self.planner.set_items(items)
+        dp = self.planner.value
         # 只对当前shop做决策
         best_score = -float('inf')
         best_idx = -1
@@ -334,9 +610,7 @@ class Strategy:
                     best_score = total
                     best_idx = idx
 
-        # print(memo)
         # print(f"Best buy idx={best_idx} with expected total score={best_score}")
-        # input()
         # 尝试刷新
         if coins > 1:
             total = dp(coins - 1)
@@ -344,7 +618,7 @@ class Strategy:
                 return 'refresh', -1, total
         return ('buy ', best_idx, best_score) if best_idx != -1 else ('refresh', -1, best_score)
 
-    def plan_dp_action(self, enemy: EnemyInfo, game: GameInfo, shop: list[tuple], num_sample=DP_SAMPLE_NUM, num_chosen=0):
+    def plan_dp_action(self, enemy: EnemyInfo, game: GameInfo, shop: list[tuple], num_chosen=0):
         # 1. 获取历史伤害和cost
         history_dmgs, _ = self.get_history_dmgs(enemy, game)
         costs = [t['cost'] for t in self.history_towers]
@@ -356,7 +630,7 @@ class Strategy:
         # 当前商店
         if coins < min([c for _, c in pairs], default=9999):
             return 'refresh', -1, 0
-        action = self.dp_expected_score_action(coins, pairs, shop, num_sample=num_sample)
+        action = self.dp_expected_score_action(coins, pairs, shop)
         # print("!!!", action)
         # print(sorted(shop))
         return action
\ No newline at end of file
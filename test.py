@@ -1,24 +1,20 @@
-import re
-import os
 import matplotlib.pyplot as plt
+from record_index import RecordIndex
 
-record_dir = "record_1128_1723"  # 你的文件夹路径
-pattern = re.compile(r"Round over\. Used money: (\d+) / (\d+), Build (\d+) towers\.")
+record_dir = "record_1128_1723"  # 你的文件夹路径, 设为None则统计索引中的全部目录
+
+index = RecordIndex()
+if record_dir is not None:
+    index.ingest_dir(record_dir)
+rows = index.round_money_builds(record_dir)
 
 totals = []
 builds = []
 
-for fname in os.listdir(record_dir):
-    if fname.endswith(".record"):
-        path = os.path.join(record_dir, fname)
-        with open(path, encoding="utf-8") as f:
-            for line in f:
-                m = pattern.search(line)
-                if m:
-                    used, total, build = m.groups()
-                    totals.append(int(total))
-                    builds.append(int(build))
-                    print(f"{fname}: used={used}, total={total}, build={build}")
+for run_dir, game_id, round_id, used, total, built in rows:
+    totals.append(total)
+    builds.append(built)
+    print(f"game {game_id}: used={used}, total={total}, build={built}")
 
 # 绘制散点图并保存为png文件
 if totals and builds:
@@ -1,22 +1,12 @@
-import re
-import os
 import matplotlib.pyplot as plt
+from record_index import RecordIndex
 
-record_dir = "record_1128_1745"  # 你的文件夹路径
-pattern = re.compile(r"shop size = (\d+)")
+record_dir = "record_1128_1745"  # 你的文件夹路径, 设为None则统计索引中的全部目录
 
-totals = []
-builds = []
-
-for fname in os.listdir(record_dir):
-    if fname.endswith(".record"):
-        path = os.path.join(record_dir, fname)
-        with open(path, encoding="utf-8") as f:
-            for line in f:
-                m = pattern.search(line)
-                if m:
-                    shop_size = m.groups()[0]
-                    totals.append(int(shop_size))
+index = RecordIndex()
+if record_dir is not None:
+    index.ingest_dir(record_dir)
+totals = index.shop_sizes(record_dir)
 
 print(totals)
 from collections import Counter
@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
 
 # map_points: List[Tuple[float, float]]
-# discrete_points: List[Point] (with .x, .y)
+# discrete_points: np.ndarray, shape = (N, 2)
 def visualize_map_and_points(map_points, discrete_points, save_path=None):
     plt.figure()
     # 画地图折线
@@ -10,8 +10,8 @@ def visualize_map_and_points(map_points, discrete_points, save_path=None):
     plt.plot(xs, ys, '-o', label='Map Polyline', markersize=1)
 
     # 画离散点
-    px = [p.x for p in discrete_points]
-    py = [p.y for p in discrete_points]
+    px = [p[0] for p in discrete_points]
+    py = [p[1] for p in discrete_points]
     plt.scatter(px, py, c='red', s=10, label='Discrete Points')
 
     plt.axis('equal')